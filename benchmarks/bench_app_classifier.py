@@ -0,0 +1,83 @@
+"""
+bench_app_classifier.py - Time feed-app flagging per row against per distinct app.
+
+Builds --rows raw app names drawn from --apps distinct names: the known
+feed and non-feed apps, their case and whitespace variants, variants
+such as "Instagram Lite" or "YouTube Shorts (beta)", aliases, and a long
+tail of other apps. Each --chunk-size chunk is flagged three ways: the
+old exact check (lowercase and strip every row, then isin(FEED_APPS)),
+the configured rules applied row by row, and flag_feed_apps with one
+AppClassifier shared across chunks. Exits with status 1 if the shared
+classifier's flags differ from the row-by-row rules.
+
+Usage:
+    python -m benchmarks.bench_app_classifier --rows 10000000
+"""
+
+import argparse
+import sys
+import time
+import logging
+import numpy as np
+import pandas as pd
+from etl.config import FEED_APPS
+from etl.etl_pipeline import AppClassifier, flag_feed_apps
+
+KNOWN_APPS = ['TikTok', 'Instagram', 'YouTube', 'YouTube Shorts', 'Facebook', 'Snapchat', 'Reddit', 'X',
+              'Pinterest', 'Threads', 'WhatsApp', 'Chrome', 'Gmail', 'Spotify', 'Maps', 'Netflix', 'Slack']
+VARIANTS = ['Instagram Lite', 'TikTok Lite', 'YouTube Shorts (beta)', 'Facebook Lite', 'Reddit (Beta)',
+            'YouTube Music', 'YouTube Kids', 'Facebook Messenger', 'IG', 'FB', 'YT', 'Twitter / X', 'Douyin']
+
+def make_app_names(rows, n_apps, seed=42):
+    """Raw app names, zipf-distributed over n_apps distinct spellings."""
+    rng = np.random.default_rng(seed)
+    names = KNOWN_APPS + [name.upper() for name in KNOWN_APPS] + [f" {name} " for name in KNOWN_APPS] + VARIANTS
+    names += [f"App {i}" for i in range(max(n_apps - len(names), 0))]
+    names = np.array(names[:n_apps], dtype=object)
+    return names[(rng.zipf(1.3, rows) - 1) % len(names)]
+
+def exact_rowwise(df):
+    """The previous check: string work on every row, exact matches only."""
+    return df['app_name'].str.lower().str.strip().isin(FEED_APPS).to_numpy()
+
+def rules_rowwise(df, classifier):
+    """The configured rules, applied to every row without a cache."""
+    return np.fromiter((classifier.classify(name) for name in df['app_name']), dtype=bool, count=len(df))
+
+def timed_chunks(chunks, fn):
+    start = time.perf_counter()
+    flags = np.concatenate([fn(chunk.copy()) for chunk in chunks])
+    return flags, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--apps', type=int, default=2_000, help="distinct raw app names")
+    parser.add_argument('--chunk-size', type=int, default=500_000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    
+    names = make_app_names(args.rows, args.apps, args.seed)
+    chunks = [pd.DataFrame({'app_name': names[i:i + args.chunk_size]}) for i in range(0, len(names), args.chunk_size)]
+    print(f"{args.rows:,} rows, {len(set(names)):,} distinct app names, {len(chunks)} chunks")
+    
+    reference = AppClassifier()
+    shared = AppClassifier()
+    exact, exact_seconds = timed_chunks(chunks, exact_rowwise)
+    expected, rules_seconds = timed_chunks(chunks, lambda df: rules_rowwise(df, reference))
+    flags, shared_seconds = timed_chunks(chunks, lambda df: flag_feed_apps(df, classifier=shared)['is_feed_app'].to_numpy())
+    
+    print(f"  exact per row (old)     {exact_seconds:7.2f}s")
+    print(f"  rules per row           {rules_seconds:7.2f}s")
+    print(f"  rules per distinct app  {shared_seconds:7.2f}s ({exact_seconds / shared_seconds:.1f}x vs old), "
+          f"{shared.classified:,} names classified")
+    missed = [name for name in VARIANTS if reference.classify(name) and name.lower() not in FEED_APPS]
+    print(f"  feed rows the exact check missed: {int((expected & ~exact).sum()):,} ({', '.join(missed[:4])}, ...)")
+    
+    identical = np.array_equal(flags, expected)
+    print(f"  shared classifier vs rules per row identical: {identical}")
+    sys.exit(0 if identical else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+bench_incremental_anomalies.py - Time incremental anomaly scoring against re-scoring every day.
+
+Fills mdi_daily of a throw-away schema with --days of synthetic scores,
+then adds --new-days one day per run, as a daily pipeline would, scoring
+each with detect_anomalies: incrementally with the configured baseline,
+and with the 'global' baseline that re-scores the whole history. A last
+run changes a day in the middle of the history, which resumes from that
+day's recorded baseline. The incrementally scored table and anomaly log
+are compared with a full replay; exits with status 1 if they differ.
+
+Usage:
+    python -m benchmarks.bench_incremental_anomalies --days 3650 --embedded
+"""
+
+import argparse
+import sys
+import time
+import logging
+import numpy as np
+from sqlalchemy import text
+from etl.config import ANOMALY_BASELINE, ANOMALY_WINDOW_DAYS
+from etl.detect_anomalies import BASELINE_METHODS, detect_anomalies
+from etl.testing import make_days, upsert_days, snapshot
+from benchmarks.bench_pipeline import bench_database
+
+def daily_runs(engine, df_new, method, window_days):
+    """Wall seconds of each detect_anomalies run after adding one day."""
+    seconds = []
+    for i in range(len(df_new)):
+        upsert_days(engine, df_new.iloc[i:i + 1])
+        start = time.perf_counter()
+        detect_anomalies(engine=engine, method=method, window_days=window_days)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=3650, help="days of history before the daily runs")
+    parser.add_argument('--new-days', type=int, default=30, help="daily runs, one new day each")
+    parser.add_argument('--method', choices=[m for m in BASELINE_METHODS if m != 'global'],
+                        default=ANOMALY_BASELINE if ANOMALY_BASELINE != 'global' else 'rolling')
+    parser.add_argument('--window-days', type=int, default=ANOMALY_WINDOW_DAYS)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--embedded', action='store_true', help="use an embedded PostgreSQL (pgserver)")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    
+    df = make_days(args.days + args.new_days, args.seed)
+    history, new_days = df.iloc[:args.days], df.iloc[args.days:]
+    
+    print(f"{args.days} days of history, {args.new_days} daily runs, "
+          f"{args.method} baseline ({args.window_days} days)")
+    results = {}
+    with bench_database(args.embedded) as engine:
+        for method in ['global', args.method]:
+            with engine.begin() as conn:
+                conn.execute(text("TRUNCATE mdi_daily, anomaly_log, anomaly_state"))
+            upsert_days(engine, history)
+            start = time.perf_counter()
+            detect_anomalies(engine=engine, method=method, window_days=args.window_days)
+            replay_seconds = time.perf_counter() - start
+            results[method] = (replay_seconds, daily_runs(engine, new_days, method, args.window_days))
+        
+        # A late correction to a day in the middle of the history
+        corrected = df.iloc[[args.days // 2]].assign(mdi_score=lambda d: d['mdi_score'] * 2)
+        upsert_days(engine, corrected)
+        start = time.perf_counter()
+        detect_anomalies(engine=engine, method=args.method, window_days=args.window_days)
+        resume_seconds = time.perf_counter() - start
+        incremental = snapshot(engine)
+        
+        detect_anomalies(engine=engine, method=args.method, window_days=args.window_days, full_rebuild=True)
+        replayed = snapshot(engine)
+    
+    for method, (replay_seconds, seconds) in results.items():
+        label = 'global (re-score all)' if method == 'global' else f"{method} (incremental)"
+        print(f"  {label:<24} first run {replay_seconds * 1000:8.1f} ms   "
+              f"daily run median {np.median(seconds) * 1000:7.1f} ms, max {max(seconds) * 1000:7.1f} ms")
+    print(f"  late change to {corrected['date_recorded'].iloc[0]}: resumed in {resume_seconds * 1000:.1f} ms")
+    
+    mismatched = int((~np.isclose(incremental[0], replayed[0], rtol=0, atol=1e-9, equal_nan=True)).sum())
+    logs_equal = incremental[1].equals(replayed[1])
+    print(f"  incremental vs full replay: {mismatched} differing values, anomaly log identical: {logs_equal}")
+    sys.exit(0 if mismatched == 0 and logs_equal else 1)
+
+if __name__ == '__main__':
+    main()
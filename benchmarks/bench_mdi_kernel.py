@@ -0,0 +1,66 @@
+"""
+bench_mdi_kernel.py - Cross-check the NumPy MDI kernel against SQL.
+
+Reads the loaded sessions once, computes daily and per-user MDI with
+etl.mdi_kernel, and compares every row with the SQL aggregation over
+sessions_hourly_rollup (the queries compute_mdi and compute_user_mdi run).
+Also times both paths and the kernel on a few extra grains. Exits with
+status 1 if any row differs.
+
+Usage:
+    python -m benchmarks.bench_mdi_kernel
+"""
+
+import argparse
+import sys
+import time
+import pandas as pd
+from sqlalchemy import create_engine, text
+from etl.config import DATABASE_URL
+from etl.calculate_mdi import AGGREGATION_QUERY, add_mdi_score
+from etl.calculate_user_mdi import USER_AGGREGATION_QUERY
+from etl.mdi_kernel import compute_mdi_frame, daily_mdi, user_daily_mdi, INPUT_COLUMNS
+from etl.testing import count_mismatches
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+    
+    engine = create_engine(DATABASE_URL)
+    with engine.connect() as conn:
+        sessions, read_seconds = timed(pd.read_sql, text(
+            f"SELECT user_id, app_name, session_date, session_weekday, {', '.join(INPUT_COLUMNS)} FROM sessions"
+        ), conn)
+        daily_sql, daily_sql_seconds = timed(
+            lambda: add_mdi_score(pd.read_sql(text(AGGREGATION_QUERY.format(where="")), conn)))
+        user_sql, user_sql_seconds = timed(
+            lambda: add_mdi_score(pd.read_sql(text(USER_AGGREGATION_QUERY.format(where="")), conn)))
+    engine.dispose()
+    
+    sessions['session_date'] = pd.to_datetime(sessions['session_date'])
+    daily, daily_seconds = timed(daily_mdi, sessions)
+    user, user_seconds = timed(user_daily_mdi, sessions)
+    
+    daily_mismatches = count_mismatches(daily, daily_sql, ['date_recorded'])
+    user_mismatches = count_mismatches(user, user_sql, ['user_id', 'date_recorded'])
+    
+    print(f"{len(sessions)} sessions (read in {read_seconds:.2f}s)")
+    print(f"  {'grain':<22} {'groups':>8} {'SQL':>10} {'kernel':>10}  mismatches")
+    print(f"  {'date':<22} {len(daily):>8} {daily_sql_seconds:9.3f}s {daily_seconds:9.3f}s  {daily_mismatches}")
+    print(f"  {'user, date':<22} {len(user):>8} {user_sql_seconds:9.3f}s {user_seconds:9.3f}s  {user_mismatches}")
+    
+    # Grains with no SQL counterpart, kernel only
+    week = sessions['session_date'].dt.to_period('W').rename('week')
+    for label, keys in [('app', ['app_name']), ('weekday', ['session_weekday']), ('user, week', ['user_id', week])]:
+        groups, seconds = timed(compute_mdi_frame, sessions, keys)
+        print(f"  {label:<22} {len(groups):>8} {'-':>10} {seconds:9.3f}s")
+    
+    sys.exit(1 if daily_mismatches or user_mismatches else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+bench_memory_footprint.py - Bytes per row of the transformed sessions frame.
+
+Runs the transform stages over a synthetic raw export and compares the
+compact schema transform_pipeline now emits (datetime64 dates, categorical
+app/category/weekday columns, int8 hours, int32 user ids) with the previous
+object-based one (datetime.date objects, Python strings, int64 hours).
+Rows are processed in chunks so 10M rows fit in a few GB; bytes add up
+across chunks, and a (user_id, session_date) groupby is timed on one chunk.
+
+Usage:
+    python -m benchmarks.bench_memory_footprint --rows 10000000
+"""
+
+import argparse
+import logging
+import time
+import numpy as np
+import pandas as pd
+from etl import etl_pipeline
+
+APPS = ['TikTok', 'Instagram', 'YouTube', 'WhatsApp', 'Chrome', 'Gmail', 'Spotify',
+        'Reddit', 'Snapchat', 'Facebook', 'Maps', 'Netflix', 'X', 'Pinterest', 'Slack']
+CATEGORIES = ['Social Media', 'Social Media', 'Entertainment', 'Communication', 'Utilities',
+              'Productivity', 'Entertainment', 'Social Media', 'Social Media', 'Social Media',
+              'Navigation', 'Entertainment', 'Social Media', 'Social Media', 'Productivity']
+
+def make_raw_chunk(rows, rng):
+    """Synthetic raw export rows in the Kaggle schema."""
+    dates = pd.date_range('2023-01-01', '2024-12-31').strftime('%Y-%m-%d').to_numpy()
+    app_idx = rng.zipf(1.6, rows) % len(APPS)
+    return pd.DataFrame({
+        'user_id': rng.integers(1, 200_000, rows),
+        'app_name': np.array(APPS, dtype=object)[app_idx],
+        'date': dates[rng.integers(0, len(dates), rows)],
+        'hour': rng.integers(0, 24, rows),
+        'screen_time_min': rng.gamma(2.0, 12.0, rows).round(1) + 0.1,
+        'category': np.array(CATEGORIES, dtype=object)[app_idx],
+    })
+
+def compact_transform(raw):
+    """The transform stages as transform_pipeline runs them."""
+    df = etl_pipeline.parse_and_validate_timestamps(raw)
+    df = etl_pipeline.flag_feed_apps(df)
+    df = etl_pipeline.flag_midnight_sessions(df)
+    df = etl_pipeline.clean_data(df)
+    return etl_pipeline.select_output_columns(df)
+
+def legacy_representation(df):
+    """The same rows in the previous object-based dtypes."""
+    return pd.DataFrame({
+        'user_id': df['user_id'].astype('int64'),
+        'app_name': df['app_name'].astype(str).astype(object),
+        'session_date': df['session_date'].dt.date,
+        'session_hour': df['session_hour'].astype('int64'),
+        'session_weekday': df['session_weekday'].astype(str).astype(object),
+        'duration_minutes': df['duration_minutes'],
+        'app_category': df['app_category'].astype(str).astype(object),
+        'is_feed_app': df['is_feed_app'],
+        'is_midnight': df['is_midnight'],
+    })
+
+def time_groupby(df):
+    start = time.perf_counter()
+    df.groupby(['user_id', 'session_date'], observed=True)['duration_minutes'].sum()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--chunk-size', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    
+    rng = np.random.default_rng(args.seed)
+    rows = compact_bytes = legacy_bytes = 0
+    compact_groupby = legacy_groupby = None
+    for start in range(0, args.rows, args.chunk_size):
+        compact = compact_transform(make_raw_chunk(min(args.chunk_size, args.rows - start), rng))
+        legacy = legacy_representation(compact)
+        rows += len(compact)
+        compact_bytes += compact.memory_usage(index=False, deep=True).sum()
+        legacy_bytes += legacy.memory_usage(index=False, deep=True).sum()
+        if compact_groupby is None:
+            compact_groupby, legacy_groupby = time_groupby(compact), time_groupby(legacy)
+        del compact, legacy
+    
+    print(f"{rows:,} transformed rows")
+    print(f"  object dtypes (before): {legacy_bytes / rows:7.1f} bytes/row  {legacy_bytes / 2**30:6.2f} GiB")
+    print(f"  compact dtypes (after): {compact_bytes / rows:7.1f} bytes/row  {compact_bytes / 2**30:6.2f} GiB")
+    print(f"  reduction: x{legacy_bytes / compact_bytes:.1f}")
+    print(f"  groupby(user_id, session_date) on one chunk: {legacy_groupby:.3f}s before, {compact_groupby:.3f}s after")
+
+if __name__ == '__main__':
+    main()
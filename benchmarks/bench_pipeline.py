@@ -0,0 +1,200 @@
+"""
+bench_pipeline.py - Time every pipeline stage at several scales.
+
+For each scale, generates (or reuses) a seeded synthetic export, then runs
+transform -> load -> MDI -> per-user MDI -> anomalies (daily and per user)
+against a throw-away schema, either in the PostgreSQL at DATABASE_URL or
+in an embedded server (--embedded, needs `pip install pgserver`). Stages
+are measured with etl.metrics (wall/CPU time, peak RSS so far, rows/sec).
+Results are appended to benchmarks/results/pipeline.jsonl with the git
+commit, and each stage is compared with the latest result recorded at
+another commit.
+
+Usage:
+    python -m benchmarks.bench_pipeline --scales 100k 1m
+    python -m benchmarks.bench_pipeline --scales 10m --embedded --chunk-size 1000000
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from etl.config import DATABASE_URL, PROJECT_ROOT
+from etl.columnar import write_sessions, iter_sessions
+from etl.etl_pipeline import transform_pipeline_chunked
+from etl.load_to_db import load_frames
+from etl.calculate_mdi import compute_mdi
+from etl.calculate_user_mdi import compute_user_mdi
+from etl.detect_anomalies import detect_anomalies
+from etl.series_anomalies import detect_user_anomalies
+from etl.metrics import measure
+from etl.schema import apply_migrations
+from etl.testing import SCALES, parse_rows, write_csv
+
+BENCH_DATA = PROJECT_ROOT / 'data' / 'bench'
+RESULTS_FILE = Path(__file__).parent / 'results' / 'pipeline.jsonl'
+
+STAGES = ['transform', 'load', 'mdi', 'user_mdi', 'anomalies', 'user_anomalies']
+
+def git_commit():
+    """Short HEAD commit, suffixed with '+dirty' when tracked files are modified."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=PROJECT_ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f"{commit}+dirty" if dirty else commit
+
+@contextmanager
+def bench_database(embedded=False, keep=False):
+    """Yield an engine whose connections use a fresh schema at the latest schema version."""
+    if embedded:
+        try:
+            import pgserver
+        except ImportError:
+            raise SystemExit("--embedded needs the pgserver package: pip install pgserver")
+        BENCH_DATA.mkdir(parents=True, exist_ok=True)
+        server = pgserver.get_server(BENCH_DATA / 'pgdata')
+        url = server.get_uri()
+    else:
+        url = DATABASE_URL
+    
+    schema = f"bench_{uuid.uuid4().hex[:8]}"
+    # search_path in the URL (not connect_args) so per-user MDI workers inherit it
+    engine = create_engine(make_url(url).update_query_dict({'options': f'-csearch_path={schema}'}))
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    apply_migrations(engine)
+    try:
+        yield engine
+    finally:
+        if not keep:
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        engine.dispose()
+
+def ensure_export(rows, seed):
+    """Path of the synthetic export for rows/seed, generated on first use (not timed)."""
+    path = BENCH_DATA / f"sessions_{rows}_seed{seed}.csv"
+    if not path.exists():
+        print(f"Generating {rows:,} synthetic rows into {path} ...")
+        write_csv(path, rows, seed=seed)
+    return path
+
+def run_stages(engine, csv_path, chunk_size, workers):
+    """Run every stage once, returning its metrics record by stage name."""
+    parquet_path = csv_path.with_suffix('.parquet')
+    records = {}
+    
+    with measure('transform', kind='stage') as record:
+        record['rows_out'] = write_sessions(transform_pipeline_chunked(csv_path, chunk_size), parquet_path)
+    records['transform'] = record
+    
+    with measure('load', kind='stage') as record:
+        record['rows_out'] = load_frames(iter_sessions(parquet_path, batch_size=chunk_size), engine=engine)['rows']
+    records['load'] = record
+    
+    with measure('mdi', kind='stage') as record:
+        record['rows_out'] = len(compute_mdi(full_rebuild=True, engine=engine))
+    records['mdi'] = record
+    
+    with measure('user_mdi', kind='stage') as record:
+        record['rows_out'] = compute_user_mdi(workers=workers, full_rebuild=True, engine=engine)['rows']
+    records['user_mdi'] = record
+    
+    with measure('anomalies', kind='stage') as record:
+        df_anomalies = detect_anomalies(engine=engine)
+        record['rows_out'] = 0 if df_anomalies is None else len(df_anomalies)
+    records['anomalies'] = record
+    
+    with measure('user_anomalies', kind='stage') as record:
+        df_anomalies = detect_user_anomalies(engine=engine)
+        record['rows_out'] = 0 if df_anomalies is None else len(df_anomalies)
+    records['user_anomalies'] = record
+    
+    parquet_path.unlink(missing_ok=True)
+    return records
+
+def load_results(path=RESULTS_FILE):
+    if not path.exists():
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def append_results(results, path=RESULTS_FILE):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        for result in results:
+            f.write(json.dumps(result) + '\n')
+
+def previous_result(history, commit, rows, stage):
+    """Latest recorded result for rows/stage from a different commit."""
+    for result in reversed(history):
+        if result['rows'] == rows and result['stage'] == stage and result['commit'] != commit:
+            return result
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='+', type=parse_rows, default=[SCALES['100k'], SCALES['1m']],
+                        help="row counts or " + ", ".join(SCALES))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=1_000_000, help="transform/load chunk rows")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="per-user MDI workers")
+    parser.add_argument('--embedded', action='store_true', help="use an embedded PostgreSQL (pgserver)")
+    parser.add_argument('--keep-schema', action='store_true', help="keep the benchmark schema for inspection")
+    parser.add_argument('--results', type=Path, default=RESULTS_FILE)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    
+    commit = git_commit()
+    history = load_results(args.results)
+    host = {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()}
+    recorded_at = datetime.now().isoformat(timespec='seconds')
+    
+    print(f"commit {commit}, {host['cpus']} CPUs, {'embedded' if args.embedded else 'local'} PostgreSQL")
+    print(f"  {'rows':>12} {'stage':<14} {'wall':>9} {'cpu':>9} {'rows/sec':>12} {'peak rss':>10}  vs previous")
+    for rows in args.scales:
+        csv_path = ensure_export(rows, args.seed)
+        with bench_database(args.embedded, args.keep_schema) as engine:
+            records = run_stages(engine, csv_path, args.chunk_size, args.workers)
+        
+        results = []
+        for stage in STAGES:
+            record = records[stage]
+            result = {
+                'commit': commit, 'recorded_at': recorded_at, 'rows': rows, 'seed': args.seed, 'stage': stage,
+                'wall_seconds': record['wall_seconds'],
+                'cpu_seconds': record['cpu_seconds'] + record['children_cpu_seconds'],
+                'peak_rss_mb': record['peak_rss_mb'], 'rows_out': record['rows_out'],
+                'rows_per_sec': record['rows_per_sec'], 'database': 'embedded' if args.embedded else 'local',
+                'host': host,
+            }
+            results.append(result)
+            
+            previous = previous_result(history, commit, rows, stage)
+            change = ""
+            if previous and previous['wall_seconds'] > 0:
+                delta = result['wall_seconds'] / previous['wall_seconds'] - 1
+                change = f"{delta:+.0%} wall vs {previous['commit']}"
+            rate = '-' if result['rows_per_sec'] is None else f"{result['rows_per_sec']:,.0f}"
+            rss = '-' if result['peak_rss_mb'] is None else f"{result['peak_rss_mb']:.0f} MB"
+            print(f"  {rows:>12,} {stage:<14} {result['wall_seconds']:8.2f}s {result['cpu_seconds']:8.2f}s "
+                  f"{rate:>12} {rss:>10}  {change}")
+        append_results(results, args.results)
+        history.extend(results)
+    
+    print(f"Results appended to {args.results}")
+
+if __name__ == '__main__':
+    main()
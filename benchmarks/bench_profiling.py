@@ -0,0 +1,106 @@
+"""
+bench_profiling.py - Accuracy and cost of the sketch-based data profile.
+
+Generates --rows synthetic sessions (etl.testing) for
+--users users and transforms them chunk by chunk, dealing the chunks
+round-robin to --workers simulated workers. Each worker profiles its
+chunks into a SessionProfile, which is serialised as a worker process
+would return it, and the profiles are merged. The merged summary is
+compared with exact statistics of all transformed sessions at once
+(nunique, np.quantile, histograms). Exits with status 1 if a counter or
+histogram differs, a distinct count is off by more than --max-distinct-error,
+or a duration quantile's rank is off by more than --max-rank-error.
+
+Usage:
+    python -m benchmarks.bench_profiling --rows 5000000 --users 500000 --workers 8
+"""
+
+import argparse
+import json
+import sys
+import time
+import logging
+import numpy as np
+import pandas as pd
+from etl.etl_pipeline import DateParser, transform_frame
+from etl.config import WEEKDAY_NAMES
+from etl.profiling import SessionProfile, DURATION_QUANTILES, merge_profiles
+from etl.testing import generate_chunks
+
+def exact_summary(df):
+    """The statistics a SessionProfile estimates, computed on the whole frame."""
+    return {
+        'rows': len(df),
+        'distinct_users': df['user_id'].nunique(),
+        'distinct_apps': df['app_name'].nunique(),
+        'quantiles': np.quantile(df['duration_minutes'], DURATION_QUANTILES),
+        'hours': np.bincount(df['session_hour'], minlength=24).tolist(),
+        'weekdays': df['session_weekday'].value_counts().reindex(WEEKDAY_NAMES, fill_value=0).tolist(),
+        'midnight_sessions': int(df['is_midnight'].sum()),
+        'feed_sessions': int(df['is_feed_app'].sum()),
+        'midnight_feed_sessions': int((df['is_midnight'] & df['is_feed_app']).sum()),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--users', type=int, default=200_000)
+    parser.add_argument('--workers', type=int, default=4, help="simulated workers whose profiles are merged")
+    parser.add_argument('--max-distinct-error', type=float, default=0.03, help="relative error of distinct counts")
+    parser.add_argument('--max-rank-error', type=float, default=0.005, help="rank error of duration quantiles")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    
+    profiles = [SessionProfile() for _ in range(args.workers)]
+    frames = []
+    transform_seconds = profile_seconds = 0.0
+    for i, raw in enumerate(generate_chunks(args.rows, seed=args.seed, users=args.users)):
+        start = time.perf_counter()
+        df = transform_frame(raw, parser=DateParser())
+        transformed = time.perf_counter()
+        profiles[i % args.workers].update(df)
+        profile_seconds += time.perf_counter() - transformed
+        transform_seconds += transformed - start
+        frames.append(df)
+    
+    start = time.perf_counter()
+    shipped = [json.dumps(profile.to_dict()) for profile in profiles]
+    merged = merge_profiles(SessionProfile.from_dict(json.loads(data)) for data in shipped)
+    summary = merged.summary()
+    merge_seconds = time.perf_counter() - start
+    
+    df = pd.concat(frames, ignore_index=True)
+    start = time.perf_counter()
+    exact = exact_summary(df)
+    exact_seconds = time.perf_counter() - start
+    
+    print(f"{len(df):,} transformed sessions of {exact['distinct_users']:,} users in {len(frames)} chunks, "
+          f"{args.workers} workers")
+    print(f"  transform                   {transform_seconds:7.2f}s")
+    print(f"  profile updates             {profile_seconds:7.2f}s ({profile_seconds / transform_seconds:.1%} of transform)")
+    print(f"  serialise + merge + summary {merge_seconds:7.2f}s "
+          f"({sum(len(data) for data in shipped) / args.workers / 1024:.0f} KiB per worker profile)")
+    print(f"  exact stats, whole frame    {exact_seconds:7.2f}s (needs every row in memory)")
+    
+    ok = True
+    for key in ['distinct_users', 'distinct_apps']:
+        error = abs(summary[key] - exact[key]) / exact[key]
+        ok &= error <= args.max_distinct_error
+        print(f"  {key}: {summary[key]:,} estimated, {exact[key]:,} exact ({error:.2%} error)")
+    durations = np.sort(df['duration_minutes'].to_numpy())
+    for q, expected in zip(DURATION_QUANTILES, exact['quantiles']):
+        estimate = summary['duration_minutes'][f"p{round(q * 100)}"]
+        rank_error = abs(np.searchsorted(durations, estimate, side='right') / len(durations) - q)
+        ok &= rank_error <= args.max_rank_error
+        print(f"  p{round(q * 100)} duration: {estimate} estimated, {expected:.2f} exact (rank error {rank_error:.4f})")
+    counters = ['rows', 'midnight_sessions', 'feed_sessions', 'midnight_feed_sessions']
+    exact_counts = all(summary[key] == exact[key] for key in counters) and summary['hours'] == exact['hours'] \
+        and list(summary['weekdays'].values()) == exact['weekdays']
+    ok &= exact_counts
+    print(f"  counters and hour/weekday histograms identical: {exact_counts}")
+    print(f"  within bounds: {ok}")
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+bench_series_anomalies.py - Time batched series scoring against a per-series loop.
+
+Builds synthetic per-user daily MDI (--users series over --days days, each
+user active on a random share of days) and scores every series against its
+weekday baseline (the series' other days), both mean/std and robust
+median/MAD: with a groupby-apply that scores one series at a time and labels anomalies row by row (the old
+detector's shape), and with etl.series_anomalies.score_series plus the
+column-wise flag_anomalies. Exits with status 1 if any z-score or baseline
+differs, or if the row-wise and column-wise labels of the same scores do.
+
+Usage:
+    python -m benchmarks.bench_series_anomalies --users 20000 --days 365
+"""
+
+import argparse
+import sys
+import time
+import warnings
+import logging
+import numpy as np
+import pandas as pd
+from etl.config import ANOMALY_MIN_DAYS, Z_SCORE_THRESHOLD
+from etl.detect_anomalies import flag_anomalies
+from etl.series_anomalies import MAD_SCALE, MEAN_AD_SCALE, score_series, series_keys
+
+def make_user_days(users, days, active_share=0.5, seed=42):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2024-01-01', periods=days)
+    user_ids = np.repeat(np.arange(users), days)
+    day_index = np.tile(np.arange(days), users)
+    active = rng.random(users * days) < active_share
+    df = pd.DataFrame({'user_id': user_ids[active], 'date_recorded': dates[day_index[active]]})
+    df['weekday'] = df['date_recorded'].dt.day_name()
+    df['date_recorded'] = df['date_recorded'].dt.date
+    df['mdi_score'] = rng.gamma(2.0, 3.0, len(df)).round(4)
+    return df
+
+def score_one_series(group, robust, min_days):
+    """Reference: one (user, weekday) series at a time, each day against the others (row i of others)."""
+    values = group['mdi_score'].to_numpy(dtype=np.float64)
+    others = np.where(np.eye(len(values), dtype=bool), np.nan, values)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # a one-day series has no others
+        if robust:
+            center = np.nanmedian(others, axis=1)
+            deviations = np.abs(others - np.median(values))
+            mad = np.nanmedian(deviations, axis=1)
+            scale = np.where(mad > 0, MAD_SCALE * mad, MEAN_AD_SCALE * np.nanmean(deviations, axis=1))
+        else:
+            center, scale = np.nanmean(others, axis=1), np.nanstd(others, axis=1, ddof=1)
+    days = len(values) - 1
+    z_scores = (values - center) / scale if days >= min_days else np.full(len(values), np.nan)
+    z_scores = np.where(scale > 0, z_scores, np.nan)
+    return group.assign(z_score=z_scores, baseline_mean=center, baseline_std=scale, baseline_days=days)
+
+def label_rowwise(df_scored):
+    """Reference: severity and message per row, as the single-series detector used to."""
+    df_anomalies = df_scored[df_scored['z_score'].abs() > Z_SCORE_THRESHOLD].copy()
+    df_anomalies['severity'] = df_anomalies['z_score'].apply(
+        lambda z: 'extreme' if abs(z) > 2.0 else 'moderate' if abs(z) > 1.5 else 'mild'
+    )
+    df_anomalies['message'] = df_anomalies.apply(
+        lambda row: f"Midnight doomscroll spike detected. MDI={row['mdi_score']:.2f}, z={row['z_score']:.2f} "
+                    f"(baseline {row['baseline_mean']:.2f} ± {row['baseline_std']:.2f} over {row['baseline_days']} days)",
+        axis=1
+    )
+    return df_anomalies
+
+def per_series(df, robust, min_days):
+    df_scored = df.groupby(['user_id', 'weekday'], group_keys=False).apply(score_one_series, robust, min_days)
+    df_scored = df_scored.sort_index()
+    return df_scored, label_rowwise(df_scored)
+
+def batched(df, robust, min_days):
+    df_scored = score_series(df, ['user_id'], 'weekday', robust, min_days)
+    return df_scored, flag_anomalies(df_scored, series_keys(df_scored, ['user_id']))
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--min-days', type=int, default=ANOMALY_MIN_DAYS)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    
+    df = make_user_days(args.users, args.days, seed=args.seed)
+    print(f"{len(df):,} user-days, {args.users:,} users x 7 weekday series")
+    
+    failures = 0
+    for robust in (False, True):
+        (expected, _), loop_seconds = timed(per_series, df, robust, args.min_days)
+        (scored, result), batch_seconds = timed(batched, df, robust, args.min_days)
+        # Labels are compared on the same scores: sums in another order can move a
+        # baseline by 1e-15 and flip its rounding to 2 decimals in the message
+        labelled = label_rowwise(scored)
+        scores_match = all(
+            np.allclose(expected[column].to_numpy(float), scored[column].to_numpy(float),
+                        rtol=0, atol=1e-9, equal_nan=True)
+            for column in ['z_score', 'baseline_mean', 'baseline_std']
+        )
+        labels_match = (labelled['severity'].tolist() == result['severity'].tolist()
+                        and labelled['message'].tolist() == result['message'].tolist())
+        identical = scores_match and labels_match
+        failures += not identical
+        label = 'median/MAD' if robust else 'mean/std'
+        print(f"  {label:<11} per-series apply {loop_seconds:8.2f}s   batched {batch_seconds:6.2f}s "
+              f"({loop_seconds / batch_seconds:5.0f}x)   {len(result):,} anomalies, identical: {identical}")
+    
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
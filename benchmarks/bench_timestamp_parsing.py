@@ -0,0 +1,62 @@
+"""
+bench_timestamp_parsing.py - Time DateParser against plain pd.to_datetime.
+
+Parses synthetic date columns (date-only, full timestamps, and a mix of
+iOS-style ISO timestamps and Android-style 12-hour dates) the way
+parse_and_validate_timestamps used to, with pd.to_datetime(errors='coerce'),
+and with etl.etl_pipeline.DateParser, whole and in chunks. Exits with
+status 1 if any parsed value or rejected-row count differs.
+
+Usage:
+    python -m benchmarks.bench_timestamp_parsing --rows 1m
+"""
+
+import argparse
+import sys
+import time
+import warnings
+import logging
+import pandas as pd
+from etl.etl_pipeline import DateParser
+from etl.testing import generate_chunks, mixed_dates, parse_rows
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def parse_chunked(dates, chunk_size):
+    parser = DateParser()
+    return pd.concat([parser.parse(dates.iloc[i:i + chunk_size]) for i in range(0, len(dates), chunk_size)])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=parse_rows, default='1m', help="rows per column (at most one 1M block)")
+    parser.add_argument('--chunk-size', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    # pandas warns when it falls back to per-element parsing
+    warnings.simplefilter('ignore', UserWarning)
+    
+    columns = {
+        'date-only': next(generate_chunks(args.rows, seed=args.seed, dirty_share=0.01))['date'],
+        'timestamps': next(generate_chunks(args.rows, seed=args.seed, timestamps=True, dirty_share=0.01))['date'],
+        'mixed iOS/Android': mixed_dates(args.rows, args.seed),
+    }
+    
+    failures = 0
+    print(f"  {'column':<20} {'distinct':>9} {'rejected':>9} {'to_datetime':>12} {'DateParser':>11} {'chunked':>9}  identical")
+    for name, dates in columns.items():
+        expected, baseline_seconds = timed(lambda d: pd.to_datetime(d, errors='coerce'), dates)
+        parsed, parser_seconds = timed(lambda d: DateParser().parse(d), dates)
+        chunked, chunked_seconds = timed(parse_chunked, dates, args.chunk_size)
+        identical = expected.equals(parsed) and expected.equals(chunked)
+        failures += not identical
+        print(f"  {name:<20} {dates.nunique():>9} {int(expected.isna().sum()):>9} {baseline_seconds:11.3f}s "
+              f"{parser_seconds:10.3f}s {chunked_seconds:8.3f}s  {identical}")
+    
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
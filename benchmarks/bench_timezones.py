@@ -0,0 +1,96 @@
+"""
+bench_timezones.py - Time per-user local-time conversion against pandas.
+
+Builds --rows second-resolution timestamps over 2010-2030 for --users
+users spread across timezones with DST changes on the hour, half hour
+and at midnight. Converts them from --source-timezone to each user's
+clock three ways: a per-row apply (timed on a sample and scaled up),
+one pandas tz_localize/tz_convert per timezone group, and
+etl.etl_pipeline.LocalClock, whose cached per-day offsets are timed on a
+first and a repeated chunk. Exits with status 1 if LocalClock's wall
+times differ from the per-group conversion.
+
+Usage:
+    python -m benchmarks.bench_timezones --rows 20000000
+"""
+
+import argparse
+import sys
+import time
+import logging
+import numpy as np
+import pandas as pd
+from etl.etl_pipeline import LocalClock
+
+ZONES = ['America/New_York', 'America/Los_Angeles', 'America/Sao_Paulo', 'America/Havana', 'Europe/London',
+         'Europe/Berlin', 'Asia/Kolkata', 'Asia/Kathmandu', 'Asia/Tokyo', 'Australia/Adelaide',
+         'Australia/Lord_Howe', 'Pacific/Chatham', 'Pacific/Auckland', 'UTC']
+
+def make_sessions(rows, users, seed=42):
+    rng = np.random.default_rng(seed)
+    start, end = pd.Timestamp('2010-01-01').value, pd.Timestamp('2030-01-01').value
+    timestamps = pd.Series(pd.to_datetime(rng.integers(start, end, rows)).floor('s'))
+    user_ids = pd.Series(rng.integers(1, users + 1, rows))
+    user_timezones = pd.Series(np.array(ZONES, dtype=object)[np.arange(1, users + 1) % len(ZONES)],
+                               index=np.arange(1, users + 1))
+    return timestamps, user_ids, user_timezones
+
+def localize_stamp(timestamp, zone, source):
+    """Reference for one row, as a per-row apply would do it."""
+    stamp = timestamp.tz_localize(source, ambiguous=False, nonexistent='shift_forward')
+    return stamp.tz_convert(zone).tz_localize(None)
+
+def per_row(timestamps, zones, source):
+    return pd.Series([localize_stamp(t, z, source) if z != source else t for t, z in zip(timestamps, zones)],
+                     index=timestamps.index)
+
+def per_group(timestamps, zones, source):
+    """One pandas conversion per timezone: the exact, uncached reference."""
+    local = timestamps.copy()
+    for zone, rows in zones.groupby(zones).groups.items():
+        if zone == source:
+            continue
+        group = timestamps.loc[rows]
+        utc = group.dt.tz_localize(source, ambiguous=np.zeros(len(group), dtype=bool), nonexistent='shift_forward')
+        local.loc[rows] = utc.dt.tz_convert(zone).dt.tz_localize(None)
+    return local
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--source-timezone', default='UTC')
+    parser.add_argument('--sample', type=int, default=20_000, help="rows the per-row apply is timed on")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    
+    timestamps, user_ids, user_timezones = make_sessions(args.rows, args.users, args.seed)
+    zones = user_ids.map(user_timezones)
+    print(f"{args.rows:,} sessions of {args.users:,} users in {len(ZONES)} timezones, "
+          f"export clock {args.source_timezone}")
+    
+    sample = slice(0, args.sample)
+    _, sample_seconds = timed(per_row, timestamps[sample], zones[sample], args.source_timezone)
+    row_seconds = sample_seconds * args.rows / min(args.sample, args.rows)
+    expected, group_seconds = timed(per_group, timestamps, zones, args.source_timezone)
+    clock = LocalClock(user_timezones, args.source_timezone)
+    local, first_seconds = timed(clock.localize, timestamps, user_ids)
+    _, cached_seconds = timed(clock.localize, timestamps, user_ids)
+    
+    print(f"  per-row apply (est.)    {row_seconds:8.2f}s")
+    print(f"  per-timezone pandas     {group_seconds:8.2f}s")
+    print(f"  LocalClock first chunk  {first_seconds:8.2f}s ({group_seconds / first_seconds:.1f}x)")
+    print(f"  LocalClock cached days  {cached_seconds:8.2f}s ({row_seconds / cached_seconds:.0f}x vs per row)")
+    
+    mismatched = int((local.to_numpy() != expected.to_numpy()).sum())
+    print(f"  LocalClock vs per-timezone pandas: {mismatched} differing wall times")
+    sys.exit(1 if mismatched else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+bench_user_mdi.py - Scaling of the parallel per-user MDI engine.
+
+Runs a full rebuild of mdi_user_daily with an increasing number of worker
+processes against the sessions already loaded, reports speed-up over one
+worker, and checks the table against the single-process reference query.
+The rebuild is an idempotent upsert, so existing rows end up unchanged.
+
+Usage:
+    python -m benchmarks.bench_user_mdi --workers 1 2 4 8
+"""
+
+import argparse
+from sqlalchemy import create_engine
+from etl.config import DATABASE_URL
+from etl.calculate_user_mdi import compute_user_mdi
+from etl.testing import check_against_reference
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--partitions', type=int, default=0, help="user_id range partitions (0 = 4 per worker)")
+    args = parser.parse_args()
+    
+    results = []
+    for workers in args.workers:
+        stats = compute_user_mdi(workers=workers, partitions=args.partitions, full_rebuild=True)
+        results.append(stats)
+    
+    engine = create_engine(DATABASE_URL)
+    mismatches, reference_rows = check_against_reference(engine)
+    engine.dispose()
+    
+    baseline = results[0]['seconds']
+    print(f"{results[0]['rows']} (user_id, date) rows")
+    for stats in results:
+        speedup = baseline / stats['seconds'] if stats['seconds'] > 0 else float('inf')
+        print(f"  workers={stats['workers']:<3} partitions={stats['partitions']:<4} "
+              f"{stats['seconds']:8.2f}s  speed-up x{speedup:.2f}")
+    print(f"  rows differing from single-process reference: {mismatches} of {reference_rows}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+bench_watch.py - Arrival-to-MDI latency of the micro-batch watcher.
+
+Appends synthetic sessions (etl.testing) to a JSONL
+stream at --rate rows per second for --seconds, while etl.watch tails
+it into a throw-away schema with --batch-rows/--batch-seconds batches.
+Reports per-batch latency (oldest row's arrival to its dates' MDI and
+anomaly scores committed) and where the time went. Then recomputes MDI
+and anomalies for every date from scratch; exits with status 1 if they
+differ from what the micro-batches left.
+
+Usage:
+    python -m benchmarks.bench_watch --rate 5000 --seconds 60 --embedded
+"""
+
+import argparse
+import asyncio
+import sys
+import tempfile
+import logging
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from sqlalchemy import text
+from etl.calculate_mdi import compute_mdi
+from etl.detect_anomalies import detect_anomalies
+from etl.metrics import configure
+from etl.watch import watch
+from benchmarks.bench_pipeline import bench_database
+from etl.testing import generate_chunks
+
+def snapshot(engine):
+    with engine.connect() as conn:
+        scores = pd.read_sql(text("SELECT date_recorded, mdi_score, z_score FROM mdi_daily ORDER BY date_recorded"), conn)
+        logged = pd.read_sql(text("""
+            SELECT date_of_anomaly, z_score FROM anomaly_log WHERE series_key = 'mdi_daily' ORDER BY date_of_anomaly
+        """), conn)
+    return scores, logged
+
+async def write_stream(path, rows, rate, seed, tick=0.1):
+    """Append synthetic sessions to path at rate rows/sec until rows are written; returns that count."""
+    sessions = pd.concat(generate_chunks(rows, seed=seed), ignore_index=True)
+    per_tick = max(1, int(rate * tick))
+    for start in range(0, len(sessions), per_tick):
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(sessions.iloc[start:start + per_tick].to_json(orient='records', lines=True))
+        await asyncio.sleep(tick)
+    return len(sessions)
+
+async def run(engine, path, args):
+    stop = asyncio.Event()
+    writer = asyncio.create_task(write_stream(path, int(args.rate * args.seconds), args.rate, args.seed))
+    watcher = asyncio.create_task(watch(
+        stream=path, engine=engine, state_path=path.with_suffix('.state.json'), batch_rows=args.batch_rows,
+        batch_seconds=args.batch_seconds, poll_seconds=args.poll_seconds, stop=stop,
+    ))
+    rows = await writer
+    # Let the last rows reach a batch before stopping
+    await asyncio.sleep(args.batch_seconds + 2 * args.poll_seconds)
+    stop.set()
+    return rows, await watcher
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=5_000, help="rows appended per second")
+    parser.add_argument('--seconds', type=float, default=30, help="how long rows are appended")
+    parser.add_argument('--batch-rows', type=int, default=20_000)
+    parser.add_argument('--batch-seconds', type=float, default=5)
+    parser.add_argument('--poll-seconds', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--embedded', action='store_true', help="use an embedded PostgreSQL (pgserver)")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    
+    with tempfile.TemporaryDirectory() as tmp, bench_database(args.embedded) as engine:
+        configure(metrics_file=str(Path(tmp) / 'metrics.jsonl'))
+        rows, records = asyncio.run(run(engine, Path(tmp) / 'sessions.jsonl', args))
+        streamed = snapshot(engine)
+        compute_mdi(full_rebuild=True, engine=engine)
+        detect_anomalies(engine=engine, full_rebuild=True)
+        rebuilt = snapshot(engine)
+    
+    print(f"{rows:,} rows appended at {args.rate:,.0f} rows/s; batches of {args.batch_rows:,} rows "
+          f"or {args.batch_seconds:g}s, polled every {args.poll_seconds:g}s")
+    if not records:
+        print("  no batches loaded")
+        sys.exit(1)
+    df = pd.DataFrame(records).fillna({'transform_seconds': 0, 'score_seconds': 0})
+    latency = df['latency_seconds']
+    print(f"  {len(df)} batches, {int(df['rows_in'].sum()):,} rows read, {int(df['rows_out'].sum()):,} loaded")
+    print(f"  latency p50 {latency.median():6.2f}s   p95 {np.percentile(latency, 95):6.2f}s   max {latency.max():6.2f}s")
+    print(f"  per batch (mean): queued {df['queue_seconds'].mean():.2f}s, transform {df['transform_seconds'].mean():.2f}s, "
+          f"load {df['load_seconds'].mean():.2f}s, MDI + anomalies {df['score_seconds'].mean():.2f}s")
+    
+    identical = all(a.equals(b) for a, b in zip(streamed, rebuilt)) and int(df['rows_in'].sum()) == rows
+    print(f"  micro-batched MDI and anomalies identical to a full rebuild: {identical}")
+    sys.exit(0 if identical else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Command-line entry point for the ETL package.
+
+Usage:
+    python -m etl run                       # every stage, skipping what's up to date
+    python -m etl run --stages mdi anomalies
+    python -m etl run --full-rebuild
+    python -m etl run --verbose --profile   # diagnostics + cProfile per stage
+    python -m etl migrate                   # apply new sql/ schema versions
+    python -m etl watch                     # load the landing directory in micro-batches
+    python -m etl watch --stream events.jsonl --batch-seconds 10
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+from .config import (
+    DATA_RAW, INGEST_PATTERN, INGEST_WORKERS, MDI_WORKERS, WATCH_DIRECTORY, WATCH_BATCH_ROWS, WATCH_BATCH_SECONDS,
+    WATCH_POLL_SECONDS, WATCH_QUEUE_FRAMES
+)
+from .metrics import configure
+from .pipeline import STAGES, run_pipeline
+from .schema import apply_migrations
+from .watch import watch
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m etl', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    run = commands.add_parser('run', help="run the pipeline stages in one process")
+    run.add_argument('--stages', nargs='+', choices=list(STAGES), help="stages to run (default: all)")
+    run.add_argument('--full-rebuild', action='store_true',
+                     help="recompute MDI for every date and re-score anomalies")
+    run.add_argument('--directory', default=str(DATA_RAW), help="directory of raw CSV exports")
+    run.add_argument('--pattern', default=INGEST_PATTERN, help="file glob within the directory")
+    run.add_argument('--workers', type=int, default=INGEST_WORKERS, help="transform worker processes")
+    run.add_argument('--mdi-workers', type=int, default=MDI_WORKERS, help="per-user MDI worker processes")
+    run.add_argument('--verbose', action='store_true', help="log costly diagnostic summaries")
+    run.add_argument('--profile', action='store_true', help="capture cProfile stats per stage (implies --verbose)")
+    run.add_argument('--data-profile', action='store_true',
+                     help="save a data profile of the transformed sessions and log its drift")
+    run.add_argument('--metrics-file', help="JSONL file for run metrics (default: ETL_METRICS_FILE)")
+    
+    migrate = commands.add_parser('migrate', help="apply new or changed sql/ schema versions")
+    migrate.add_argument('--force', action='store_true', help="re-apply every version, changed or not")
+    
+    watch_cmd = commands.add_parser('watch', help="load new sessions in micro-batches as they arrive")
+    source = watch_cmd.add_mutually_exclusive_group()
+    source.add_argument('--directory', default=str(WATCH_DIRECTORY), help="landing directory of CSV/JSONL files")
+    source.add_argument('--stream', help="JSONL file to tail instead of a directory")
+    watch_cmd.add_argument('--batch-rows', type=int, default=WATCH_BATCH_ROWS, help="rows that close a batch")
+    watch_cmd.add_argument('--batch-seconds', type=float, default=WATCH_BATCH_SECONDS,
+                           help="age of a batch's oldest row that closes it")
+    watch_cmd.add_argument('--poll-seconds', type=float, default=WATCH_POLL_SECONDS, help="polling interval")
+    watch_cmd.add_argument('--queue-frames', type=int, default=WATCH_QUEUE_FRAMES,
+                           help="raw frames read ahead of the loader")
+    watch_cmd.add_argument('--once', action='store_true', help="load what is there now, then exit")
+    watch_cmd.add_argument('--data-profile', action='store_true',
+                           help="save a data profile of the loaded sessions when the watch stops")
+    watch_cmd.add_argument('--metrics-file', help="JSONL file for batch metrics (default: ETL_METRICS_FILE)")
+    args = parser.parse_args(argv)
+    
+    if args.command == 'migrate':
+        apply_migrations(force=args.force)
+    elif args.command == 'watch':
+        configure(metrics_file=args.metrics_file, data_profile=args.data_profile or None)
+        try:
+            asyncio.run(watch(directory=Path(args.directory), stream=args.stream, batch_rows=args.batch_rows,
+                              batch_seconds=args.batch_seconds, poll_seconds=args.poll_seconds,
+                              queue_frames=args.queue_frames, once=args.once))
+        except KeyboardInterrupt:
+            # Platforms without signal handlers in the event loop (Windows) stop here
+            pass
+    elif args.command == 'run':
+        configure(verbose=args.verbose or None, profile=args.profile or None, metrics_file=args.metrics_file,
+                  data_profile=args.data_profile or None)
+        summary = run_pipeline(stages=args.stages, full_rebuild=args.full_rebuild, directory=Path(args.directory),
+                               pattern=args.pattern, workers=args.workers, mdi_workers=args.mdi_workers)
+        print(f"  {'stage':<10} {'status':<8} {'wall':>9} {'cpu':>9} {'rows':>10} {'rows/sec':>12} {'peak rss':>10}")
+        for name, record in summary.items():
+            status = 'skipped' if record['skipped'] else 'ran'
+            rows = '-' if record['rows_out'] is None else record['rows_out']
+            rate = '-' if record['rows_per_sec'] is None else f"{record['rows_per_sec']:,.0f}"
+            rss = '-' if record['peak_rss_mb'] is None else f"{record['peak_rss_mb']:.0f} MB"
+            cpu = record['cpu_seconds'] + record['children_cpu_seconds']
+            print(f"  {name:<10} {status:<8} {record['wall_seconds']:8.2f}s {cpu:8.2f}s "
+                  f"{rows:>10} {rate:>12} {rss:>10}")
+
+if __name__ == '__main__':
+    main()
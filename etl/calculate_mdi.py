@@ -2,10 +2,15 @@
 calculate_mdi.py - Compute daily MDI scores and store in mdi_daily table.
 """
 
+import argparse
 import pandas as pd
 import logging
 from sqlalchemy import create_engine, text
-from .config import DATABASE_URL, LOG_FILE
+from .config import DATABASE_URL, LOG_FILE, MDI_EPSILON
+from .db import copy_frame
+from .rollup import MDI_ROLLUP_AGGREGATES
+from .metrics import instrument, measure, verbose
+from .schema import refresh_mdi_summary
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,66 +22,187 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def compute_mdi():
-    """Compute MDI for each day and store in mdi_daily table."""
+WATERMARK_STAGE = 'mdi_daily'
+
+# Watermark in commit order: every transaction below the snapshot's xmin has finished, so rows
+# they wrote (change_xid) are all visible; rows at or above it are read again next run
+CHANGE_WATERMARK_SQL = "SELECT pg_snapshot_xmin(pg_current_snapshot())"
+
+MDI_COLUMNS = [
+    'date_recorded', 'weekday', 'feed_time_minutes', 'total_midnight_time_minutes',
+    'avg_feed_session_minutes', 'num_feed_midnight_sessions', 'num_midnight_sessions',
+    'mdi_score'
+]
+
+AGGREGATION_QUERY = """
+SELECT
+    session_date as date_recorded,
+""" + MDI_ROLLUP_AGGREGATES + """
+FROM sessions_hourly_rollup
+{where}
+GROUP BY session_date
+ORDER BY session_date ASC;
+"""
+
+UPSERT_SQL = """
+INSERT INTO mdi_daily (
+    date_recorded, weekday, feed_time_minutes, total_midnight_time_minutes,
+    avg_feed_session_minutes, num_feed_midnight_sessions, num_midnight_sessions, mdi_score
+)
+SELECT
+    date_recorded, weekday, feed_time_minutes, total_midnight_time_minutes,
+    avg_feed_session_minutes, num_feed_midnight_sessions, num_midnight_sessions, mdi_score
+FROM mdi_daily_stage
+ON CONFLICT (date_recorded) DO UPDATE SET
+    weekday = EXCLUDED.weekday,
+    feed_time_minutes = EXCLUDED.feed_time_minutes,
+    total_midnight_time_minutes = EXCLUDED.total_midnight_time_minutes,
+    avg_feed_session_minutes = EXCLUDED.avg_feed_session_minutes,
+    num_feed_midnight_sessions = EXCLUDED.num_feed_midnight_sessions,
+    num_midnight_sessions = EXCLUDED.num_midnight_sessions,
+    mdi_score = EXCLUDED.mdi_score,
+    updated_at = CURRENT_TIMESTAMP,
+    change_xid = pg_current_xact_id();
+"""
+
+def get_watermark(conn, stage=WATERMARK_STAGE):
+    """Return the change watermark a stage last read from (None if never run)."""
+    result = conn.execute(
+        text("SELECT watermark FROM etl_watermarks WHERE stage = :stage"),
+        {"stage": stage}
+    )
+    return result.scalar()
+
+def set_watermark(conn, watermark, stage=WATERMARK_STAGE):
+    """Store the change watermark (snapshot xmin) a stage read from."""
+    conn.execute(
+        text("""
+            INSERT INTO etl_watermarks (stage, watermark)
+            VALUES (:stage, :watermark)
+            ON CONFLICT (stage) DO UPDATE SET
+                watermark = EXCLUDED.watermark,
+                updated_at = CURRENT_TIMESTAMP
+        """),
+        {"stage": stage, "watermark": watermark}
+    )
+
+def find_dirty_dates(conn, watermark):
+    """Return session dates whose rollup rows were written at or after the watermark."""
+    if watermark is None:
+        query = text("SELECT DISTINCT session_date FROM sessions_hourly_rollup")
+        params = {}
+    else:
+        query = text("SELECT DISTINCT session_date FROM sessions_hourly_rollup WHERE change_xid >= :watermark")
+        params = {"watermark": watermark}
+    return sorted(row[0] for row in conn.execute(query, params))
+
+def add_mdi_score(df_agg):
+    """Fill missing aggregates and compute the MDI score column."""
+    epsilon = MDI_EPSILON  # Avoid division by zero
+    df_agg['total_midnight_time_minutes'] = df_agg['total_midnight_time_minutes'].fillna(0)
+    df_agg['feed_time_minutes'] = df_agg['feed_time_minutes'].fillna(0)
+    df_agg['avg_feed_session_minutes'] = df_agg['avg_feed_session_minutes'].fillna(0)
     
-    try:
-        engine = create_engine(DATABASE_URL)
-        logger.info("[SUCCESS] Database connection established")
-        
-        # Raw aggregation: group by date
-        query = """
-        SELECT
-            session_date as date_recorded,
-            session_weekday as weekday,
-            SUM(CASE WHEN is_feed_app AND is_midnight THEN duration_minutes ELSE 0 END) 
-                as feed_time_minutes,
-            SUM(CASE WHEN is_midnight THEN duration_minutes ELSE 0 END) 
-                as total_midnight_time_minutes,
-            AVG(CASE WHEN is_feed_app AND is_midnight THEN duration_minutes ELSE NULL END) 
-                as avg_feed_session_minutes,
-            COUNT(CASE WHEN is_feed_app AND is_midnight THEN 1 ELSE NULL END) 
-                as num_feed_midnight_sessions,
-            COUNT(CASE WHEN is_midnight THEN 1 ELSE NULL END) 
-                as num_midnight_sessions
-        FROM sessions
-        GROUP BY session_date, session_weekday
-        ORDER BY session_date ASC;
-        """
-        
-        logger.info("Executing aggregation query...")
-        df_agg = pd.read_sql(query, con=engine)
-        logger.info(f"[SUCCESS] Aggregated {len(df_agg)} days of data")
-        
-        # Compute MDI score
-        epsilon = 0.001  # Avoid division by zero
-        df_agg['total_midnight_time_minutes'] = df_agg['total_midnight_time_minutes'].fillna(0)
-        df_agg['feed_time_minutes'] = df_agg['feed_time_minutes'].fillna(0)
-        df_agg['avg_feed_session_minutes'] = df_agg['avg_feed_session_minutes'].fillna(0)
-        
-        df_agg['mdi_score'] = (
-            df_agg['feed_time_minutes'] / 
-            (df_agg['total_midnight_time_minutes'] + epsilon)
-        ) * df_agg['avg_feed_session_minutes']
-        
-        logger.info(f"[SUCCESS] Computed MDI for {len(df_agg)} days")
+    df_agg['mdi_score'] = (
+        df_agg['feed_time_minutes'] /
+        (df_agg['total_midnight_time_minutes'] + epsilon)
+    ) * df_agg['avg_feed_session_minutes']
+    return df_agg
+
+@instrument(kind='db')
+def upsert_mdi_daily(conn, df_agg):
+    """
+    Write MDI rows with INSERT ... ON CONFLICT (date_recorded) DO UPDATE.
+    Rows are COPY'd into a temporary staging table first so the upsert is
+    a single statement regardless of how many days changed.
+    """
+    conn.execute(text("""
+        CREATE TEMP TABLE mdi_daily_stage (
+            date_recorded DATE,
+            weekday VARCHAR(10),
+            feed_time_minutes NUMERIC,
+            total_midnight_time_minutes NUMERIC,
+            avg_feed_session_minutes NUMERIC,
+            num_feed_midnight_sessions INTEGER,
+            num_midnight_sessions INTEGER,
+            mdi_score NUMERIC
+        ) ON COMMIT DROP
+    """))
+    with conn.connection.cursor() as cursor:
+        copy_frame(cursor, df_agg[MDI_COLUMNS], 'mdi_daily_stage')
+    conn.execute(text(UPSERT_SQL))
+
+def _compute_mdi(conn, full_rebuild, dates):
+    """Aggregate, score and upsert MDI rows inside one transaction."""
+    explicit_dates = dates is not None
+    
+    # Capture the watermark before reading so rows committed
+    # during this run are picked up by the next one
+    new_watermark = conn.execute(text(CHANGE_WATERMARK_SQL)).scalar()
+    
+    if full_rebuild:
+        logger.info("Full rebuild: recomputing MDI for all dates")
+        where, params = "", {}
+    else:
+        if dates is None:
+            watermark = get_watermark(conn)
+            logger.info(f"Incremental run since watermark {watermark}")
+            dates = find_dirty_dates(conn, watermark)
+        dates = sorted(set(pd.to_datetime(list(dates)).date))
+        if not dates:
+            logger.info("[SUCCESS] No new sessions since last run; mdi_daily is up to date")
+            return pd.DataFrame(columns=MDI_COLUMNS)
+        logger.info(f"Recomputing MDI for {len(dates)} dirty dates ({dates[0]} to {dates[-1]})")
+        where, params = "WHERE session_date = ANY(:dates)", {"dates": dates}
+    
+    logger.info("Executing aggregation query...")
+    with measure('mdi_aggregation_query', kind='db') as record:
+        df_agg = pd.read_sql(text(AGGREGATION_QUERY.format(where=where)), con=conn, params=params)
+        record['rows_out'] = len(df_agg)
+    logger.info(f"[SUCCESS] Aggregated {len(df_agg)} days of data")
+    
+    # Compute MDI score
+    df_agg = add_mdi_score(df_agg)
+    
+    logger.info(f"[SUCCESS] Computed MDI for {len(df_agg)} days")
+    if verbose():
         logger.info(f"\n MDI Statistics:")
         logger.info(df_agg['mdi_score'].describe())
+    
+    # Upsert into mdi_daily table
+    logger.info(f"Upserting into 'mdi_daily' table...")
+    upsert_mdi_daily(conn, df_agg)
+    logger.info(f"[SUCCESS] Upserted {len(df_agg)} rows into 'mdi_daily' table")
+    
+    # An explicit date list doesn't cover everything loaded since
+    # the watermark, so only advance it for watermark/full runs
+    if not explicit_dates:
+        set_watermark(conn, new_watermark)
+    
+    return df_agg
+
+@instrument(kind='task')
+def compute_mdi(full_rebuild=False, dates=None, engine=None):
+    """
+    Compute MDI for each day and upsert it into the mdi_daily table.
+    
+    By default only dates with sessions loaded since the stored watermark
+    are recomputed. Pass dates (e.g. the dirty dates from the latest load)
+    to recompute exactly those, or full_rebuild=True for backfills.
+    Pass engine to reuse a pooled engine (e.g. from the orchestrator).
+    """
+    owns_engine = engine is None
+    
+    try:
+        if owns_engine:
+            engine = create_engine(DATABASE_URL)
+            logger.info("[SUCCESS] Database connection established")
         
-        # Insert into mdi_daily table
-        logger.info(f"Inserting into 'mdi_daily' table...")
-        df_agg.to_sql(
-            'mdi_daily',
-            con=engine,
-            if_exists='append',
-            index=False,
-            method='multi',
-            chunksize=100
-        )
-        
-        logger.info(f"[SUCCESS] Inserted {len(df_agg)} rows into 'mdi_daily' table")
+        with engine.begin() as conn:
+            df_agg = _compute_mdi(conn, full_rebuild, dates)
         
-        engine.dispose()
+        if owns_engine:
+            engine.dispose()
         return df_agg
     
     except Exception as e:
@@ -84,5 +210,11 @@ def compute_mdi():
         raise
 
 if __name__ == '__main__':
-    df_mdi = compute_mdi()
+    parser = argparse.ArgumentParser(description="Compute daily MDI scores into mdi_daily.")
+    parser.add_argument('--full-rebuild', action='store_true',
+                        help="recompute every date instead of only those loaded since the last run")
+    args = parser.parse_args()
+    
+    df_mdi = compute_mdi(full_rebuild=args.full_rebuild)
+    refresh_mdi_summary()
     logger.info("[SUCCESS] MDI computation complete!")
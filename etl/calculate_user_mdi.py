@@ -0,0 +1,266 @@
+"""
+calculate_user_mdi.py - Compute MDI per (user_id, date) in parallel.
+
+Users are sharded into contiguous user_id ranges holding about equal
+shares of the rollup rows; a process pool aggregates and upserts the
+ranges concurrently, each worker holding its own pooled database
+connection and reading only its range through idx_rollup_user_id.
+"""
+
+import argparse
+import time
+import pandas as pd
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sqlalchemy import create_engine, text
+from .config import DATABASE_URL, LOG_FILE, MDI_WORKERS, MDI_USER_PARTITIONS
+from .calculate_mdi import add_mdi_score, get_watermark, set_watermark, find_dirty_dates, CHANGE_WATERMARK_SQL
+from .db import copy_frame
+from .rollup import MDI_ROLLUP_AGGREGATES
+from .metrics import instrument
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_FILE, encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+WATERMARK_STAGE = 'mdi_user_daily'
+
+USER_MDI_COLUMNS = [
+    'user_id', 'date_recorded', 'weekday', 'feed_time_minutes', 'total_midnight_time_minutes',
+    'avg_feed_session_minutes', 'num_feed_midnight_sessions', 'num_midnight_sessions',
+    'mdi_score'
+]
+
+# Range bounds of each partition; a range predicate can use idx_rollup_user_id (a hash
+# of user_id can't, so every partition would scan the whole rollup)
+PARTITION_FILTERS = {'low': "user_id >= :low", 'high': "user_id < :high"}
+
+# user_id quantiles of the rollup rows to aggregate, splitting them into equal shares
+BOUNDARIES_QUERY = """
+SELECT percentile_disc(CAST(:fractions AS double precision[])) WITHIN GROUP (ORDER BY user_id)
+FROM sessions_hourly_rollup
+{where}
+"""
+
+USER_AGGREGATION_QUERY = """
+SELECT
+    user_id,
+    session_date as date_recorded,
+""" + MDI_ROLLUP_AGGREGATES + """
+FROM sessions_hourly_rollup
+{where}
+GROUP BY user_id, session_date
+ORDER BY user_id, session_date ASC;
+"""
+
+# Same metrics straight from raw sessions, for the single-process reference
+REFERENCE_QUERY = """
+SELECT
+    user_id,
+    session_date as date_recorded,
+    session_weekday as weekday,
+    SUM(CASE WHEN is_feed_app AND is_midnight THEN duration_minutes ELSE 0 END)
+        as feed_time_minutes,
+    SUM(CASE WHEN is_midnight THEN duration_minutes ELSE 0 END)
+        as total_midnight_time_minutes,
+    AVG(CASE WHEN is_feed_app AND is_midnight THEN duration_minutes ELSE NULL END)
+        as avg_feed_session_minutes,
+    COUNT(CASE WHEN is_feed_app AND is_midnight THEN 1 ELSE NULL END)
+        as num_feed_midnight_sessions,
+    COUNT(CASE WHEN is_midnight THEN 1 ELSE NULL END)
+        as num_midnight_sessions
+FROM sessions
+{where}
+GROUP BY user_id, session_date, session_weekday
+ORDER BY user_id, session_date ASC;
+"""
+
+UPSERT_SQL = """
+INSERT INTO mdi_user_daily (
+    user_id, date_recorded, weekday, feed_time_minutes, total_midnight_time_minutes,
+    avg_feed_session_minutes, num_feed_midnight_sessions, num_midnight_sessions, mdi_score
+)
+SELECT
+    user_id, date_recorded, weekday, feed_time_minutes, total_midnight_time_minutes,
+    avg_feed_session_minutes, num_feed_midnight_sessions, num_midnight_sessions, mdi_score
+FROM mdi_user_daily_stage
+ON CONFLICT (user_id, date_recorded) DO UPDATE SET
+    weekday = EXCLUDED.weekday,
+    feed_time_minutes = EXCLUDED.feed_time_minutes,
+    total_midnight_time_minutes = EXCLUDED.total_midnight_time_minutes,
+    avg_feed_session_minutes = EXCLUDED.avg_feed_session_minutes,
+    num_feed_midnight_sessions = EXCLUDED.num_feed_midnight_sessions,
+    num_midnight_sessions = EXCLUDED.num_midnight_sessions,
+    mdi_score = EXCLUDED.mdi_score,
+    updated_at = CURRENT_TIMESTAMP,
+    change_xid = pg_current_xact_id();
+"""
+
+# One engine per worker process, created by the pool initializer
+_worker_engine = None
+
+def _init_worker(database_url):
+    """Give each worker process its own single-connection pool."""
+    global _worker_engine
+    _worker_engine = create_engine(database_url, pool_size=1, max_overflow=0, pool_pre_ping=True)
+
+def _build_where(user_range=None, dates=None):
+    clauses, params = [], {}
+    for bound, value in zip(('low', 'high'), user_range or (None, None)):
+        if value is not None:
+            clauses.append(PARTITION_FILTERS[bound])
+            params[bound] = value
+    if dates is not None:
+        clauses.append("session_date = ANY(:dates)")
+        params["dates"] = dates
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params
+
+def user_ranges(conn, partitions, dates=None):
+    """
+    Split users into at most partitions contiguous (low, high) user_id
+    ranges, high exclusive and None for an open end, each covering about
+    the same number of rollup rows (for dates, if given).
+    """
+    where, params = _build_where(dates=dates)
+    if partitions < 2:
+        return [(None, None)]
+    # Fraction 0 is the smallest id: a bound at or below it would start with an empty range
+    params['fractions'] = [i / partitions for i in range(partitions)]
+    quantiles = conn.execute(text(BOUNDARIES_QUERY.format(where=where)), params).scalar()
+    if not quantiles or quantiles[0] is None:
+        return [(None, None)]
+    # Skewed ids can repeat a quantile; each distinct bound starts one range
+    bounds = sorted(set(bound for bound in quantiles[1:] if bound > quantiles[0]))
+    return list(zip([None] + bounds, bounds + [None]))
+
+@instrument(kind='db')
+def aggregate_user_mdi(conn, user_range=None, dates=None, query=USER_AGGREGATION_QUERY):
+    """Aggregate the rollup and score MDI per (user_id, date) for one user_id range (or all users)."""
+    where, params = _build_where(user_range, dates)
+    df = pd.read_sql(text(query.format(where=where)), con=conn, params=params)
+    return add_mdi_score(df)
+
+@instrument(kind='db')
+def upsert_user_mdi(conn, df):
+    """Bulk-write per-user MDI rows via a COPY'd staging table and one upsert."""
+    conn.execute(text("""
+        CREATE TEMP TABLE mdi_user_daily_stage (
+            user_id INTEGER,
+            date_recorded DATE,
+            weekday VARCHAR(10),
+            feed_time_minutes NUMERIC,
+            total_midnight_time_minutes NUMERIC,
+            avg_feed_session_minutes NUMERIC,
+            num_feed_midnight_sessions INTEGER,
+            num_midnight_sessions INTEGER,
+            mdi_score NUMERIC
+        ) ON COMMIT DROP
+    """))
+    with conn.connection.cursor() as cursor:
+        copy_frame(cursor, df[USER_MDI_COLUMNS], 'mdi_user_daily_stage')
+    conn.execute(text(UPSERT_SQL))
+
+def _compute_partition(partition, user_range, dates):
+    """Worker task: aggregate and upsert one user_id range in its own transaction."""
+    start = time.perf_counter()
+    with _worker_engine.begin() as conn:
+        df = aggregate_user_mdi(conn, user_range, dates)
+        if len(df) > 0:
+            upsert_user_mdi(conn, df)
+    return partition, len(df), time.perf_counter() - start
+
+def reference_user_mdi(engine, dates=None):
+    """Single-process, unpartitioned per-user MDI from raw sessions (for verifying the engine)."""
+    with engine.connect() as conn:
+        return aggregate_user_mdi(conn, dates=dates, query=REFERENCE_QUERY)
+
+@instrument(kind='task')
+def compute_user_mdi(workers=MDI_WORKERS, partitions=MDI_USER_PARTITIONS, full_rebuild=False, dates=None,
+                     engine=None):
+    """
+    Compute MDI per (user_id, date) and upsert it into mdi_user_daily.
+    
+    Users are split into user_id ranges (4 per worker by default) that a
+    process pool aggregates concurrently. Date selection follows
+    compute_mdi: dates since the 'mdi_user_daily' watermark by default,
+    an explicit dates list, or every date with full_rebuild=True.
+    Returns a dict with rows written, partitions, workers and seconds.
+    engine, if given, is used for the watermark; workers open their own.
+    """
+    explicit_dates = dates is not None
+    owns_engine = engine is None
+    workers = max(1, workers)
+    partitions = partitions if partitions > 0 else workers * 4
+    
+    try:
+        if owns_engine:
+            engine = create_engine(DATABASE_URL)
+            logger.info("[SUCCESS] Database connection established")
+        
+        with engine.connect() as conn:
+            new_watermark = conn.execute(text(CHANGE_WATERMARK_SQL)).scalar()
+            if full_rebuild:
+                logger.info("Full rebuild: recomputing per-user MDI for all dates")
+                dates = None
+            elif dates is None:
+                watermark = get_watermark(conn, WATERMARK_STAGE)
+                logger.info(f"Incremental run since watermark {watermark}")
+                dates = find_dirty_dates(conn, watermark)
+        
+        if dates is not None:
+            dates = sorted(set(pd.to_datetime(list(dates)).date))
+            if not dates:
+                logger.info("[SUCCESS] No new sessions since last run; mdi_user_daily is up to date")
+                if owns_engine:
+                    engine.dispose()
+                return {'rows': 0, 'partitions': partitions, 'workers': workers, 'seconds': 0.0}
+            logger.info(f"Recomputing per-user MDI for {len(dates)} dates")
+        
+        with engine.connect() as conn:
+            ranges = user_ranges(conn, partitions, dates)
+        partitions = len(ranges)
+        logger.info(f"Aggregating {partitions} user_id ranges across {workers} worker processes...")
+        start = time.perf_counter()
+        total_rows = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(engine.url.render_as_string(hide_password=False),)) as pool:
+            futures = [pool.submit(_compute_partition, p, user_range, dates) for p, user_range in enumerate(ranges)]
+            for future in as_completed(futures):
+                partition, rows, seconds = future.result()
+                total_rows += rows
+                logger.info(f"  Partition {partition}/{partitions}: {rows} rows in {seconds:.2f}s")
+        elapsed = time.perf_counter() - start
+        
+        logger.info(f"[SUCCESS] Upserted {total_rows} rows into 'mdi_user_daily' in {elapsed:.2f}s")
+        
+        # Partitions commit independently; advance the watermark once all succeeded
+        if not explicit_dates:
+            with engine.begin() as conn:
+                set_watermark(conn, new_watermark, WATERMARK_STAGE)
+        
+        if owns_engine:
+            engine.dispose()
+        return {'rows': total_rows, 'partitions': partitions, 'workers': workers, 'seconds': elapsed}
+    
+    except Exception as e:
+        logger.error(f"[ERROR] Error computing per-user MDI: {e}", exc_info=True)
+        raise
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compute per-user daily MDI scores into mdi_user_daily.")
+    parser.add_argument('--workers', type=int, default=MDI_WORKERS, help="worker processes")
+    parser.add_argument('--partitions', type=int, default=MDI_USER_PARTITIONS,
+                        help="user_id range partitions (0 = 4 per worker)")
+    parser.add_argument('--full-rebuild', action='store_true',
+                        help="recompute every date instead of only those loaded since the last run")
+    args = parser.parse_args()
+    
+    compute_user_mdi(workers=args.workers, partitions=args.partitions, full_rebuild=args.full_rebuild)
+    logger.info("[SUCCESS] Per-user MDI computation complete!")
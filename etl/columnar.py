@@ -0,0 +1,79 @@
+"""
+columnar.py - Typed Parquet intermediate for cleaned sessions.
+
+Replaces the cleaned_sessions.csv hand-off between etl_pipeline and
+load_to_db with a binary columnar file that keeps an explicit schema
+(dictionary-encoded strings, int8 hours, bool flags, date32 dates), so
+nothing is re-parsed and readers can load only the columns they need.
+"""
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import logging
+from .config import LOG_FILE
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_FILE, encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+SESSIONS_SCHEMA = pa.schema([
+    ('user_id', pa.int32()),
+    ('app_name', pa.dictionary(pa.int32(), pa.string())),
+    ('session_date', pa.date32()),
+    ('session_hour', pa.int8()),
+    ('session_weekday', pa.dictionary(pa.int8(), pa.string())),
+    ('duration_minutes', pa.float64()),
+    ('app_category', pa.dictionary(pa.int32(), pa.string())),
+    ('is_feed_app', pa.bool_()),
+    ('is_midnight', pa.bool_()),
+])
+
+def to_arrow(df):
+    """Conform a transformed sessions DataFrame to SESSIONS_SCHEMA."""
+    df = df[SESSIONS_SCHEMA.names].copy()
+    df['session_date'] = pd.to_datetime(df['session_date']).dt.normalize()
+    for name in ('app_name', 'session_weekday', 'app_category'):
+        if not isinstance(df[name].dtype, pd.CategoricalDtype):
+            df[name] = df[name].astype(str).astype('category')
+    return pa.Table.from_pandas(df, schema=SESSIONS_SCHEMA, preserve_index=False)
+
+def write_sessions(frames, path):
+    """
+    Write a DataFrame or an iterable of chunks to a Parquet file.
+    Each chunk becomes a row group, so memory stays bounded by the chunk.
+    Returns rows written.
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    
+    total_rows = 0
+    with pq.ParquetWriter(path, SESSIONS_SCHEMA) as writer:
+        for df in frames:
+            if len(df) == 0:
+                continue
+            writer.write_table(to_arrow(df))
+            total_rows += len(df)
+    logger.info(f"[SUCCESS] Saved {total_rows} cleaned rows to {path}")
+    return total_rows
+
+def _to_pandas(table):
+    # Dictionary columns become categoricals; dates become datetime64[ns], as transform_frame returns them
+    return table.to_pandas(date_as_object=False, coerce_temporal_nanoseconds=True)
+
+def read_sessions(path, columns=None, memory_map=True):
+    """Read the whole file (or only the given columns) into a typed DataFrame."""
+    table = pq.read_table(path, columns=columns, memory_map=memory_map)
+    return _to_pandas(table)
+
+def iter_sessions(path, columns=None, batch_size=500_000):
+    """Lazily yield typed DataFrames of at most batch_size rows."""
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield _to_pandas(pa.Table.from_batches([batch]))
@@ -33,10 +33,103 @@ FEED_APPS = {
     'bluesky', 'mastodon'
 }
 
+# Feed-app classification (etl_pipeline.AppClassifier). Names are lowercased with whitespace
+# collapsed and mapped through the aliases; then a name in FEED_APPS is a feed app, one matching
+# a non-feed pattern isn't, and one matching a feed pattern (variants like "Instagram Lite",
+# "YouTube Shorts (beta)") is. FEED_APP_RULES_FILE may add to each, as JSON with the keys
+# feed_apps, aliases, patterns and non_feed_patterns.
+FEED_APP_ALIASES = {
+    'ig': 'instagram', 'insta': 'instagram', 'fb': 'facebook', 'yt': 'youtube',
+    'yt shorts': 'youtube shorts', 'twitter / x': 'x', 'x (twitter)': 'x', 'x (formerly twitter)': 'x',
+    'douyin': 'tiktok', 'musical.ly': 'tiktok',
+}
+FEED_APP_PATTERNS = [
+    r'^(tiktok|instagram|facebook|youtube|snapchat|reddit|pinterest|threads|twitter|bluesky|mastodon)\b',
+]
+NON_FEED_APP_PATTERNS = [
+    r'^youtube (music|kids|studio)\b',
+    r'^facebook (messenger|ads manager|business)\b',
+]
+FEED_APP_RULES_FILE = os.getenv('FEED_APP_RULES_FILE', '')
+
 MIDNIGHT_HOURS = set(range(0, 6))  # 0–5 inclusive
 
+# Weekday categories in pandas dayofweek order, so codes come straight from the date
+WEEKDAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Per-user local time (etl_pipeline.LocalClock). USER_TIMEZONES_FILE is a CSV of user_id,timezone
+# (IANA names such as Europe/Berlin); when set, hour, date and weekday - and so midnight - are
+# taken in each user's local time. SOURCE_TIMEZONE is the clock of the export's timestamps; users
+# missing from the file get DEFAULT_USER_TIMEZONE, or keep the export's clock if that is empty.
+USER_TIMEZONES_FILE = os.getenv('USER_TIMEZONES_FILE', '')
+SOURCE_TIMEZONE = os.getenv('SOURCE_TIMEZONE', 'UTC')
+DEFAULT_USER_TIMEZONE = os.getenv('DEFAULT_USER_TIMEZONE', '')
+
+# MDI denominator guard (avoids division by zero on days without midnight use)
+MDI_EPSILON = 0.001
+
+# Streaming transform: rows per chunk (0 = load the whole CSV in memory)
+CHUNK_SIZE = int(os.getenv('ETL_CHUNK_SIZE', '0'))
+
+# Intermediate file between transform and load: 'parquet' (typed, columnar) or 'csv' (export)
+INTERMEDIATE_FORMAT = os.getenv('INTERMEDIATE_FORMAT', 'parquet')
+
+# Loader backend for the 'sessions' table: 'copy' (COPY FROM STDIN) or 'to_sql'
+LOAD_BACKEND = os.getenv('LOAD_BACKEND', 'copy')
+
+# Loader batches (rows per transaction and checkpoint) and what a row whose
+# natural key is already loaded does: 'skip' it or 'upsert' over the stored row
+LOAD_BATCH_ROWS = int(os.getenv('LOAD_BATCH_ROWS', '100000'))
+LOAD_ON_CONFLICT = os.getenv('LOAD_ON_CONFLICT', 'skip')
+
+# Per-user MDI engine: worker processes and user_id range partitions (0 = 4 per worker)
+MDI_WORKERS = int(os.getenv('MDI_WORKERS', os.cpu_count() or 1))
+MDI_USER_PARTITIONS = int(os.getenv('MDI_USER_PARTITIONS', '0'))
+
+# Directory ingestion: worker processes, file pattern, and the record of files already ingested
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', os.cpu_count() or 1))
+INGEST_PATTERN = os.getenv('INGEST_PATTERN', '*.csv')
+INGEST_MANIFEST = DATA_PROCESSED / 'ingest_manifest.json'
+INGEST_KEYS = DATA_PROCESSED / 'ingest_keys.npy'
+
+# Micro-batch watcher (`python -m etl watch`): landing directory of CSV/JSONL files, rows or
+# seconds after which a batch is loaded, polling interval, raw frames buffered between the reader
+# and the loader, and the record of files and stream offsets already loaded
+WATCH_DIRECTORY = Path(os.getenv('WATCH_DIRECTORY', DATA_RAW / 'landing'))
+WATCH_BATCH_ROWS = int(os.getenv('WATCH_BATCH_ROWS', '50000'))
+WATCH_BATCH_SECONDS = float(os.getenv('WATCH_BATCH_SECONDS', '30'))
+WATCH_POLL_SECONDS = float(os.getenv('WATCH_POLL_SECONDS', '2'))
+WATCH_QUEUE_FRAMES = int(os.getenv('WATCH_QUEUE_FRAMES', '8'))
+WATCH_STATE = DATA_PROCESSED / 'watch_state.json'
+
+# Feed-app flags of the app names seen so far, reused by later runs while the rules are unchanged
+FEED_APP_CACHE = DATA_PROCESSED / 'feed_app_cache.json'
+
 # Anomaly detection threshold
 Z_SCORE_THRESHOLD = 1.5
 
+# Baseline each day is scored against: 'rolling' (the trailing ANOMALY_WINDOW_DAYS days),
+# 'expanding' (every earlier day), 'ewma' (span of ANOMALY_WINDOW_DAYS days) or 'global'
+# (all days, re-scored every run). Days with fewer than ANOMALY_MIN_DAYS earlier days aren't scored.
+ANOMALY_BASELINE = os.getenv('ANOMALY_BASELINE', 'rolling')
+ANOMALY_WINDOW_DAYS = int(os.getenv('ANOMALY_WINDOW_DAYS', '28'))
+ANOMALY_MIN_DAYS = int(os.getenv('ANOMALY_MIN_DAYS', '7'))
+
+# Batch detector over many series (per user, per app): one baseline per series and weekday
+# ('weekday') or per series ('none'), from the median and MAD (robust) or the mean and std
+SERIES_ANOMALY_SEASONALITY = os.getenv('SERIES_ANOMALY_SEASONALITY', 'weekday')
+SERIES_ANOMALY_ROBUST = os.getenv('SERIES_ANOMALY_ROBUST', '1') == '1'
+
 # Logging
 LOG_FILE = DATA_LOGS / 'etl.log'
+
+# Data profile (sketches and summary) of each run's transformed sessions, for drift comparison;
+# opt-in like the other diagnostics (also on with ETL_VERBOSE / ETL_PROFILE)
+ETL_DATA_PROFILE = os.getenv('ETL_DATA_PROFILE', '0') == '1'
+DATA_PROFILE_DIR = DATA_LOGS / 'data_profiles'
+
+# Run metrics (one JSON line per measured stage/call); verbose adds costly
+# diagnostic summaries, profile also captures cProfile stats per run
+METRICS_FILE = Path(os.getenv('ETL_METRICS_FILE', DATA_LOGS / 'metrics.jsonl'))
+ETL_VERBOSE = os.getenv('ETL_VERBOSE', '0') == '1'
+ETL_PROFILE = os.getenv('ETL_PROFILE', '0') == '1'
@@ -0,0 +1,16 @@
+"""
+db.py - Shared PostgreSQL helpers for the ETL stages.
+"""
+
+import io
+
+def copy_frame(cursor, df, table):
+    """COPY one DataFrame into table through a psycopg2 cursor (no commit)."""
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    columns = ', '.join(df.columns)
+    cursor.copy_expert(
+        f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
@@ -1,12 +1,30 @@
 """
 detect_anomalies.py - Detect anomalies in MDI using z-scores.
+
+Each day is scored against a baseline of the days before it: the trailing
+ANOMALY_WINDOW_DAYS days ('rolling', Welford updates that also remove the
+days leaving the window), every earlier day ('expanding', Welford) or an
+exponentially weighted mean ('ewma'). The running statistics live in
+anomaly_state, so a run scores only the days whose MDI changed since the
+last one, O(1) each; a late change to a scored day resumes from the
+baseline recorded on that day. 'global' keeps the original statistics
+over all days, re-scored every run.
 """
 
 import pandas as pd
 import numpy as np
 import logging
+from collections import deque
+from datetime import timedelta
+from math import sqrt
 from sqlalchemy import create_engine, text
-from .config import DATABASE_URL, Z_SCORE_THRESHOLD, LOG_FILE
+from .config import (
+    DATABASE_URL, Z_SCORE_THRESHOLD, LOG_FILE, ANOMALY_BASELINE, ANOMALY_WINDOW_DAYS, ANOMALY_MIN_DAYS
+)
+from .db import copy_frame
+from .calculate_mdi import CHANGE_WATERMARK_SQL
+from .metrics import instrument
+from .schema import refresh_mdi_summary
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,101 +36,379 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def detect_anomalies():
-    """Detect and log anomalies in MDI scores."""
+ANOMALY_COLUMNS = ['date_of_anomaly', 'mdi_score', 'z_score', 'severity', 'message']
+BASELINE_COLUMNS = ['baseline_mean', 'baseline_std', 'baseline_days']
+BASELINE_METHODS = ('rolling', 'expanding', 'ewma', 'global')
+
+# anomaly_state row of the daily MDI series
+SERIES = 'mdi_daily'
+
+class Baseline:
+    """
+    Running mean and standard deviation of the days seen so far (m2 holds
+    Welford's sum of squared deviations, or the EWMA variance for 'ewma').
+    """
     
-    try:
-        engine = create_engine(DATABASE_URL)
-        logger.info("[SUCCESS] Database connection established")
-        
-        # Fetch MDI daily data
-        query = "SELECT date_recorded, mdi_score FROM mdi_daily ORDER BY date_recorded ASC;"
-        df_mdi = pd.read_sql(query, con=engine)
-        
-        if len(df_mdi) == 0:
-            logger.warning("[WARNING]  No MDI data found. Run calculate_mdi.py first.")
-            return
-        
-        logger.info(f"[SUCCESS] Fetched {len(df_mdi)} days of MDI data")
-        
-        # Compute z-scores
-        mean_mdi = df_mdi['mdi_score'].mean()
-        std_mdi = df_mdi['mdi_score'].std()
-        
-        if std_mdi == 0:
-            logger.warning("[WARNING]  MDI has zero standard deviation; skipping z-score calculation")
+    def __init__(self, method, window_days):
+        self.method = method
+        self.window_days = window_days
+        self.alpha = 2 / (window_days + 1)
+        self.n, self.mean, self.m2 = 0, 0.0, 0.0
+        self.window = deque()  # (day, value) pairs inside the rolling window
+    
+    def restore(self, mean, std, n):
+        """Resume from a recorded baseline (mean, std and n of the earlier days)."""
+        variance = (std or 0.0) ** 2
+        self.n, self.mean = n, mean or 0.0
+        self.m2 = variance if self.method == 'ewma' else variance * max(n - 1, 0)
+    
+    @property
+    def std(self):
+        if self.method == 'ewma':
+            return sqrt(self.m2) if self.n > 1 else None
+        return sqrt(self.m2 / (self.n - 1)) if self.n > 1 else None
+    
+    def add(self, day, value):
+        self.n += 1
+        delta = value - self.mean
+        if self.method == 'ewma':
+            if self.n == 1:
+                self.mean = value
+            else:
+                self.mean += self.alpha * delta
+                self.m2 = (1 - self.alpha) * (self.m2 + self.alpha * delta * delta)
             return
+        if self.method == 'rolling':
+            self.window.append((day, value))
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+    
+    def advance(self, day):
+        """Drop the days before the window that ends the day before day."""
+        first_day = day - timedelta(days=self.window_days)
+        while self.window and self.window[0][0] < first_day:
+            value = self.window.popleft()[1]
+            self.n -= 1
+            if self.n == 0:
+                self.mean, self.m2 = 0.0, 0.0
+                continue
+            delta = value - self.mean
+            self.mean -= delta / self.n
+            # Clamp the rounding error of many add/remove pairs
+            self.m2 = max(self.m2 - delta * (value - self.mean), 0.0)
+    
+    def score(self, day, value, min_days):
+        """(mean, std, n) of the baseline before day and value's z-score, then add value."""
+        if self.method == 'rolling':
+            self.advance(day)
+        mean, std, n = (self.mean if self.n else None), self.std, self.n
+        z_score = (value - mean) / std if n >= min_days and std else None
+        self.add(day, value)
+        return mean, std, n, z_score
+
+def describe_baseline(method, window_days):
+    return {
+        'rolling': f"trailing {window_days}-day",
+        'expanding': "expanding",
+        'ewma': f"EWMA (span {window_days} days)",
+        'global': "all-days",
+    }[method]
+
+def load_state(conn, series=SERIES):
+    """anomaly_state row of series as a dict (None before its first run)."""
+    row = conn.execute(text("SELECT * FROM anomaly_state WHERE series = :series"), {'series': series})
+    row = row.mappings().first()
+    return None if row is None else dict(row)
+
+def save_state(conn, state, series=SERIES):
+    conn.execute(text("""
+        INSERT INTO anomaly_state (series, method, window_days, min_days, days, mean, m2, last_date, watermark)
+        VALUES (:series, :method, :window_days, :min_days, :days, :mean, :m2, :last_date, :watermark)
+        ON CONFLICT (series) DO UPDATE SET
+            method = EXCLUDED.method,
+            window_days = EXCLUDED.window_days,
+            min_days = EXCLUDED.min_days,
+            days = EXCLUDED.days,
+            mean = EXCLUDED.mean,
+            m2 = EXCLUDED.m2,
+            last_date = EXCLUDED.last_date,
+            watermark = EXCLUDED.watermark,
+            updated_at = CURRENT_TIMESTAMP
+    """), {'series': series, **state})
+
+def restore_baseline(conn, state, start, method, window_days):
+    """
+    Baseline of the days before start, from the rolling window's days in
+    mdi_daily, anomaly_state (start after the last scored day) or the
+    baseline recorded on the first scored day from start. None if there
+    is no such day, so the history has to be replayed.
+    """
+    baseline = Baseline(method, window_days)
+    if method == 'rolling':
+        rows = conn.execute(text("""
+            SELECT date_recorded, mdi_score FROM mdi_daily
+            WHERE date_recorded >= :first_day AND date_recorded < :start
+            ORDER BY date_recorded
+        """), {'first_day': start - timedelta(days=window_days), 'start': start})
+        for day, value in rows:
+            baseline.add(day, float(value))
+        return baseline
+    
+    if start > state['last_date']:
+        baseline.n, baseline.mean, baseline.m2 = state['days'], state['mean'], state['m2']
+        return baseline
+    
+    # Days scored before start are unchanged, so the next scored day's baseline still holds
+    row = conn.execute(text("""
+        SELECT baseline_mean, baseline_std, baseline_days FROM mdi_daily
+        WHERE date_recorded >= :start AND baseline_days IS NOT NULL
+        ORDER BY date_recorded
+        LIMIT 1
+    """), {'start': start}).first()
+    if row is None:
+        return None
+    baseline.restore(*row)
+    return baseline
+
+def score_days(df_days, baseline, min_days):
+    """Score df_days (in date order) one by one against baseline, which moves past each day."""
+    df_scored = df_days[['date_recorded', 'mdi_score']].reset_index(drop=True)
+    scores = [
+        baseline.score(day, value, min_days)
+        for day, value in zip(df_scored['date_recorded'], df_scored['mdi_score'])
+    ]
+    scores = pd.DataFrame(scores, columns=BASELINE_COLUMNS + ['z_score'], dtype=float)
+    df_scored = pd.concat([df_scored, scores], axis=1)
+    df_scored['baseline_days'] = df_scored['baseline_days'].astype('Int64')
+    return df_scored
+
+@instrument(kind='db')
+def write_z_scores(conn, df_mdi, table='mdi_daily'):
+    """
+    Write z-scores (and the baseline columns df_mdi has) back to mdi_daily
+    in one set-based statement. Scores are COPY'd into a temporary table and
+    applied with a single UPDATE ... FROM join instead of one UPDATE per day.
+    Returns rows updated.
+    """
+    columns = ['z_score'] + [column for column in BASELINE_COLUMNS if column in df_mdi]
+    conn.execute(text("""
+        CREATE TEMP TABLE z_score_stage (
+            date_recorded DATE PRIMARY KEY,
+            z_score NUMERIC,
+            baseline_mean DOUBLE PRECISION,
+            baseline_std DOUBLE PRECISION,
+            baseline_days INTEGER
+        ) ON COMMIT DROP
+    """))
+    with conn.connection.cursor() as cursor:
+        copy_frame(cursor, df_mdi[['date_recorded'] + columns], 'z_score_stage')
+    assignments = ', '.join(f"{column} = s.{column}" for column in columns)
+    changed = ' OR '.join(f"m.{column} IS DISTINCT FROM s.{column}" for column in columns)
+    result = conn.execute(text(f"""
+        UPDATE {table} AS m
+        SET {assignments}
+        FROM z_score_stage AS s
+        WHERE m.date_recorded = s.date_recorded
+          AND ({changed})
+    """))
+    return result.rowcount
+
+@instrument(kind='db')
+def prune_anomalies(conn, series_key=SERIES, table='anomaly_log'):
+    """
+    Delete logged anomalies of series_key's days that no longer score
+    above the threshold. Reads z_score_stage, so call it after
+    write_z_scores in the same transaction. Returns rows deleted.
+    """
+    result = conn.execute(text(f"""
+        DELETE FROM {table} AS a
+        USING z_score_stage AS s
+        WHERE a.series_key = :series_key
+          AND a.date_of_anomaly = s.date_recorded
+          AND NOT COALESCE(ABS(s.z_score) > :threshold, FALSE)
+    """), {'series_key': series_key, 'threshold': Z_SCORE_THRESHOLD})
+    return result.rowcount
+
+@instrument(kind='db')
+def upsert_anomalies(conn, df_anomalies, table='anomaly_log'):
+    """
+    Insert anomalies idempotently: one row per series_key and
+    date_of_anomaly (series_key defaults to the daily MDI series).
+    Re-running the detector refreshes the score, severity, message (and
+    the baseline columns df_anomalies has) of an already logged day
+    instead of appending a duplicate row.
+    """
+    columns = ANOMALY_COLUMNS + [column for column in BASELINE_COLUMNS if column in df_anomalies]
+    staged = columns + (['series_key'] if 'series_key' in df_anomalies else [])
+    conn.execute(text("""
+        CREATE TEMP TABLE anomaly_stage (
+            series_key VARCHAR(200) DEFAULT 'mdi_daily',
+            date_of_anomaly DATE,
+            mdi_score NUMERIC,
+            z_score NUMERIC,
+            severity VARCHAR(20),
+            message TEXT,
+            baseline_mean DOUBLE PRECISION,
+            baseline_std DOUBLE PRECISION,
+            baseline_days INTEGER
+        ) ON COMMIT DROP
+    """))
+    with conn.connection.cursor() as cursor:
+        copy_frame(cursor, df_anomalies[staged], 'anomaly_stage')
+    updates = ',\n            '.join(f"{column} = EXCLUDED.{column}" for column in columns[1:])
+    result = conn.execute(text(f"""
+        INSERT INTO {table} (series_key, {', '.join(columns)})
+        SELECT series_key, {', '.join(columns)}
+        FROM anomaly_stage
+        ON CONFLICT (series_key, date_of_anomaly) DO UPDATE SET
+            {updates}
+    """))
+    return result.rowcount
+
+def formatted(values, spec='%.2f'):
+    """values as strings, formatted column-wise (np.char.mod) rather than per row."""
+    return pd.Series(np.char.mod(spec, values.to_numpy()), index=values.index, dtype=object)
+
+def flag_anomalies(df_scored, series_key=SERIES):
+    """
+    Scored days with |z| above Z_SCORE_THRESHOLD, with series_key (a
+    scalar or per-row Series), severity and message, built column-wise.
+    """
+    df_anomalies = df_scored[df_scored['z_score'].abs() > Z_SCORE_THRESHOLD]
+    df_anomalies = df_anomalies.rename(columns={'date_recorded': 'date_of_anomaly'})
+    df_anomalies['series_key'] = series_key if isinstance(series_key, str) else series_key[df_anomalies.index]
+    
+    z_abs = df_anomalies['z_score'].abs().to_numpy()
+    df_anomalies['severity'] = np.select([z_abs > 2.0, z_abs > 1.5], ['extreme', 'moderate'], 'mild')
+    df_anomalies['message'] = (
+        "Midnight doomscroll spike detected. MDI=" + formatted(df_anomalies['mdi_score'].astype(float))
+        + ", z=" + formatted(df_anomalies['z_score'])
+        + " (baseline " + formatted(df_anomalies['baseline_mean']) + " ± " + formatted(df_anomalies['baseline_std'])
+        + " over " + formatted(df_anomalies['baseline_days'].astype('int64'), '%d') + " days)"
+    )
+    return df_anomalies[['series_key'] + ANOMALY_COLUMNS + BASELINE_COLUMNS]
+
+@instrument(kind='task')
+def detect_anomalies(engine=None, df_mdi=None, full_rebuild=False, method=ANOMALY_BASELINE,
+                     window_days=ANOMALY_WINDOW_DAYS, min_days=ANOMALY_MIN_DAYS):
+    """
+    Score the days whose MDI changed since the last run and log anomalies.
+    full_rebuild (or a change of method, window_days or min_days) replays
+    every day; df_mdi (date_recorded, mdi_score for every day) replays it
+    from the caller's frame instead of re-reading mdi_daily; engine reuses
+    a pool. Returns the anomalies among the scored days, or None.
+    """
+    if method not in BASELINE_METHODS:
+        raise ValueError(f"Unknown anomaly baseline '{method}' (expected one of {', '.join(BASELINE_METHODS)})")
+    owns_engine = engine is None
+    
+    try:
+        if owns_engine:
+            engine = create_engine(DATABASE_URL)
+            logger.info("[SUCCESS] Database connection established")
         
-        df_mdi['z_score'] = (df_mdi['mdi_score'] - mean_mdi) / std_mdi
-        
-        logger.info(f"\n MDI Statistics:")
-        logger.info(f"  Mean: {mean_mdi:.4f}")
-        logger.info(f"  Std Dev: {std_mdi:.4f}")
-        logger.info(f"  Min: {df_mdi['mdi_score'].min():.4f}")
-        logger.info(f"  Max: {df_mdi['mdi_score'].max():.4f}")
-        
-        # Flag anomalies
-        df_anomalies = df_mdi[df_mdi['z_score'].abs() > Z_SCORE_THRESHOLD].copy()
-        
-        logger.info(f"\n Found {len(df_anomalies)} anomalies (|z| > {Z_SCORE_THRESHOLD})")
-        
-        if len(df_anomalies) > 0:
-            # Assign severity
-            def assign_severity(z):
-                if abs(z) > 2.0:
-                    return 'extreme'
-                elif abs(z) > 1.5:
-                    return 'moderate'
-                else:
-                    return 'mild'
-            
-            df_anomalies['severity'] = df_anomalies['z_score'].apply(assign_severity)
-            df_anomalies['message'] = df_anomalies.apply(
-                lambda row: f"Midnight doomscroll spike detected. MDI={row['mdi_score']:.2f}, z={row['z_score']:.2f}",
-                axis=1
+        with engine.begin() as conn:
+            if conn.execute(text("SELECT to_regclass('anomaly_state')")).scalar() is None:
+                raise RuntimeError("anomaly_state not found; run `python -m etl migrate` first")
+            state = load_state(conn)
+            watermark = conn.execute(text(CHANGE_WATERMARK_SQL)).scalar()
+            config = {'method': method, 'window_days': window_days, 'min_days': min_days}
+            replay = (
+                full_rebuild or df_mdi is not None or method == 'global' or state is None
+                or state['watermark'] is None or any(state[key] != value for key, value in config.items())
             )
-            df_anomalies = df_anomalies.rename(columns={'date_recorded': 'date_of_anomaly'})
-            df_anomalies = df_anomalies[['date_of_anomaly', 'mdi_score', 'z_score', 'severity', 'message']]
             
-            # Insert into anomaly_log table
-            df_anomalies.to_sql(
-                'anomaly_log',
-                con=engine,
-                if_exists='append',
-                index=False,
-                method='multi',
-                chunksize=100
-            )
+            baseline = None
+            if not replay:
+                start = conn.execute(
+                    text("SELECT MIN(date_recorded) FROM mdi_daily WHERE change_xid >= :watermark"),
+                    {'watermark': state['watermark']}
+                ).scalar()
+                if start is None:
+                    logger.info("[SUCCESS] No MDI changes since the last run; nothing to score")
+                    return None
+                baseline = restore_baseline(conn, state, start, method, window_days)
+                if baseline is None:
+                    logger.warning(f"[WARNING]  No recorded baseline from {start}; replaying every day")
+                elif start <= state['last_date']:
+                    logger.info(f"MDI changed for days already scored, from {start}; resuming from their baseline")
+            
+            if baseline is not None:
+                query = text("SELECT date_recorded, mdi_score FROM mdi_daily WHERE date_recorded >= :start ORDER BY date_recorded ASC;")
+                df_days = pd.read_sql(query, con=conn, params={'start': start})
+            elif df_mdi is None:
+                baseline = Baseline(method, window_days)
+                query = text("SELECT date_recorded, mdi_score FROM mdi_daily ORDER BY date_recorded ASC;")
+                df_days = pd.read_sql(query, con=conn)
+            else:
+                baseline = Baseline(method, window_days)
+                # Score at the 4 decimals mdi_daily stores, as if read back from it
+                df_days = df_mdi[['date_recorded', 'mdi_score']].sort_values('date_recorded').reset_index(drop=True)
+                df_days['mdi_score'] = df_days['mdi_score'].astype(float).round(4)
+            
+            if len(df_days) == 0:
+                logger.warning("[WARNING]  No MDI data found. Run calculate_mdi.py first.")
+                return None
+            
+            logger.info(f"[SUCCESS] Fetched {len(df_days)} days of MDI data to score")
             
-            logger.info(f"[SUCCESS] Inserted {len(df_anomalies)} anomalies into 'anomaly_log' table")
+            if method == 'global':
+                mean_mdi = df_days['mdi_score'].mean()
+                std_mdi = df_days['mdi_score'].std()
+                if not std_mdi > 0:
+                    logger.warning("[WARNING]  MDI has zero standard deviation; skipping z-score calculation")
+                    return None
+                df_scored = df_days[['date_recorded', 'mdi_score']].copy()
+                df_scored['baseline_mean'], df_scored['baseline_std'] = mean_mdi, std_mdi
+                df_scored['baseline_days'] = pd.array([len(df_days)] * len(df_days), dtype='Int64')
+                df_scored['z_score'] = (df_scored['mdi_score'] - mean_mdi) / std_mdi
+                baseline.n, baseline.mean, baseline.m2 = len(df_days), mean_mdi, std_mdi ** 2 * (len(df_days) - 1)
+            else:
+                df_scored = score_days(df_days, baseline, min_days)
+            
+            logger.info(f"\n MDI Statistics ({describe_baseline(method, window_days)} baseline):")
+            logger.info(f"  Days scored: {int(df_scored['z_score'].notna().sum())} of {len(df_scored)}")
+            logger.info(f"  Baseline mean/std now: {baseline.mean:.4f} / {baseline.std or 0.0:.4f} over {baseline.n} days")
+            logger.info(f"  Min: {df_scored['mdi_score'].min():.4f}")
+            logger.info(f"  Max: {df_scored['mdi_score'].max():.4f}")
+            
+            # Flag anomalies
+            df_anomalies = flag_anomalies(df_scored)
+            logger.info(f"\n Found {len(df_anomalies)} anomalies (|z| > {Z_SCORE_THRESHOLD})")
+            
+            # z-scores, the anomaly log and the new state commit together
+            updated = write_z_scores(conn, df_scored)
+            pruned = prune_anomalies(conn)
+            if len(df_anomalies) > 0:
+                upsert_anomalies(conn, df_anomalies)
+            save_state(conn, {
+                **config, 'days': baseline.n, 'mean': baseline.mean, 'm2': baseline.m2,
+                'last_date': df_scored['date_recorded'].iloc[-1], 'watermark': watermark,
+            })
+        
+        logger.info(f"[SUCCESS] Updated mdi_daily table with z_scores ({updated} rows changed)")
+        if pruned:
+            logger.info(f"[SUCCESS] Removed {pruned} days from 'anomaly_log' that no longer score as anomalies")
+        
+        if len(df_anomalies) > 0:
+            logger.info(f"[SUCCESS] Upserted {len(df_anomalies)} anomalies into 'anomaly_log' table")
             
             # Print anomalies
             logger.info(f"\n Anomalies Detected:")
             for _, row in df_anomalies.iterrows():
                 logger.info(f"  {row['date_of_anomaly']}: {row['severity'].upper()} | MDI={row['mdi_score']:.2f} | z={row['z_score']:.2f}")
         
-        # Update mdi_daily with z_scores
-        with engine.connect() as conn:
-            for _, row in df_mdi.iterrows():
-                conn.execute(
-                    text("""
-                        UPDATE mdi_daily 
-                        SET z_score = :z_score
-                        WHERE date_recorded = :date_recorded
-                    """),
-                    {"z_score": row['z_score'], "date_recorded": row['date_recorded']}
-                )
-            conn.commit()
-        
-        logger.info("[SUCCESS] Updated mdi_daily table with z_scores")
-        
-        engine.dispose()
         return df_anomalies if len(df_anomalies) > 0 else None
     
     except Exception as e:
         logger.error(f"[ERROR] Error detecting anomalies: {e}", exc_info=True)
         raise
+    
+    finally:
+        if owns_engine:
+            engine.dispose()
 
 if __name__ == '__main__':
     df_anomalies = detect_anomalies()
+    refresh_mdi_summary()
     logger.info("[SUCCESS] Anomaly detection complete!")
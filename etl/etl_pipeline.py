@@ -4,12 +4,28 @@ Optimized for Screen Time and App Usage Dataset (iOS/Android) from Kaggle.
 """
 
 import pandas as pd
+import hashlib
+import json
 import logging
+import os
+import re
+from collections import Counter
 from datetime import datetime
 from pathlib import Path
-from .config import DATA_RAW, DATA_PROCESSED, FEED_APPS, MIDNIGHT_HOURS, LOG_FILE
+from .config import (
+    DATA_RAW, DATA_PROCESSED, FEED_APPS, MIDNIGHT_HOURS, LOG_FILE, CHUNK_SIZE, INTERMEDIATE_FORMAT, WEEKDAY_NAMES,
+    FEED_APP_ALIASES, FEED_APP_PATTERNS, NON_FEED_APP_PATTERNS, FEED_APP_RULES_FILE, FEED_APP_CACHE,
+    USER_TIMEZONES_FILE, SOURCE_TIMEZONE, DEFAULT_USER_TIMEZONE
+)
+from .columnar import write_sessions
+from .metrics import instrument, verbose, run_id, data_profile
+from .profiling import SessionProfile, summary_lines, record_profile
 import numpy as np
 
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:  # pandas < 2.2
+    from pandas._libs.tslibs.parsing import guess_datetime_format
 
 # Configure logging with UTF-8 encoding for Windows compatibility
 logging.basicConfig(
@@ -22,6 +38,7 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
 def load_raw_csv(csv_path):
     """Load raw CSV from Kaggle dataset."""
     logger.info(f"Loading raw CSV from {csv_path}")
@@ -30,10 +47,279 @@ def load_raw_csv(csv_path):
     logger.info(f"Columns: {list(df.columns)}")
     return df
 
-def parse_and_validate_timestamps(df):
+def iter_raw_csv(csv_path, chunk_size=CHUNK_SIZE):
+    """Yield the raw CSV as DataFrames of at most chunk_size rows."""
+    logger.info(f"Streaming raw CSV from {csv_path} in chunks of {chunk_size} rows")
+    with pd.read_csv(csv_path, chunksize=chunk_size) as reader:
+        for chunk in reader:
+            yield chunk
+
+# Strings pd.to_datetime skips when inferring the format from the first value
+SKIPPED_DATE_STRINGS = {'', 'now', 'today', 'NaT', 'nat', 'NAT', 'nan', 'NaN', 'NAN'}
+
+# Dates are memoised when at most this share of a sample of rows is distinct;
+# near-unique timestamps parse faster without factorizing first
+MEMO_SAMPLE_ROWS = 10_000
+MEMO_MAX_UNIQUE_SHARE = 0.5
+
+# Distinct date strings a DateParser remembers across chunks
+DATE_CACHE_SIZE = 100_000
+
+def first_date_value(dates):
+    """The value pd.to_datetime infers the format from (None if there is none)."""
+    for value in dates:
+        if pd.isna(value) or (isinstance(value, str) and value in SKIPPED_DATE_STRINGS):
+            continue
+        return value
+    return None
+
+def infer_date_format(dates):
+    """
+    Guess the strftime format pandas would infer for a date column.
+    Mirrors pd.to_datetime, which infers from the first non-null value.
+    Returns None when no single format fits (per-element parsing).
+    """
+    value = first_date_value(dates)
+    return guess_datetime_format(value) if isinstance(value, str) else None
+
+def sniff_date_formats(values, sample_size=200):
+    """
+    Formats of a sample of distinct date strings, most common first.
+    
+    Only formats that parse a value exactly as pandas' per-element parser
+    does are kept: a four-digit year, month before day (or a month name),
+    no UTC offset, and agreement with that parser on the sample.
+    """
+    sample = pd.Index([value for value in values[:sample_size] if isinstance(value, str)], dtype=object)
+    reference = pd.to_datetime(sample, format='mixed', errors='coerce')
+    if reference.dtype != 'datetime64[ns]':
+        return []
+    
+    formats = []
+    for date_format, _ in Counter(filter(None, map(guess_datetime_format, sample))).most_common():
+        if '%Y' not in date_format or '%z' in date_format or '%Z' in date_format:
+            continue
+        if '%d' in date_format and '%m' in date_format and date_format.index('%d') < date_format.index('%m'):
+            continue
+        parsed = pd.to_datetime(sample, format=date_format, errors='coerce')
+        if (parsed[parsed.notna()] == reference[parsed.notna()]).all():
+            formats.append(date_format)
+    return formats
+
+class DateParser:
+    """
+    Parse raw date values like pd.to_datetime(errors='coerce'), faster.
+    
+    The format is pinned from the first non-null value, as pandas infers
+    it, and reused for every later chunk. Repeated dates are parsed once
+    per distinct string and mapped back to their rows, and parsed strings
+    are remembered across chunks. When no single format fits, pandas
+    parses values one by one; here the safe formats sniffed from a sample
+    are tried first and only the values they reject are parsed one by one.
+    Either way every value parses (or fails) exactly as it would today.
+    """
+    
+    def __init__(self, date_format=None):
+        self.date_format = date_format
+        self.fallback_formats = None
+        self._cache = pd.Series([], index=pd.Index([], dtype=object), dtype='datetime64[ns]')
+    
+    def parse(self, dates):
+        """Return dates as a datetime64 Series, NaT where unparseable."""
+        if dates.dtype != object:
+            # Already datetimes or numbers: nothing to sniff or memoise
+            return pd.to_datetime(dates, errors='coerce')
+        if self.date_format is None:
+            if first_date_value(dates) is None:
+                return pd.to_datetime(dates, errors='coerce')
+            self.date_format = infer_date_format(dates) or 'mixed'
+        
+        if self.date_format != 'mixed' and not self._repeats(dates):
+            return pd.to_datetime(dates, format=self.date_format, errors='coerce', cache=False)
+        
+        codes, uniques = pd.factorize(dates)
+        if self.date_format == 'mixed' and self.fallback_formats is None:
+            self.fallback_formats = sniff_date_formats(uniques)
+        
+        # One slot per distinct value, plus NaT for missing values (code -1)
+        values = np.full(len(uniques) + 1, np.datetime64('NaT'), dtype='datetime64[ns]')
+        known = self._cache.index.get_indexer(uniques)
+        hit = known >= 0
+        values[:-1][hit] = self._cache.to_numpy()[known[hit]]
+        
+        new = uniques[~hit]
+        parsed = self._parse_distinct(new)
+        if parsed is None:
+            # Timezone-aware or mixed-offset values: leave them to pandas as before
+            return pd.to_datetime(dates, format=self.date_format, errors='coerce')
+        values[:-1][~hit] = parsed
+        if len(new) > 0 and len(self._cache) < DATE_CACHE_SIZE:
+            self._cache = pd.concat([self._cache, pd.Series(parsed, index=new)])
+        return pd.Series(values[codes], index=dates.index, name=dates.name)
+    
+    @staticmethod
+    def _repeats(dates):
+        sample = dates.iloc[:MEMO_SAMPLE_ROWS]
+        return sample.nunique() <= MEMO_MAX_UNIQUE_SHARE * len(sample)
+    
+    def _parse_distinct(self, values):
+        """Parse distinct values to datetime64[ns]; None if they don't parse to naive datetimes."""
+        if self.date_format != 'mixed':
+            parsed = pd.to_datetime(values, format=self.date_format, errors='coerce')
+            return parsed.to_numpy() if parsed.dtype == 'datetime64[ns]' else None
+        
+        result = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[ns]')
+        rest = np.flatnonzero([isinstance(value, str) for value in values])
+        for date_format in self.fallback_formats:
+            if len(rest) == 0:
+                break
+            parsed = pd.to_datetime(values[rest], format=date_format, errors='coerce')
+            ok = parsed.notna()
+            result[rest[ok]] = parsed[ok].to_numpy()
+            rest = rest[~ok]
+        
+        # Whatever no fallback format parsed (and non-strings) go value by value
+        rest = np.union1d(rest, np.flatnonzero([not isinstance(value, str) for value in values]))
+        if len(rest) > 0:
+            parsed = pd.to_datetime(values[rest], format='mixed', errors='coerce')
+            if parsed.dtype != 'datetime64[ns]':
+                return None
+            result[rest] = parsed.to_numpy()
+        return result
+
+# Nanoseconds per day, and the offset of a day on which a timezone's offset changes
+DAY_NS = 86_400 * 10**9
+CHANGING = np.iinfo(np.int64).min
+
+def exact_offsets(zone, ns, wall=False):
+    """
+    Local-minus-UTC offsets in ns of UTC instants (or, with wall=True, of
+    wall times in zone: skipped ones shift forward, repeated ones read as
+    standard time), converted by pandas value by value.
+    """
+    values = pd.DatetimeIndex(ns.view('datetime64[ns]'))
+    if wall:
+        utc = values.tz_localize(zone, ambiguous=np.zeros(len(ns), dtype=bool), nonexistent='shift_forward')
+        return ns - utc.asi8
+    return values.tz_localize('UTC').tz_convert(zone).tz_localize(None).asi8 - ns
+
+class LocalClock:
+    """
+    Convert export timestamps to each user's local wall clock.
+    
+    Timestamps read in source_timezone are converted to the timezone
+    user_timezones maps the user to; other users get default_timezone, or
+    keep the export's clock without one. Rows are grouped by timezone and
+    each group is shifted in one step by its UTC offset, looked up per
+    timezone and date in a cache kept across chunks. Only rows on a day
+    whose offset changes (DST) are converted value by value.
+    """
+    
+    def __init__(self, user_timezones, source_timezone='UTC', default_timezone=None):
+        user_timezones = pd.Series(user_timezones, dtype=object)
+        user_timezones.index = pd.to_numeric(user_timezones.index)
+        user_timezones = user_timezones[~user_timezones.index.duplicated(keep='last')]
+        zones = set(user_timezones) | {source_timezone}
+        if default_timezone:
+            zones.add(default_timezone)
+        self.zones = sorted(zones)
+        unknown = [zone for zone in self.zones if not self._valid(zone)]
+        if unknown:
+            raise ValueError(f"Unknown timezones: {', '.join(unknown)}")
+        
+        self.source_timezone = source_timezone
+        self._users = pd.Index(user_timezones.index)
+        # Zone code per mapped user, then the default's (-1: keep the export's clock) for the rest;
+        # int16 codes let the stable sort by zone run as a radix sort
+        default_zone = self.zones.index(default_timezone) if default_timezone else -1
+        zone_codes = pd.Index(self.zones).get_indexer(user_timezones.to_numpy())
+        self._user_zones = np.append(zone_codes, default_zone).astype(np.int16)
+        self._offsets = {}
+    
+    @staticmethod
+    def _valid(zone):
+        try:
+            pd.Timestamp('2000-01-01').tz_localize(zone)
+            return True
+        except Exception:
+            return False
+    
+    @classmethod
+    def from_config(cls, path=USER_TIMEZONES_FILE, source_timezone=SOURCE_TIMEZONE,
+                    default_timezone=DEFAULT_USER_TIMEZONE):
+        """A clock from the user_id,timezone CSV at path; None when no path is configured."""
+        if not path:
+            return None
+        df = pd.read_csv(path, usecols=['user_id', 'timezone'], dtype={'timezone': str})
+        df = df.dropna()
+        clock = cls(df.set_index('user_id')['timezone'], source_timezone, default_timezone or None)
+        logger.info(f"[SUCCESS] Loaded timezones of {len(clock._users)} users from {path} "
+                    f"({len(clock.zones)} zones, export clock {source_timezone})")
+        return clock
+    
+    def localize(self, timestamps, user_ids):
+        """Each row's timestamp on its user's local clock, as a naive datetime64 Series."""
+        if timestamps.dt.tz is not None:
+            # Timestamps with their own offset: that is the source clock
+            utc = timestamps.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy().view('i8')
+            timestamps = timestamps.dt.tz_localize(None)
+        else:
+            utc = None
+        wall = timestamps.to_numpy(dtype='datetime64[ns]').view('i8')
+        local = wall.copy()
+        
+        zone_codes = self._user_zones[self._users.get_indexer(pd.to_numeric(user_ids, errors='coerce'))]
+        order = np.argsort(zone_codes, kind='stable')
+        bounds = np.searchsorted(zone_codes[order], np.arange(len(self.zones) + 1))
+        
+        valid = ~np.isnat(timestamps.to_numpy(dtype='datetime64[ns]'))
+        for code, zone in enumerate(self.zones):
+            rows = order[bounds[code]:bounds[code + 1]]
+            rows = rows[valid[rows]]
+            if len(rows) == 0:
+                continue
+            if utc is not None:
+                instants = utc[rows]
+            elif self.source_timezone == 'UTC':
+                instants = wall[rows]
+            else:
+                instants = self._shift(self.source_timezone, wall[rows], wall=True)
+            local[rows] = self._shift(zone, instants)
+        return pd.Series(local.view('datetime64[ns]'), index=timestamps.index, name=timestamps.name)
+    
+    def _shift(self, zone, ns, wall=False):
+        """UTC instants to wall times in zone, or wall times to UTC instants with wall=True."""
+        days = ns // DAY_NS
+        first = days.min()
+        offsets = self._day_offsets(zone, first, np.bincount(days - first) > 0, wall)[days - first]
+        changing = offsets == CHANGING
+        if changing.any():
+            offsets[changing] = exact_offsets(zone, ns[changing], wall)
+        return ns - offsets if wall else ns + offsets
+    
+    def _day_offsets(self, zone, first, present, wall):
+        """Offsets of the days first + i with present[i] (CHANGING where the offset changes that day)."""
+        cache = self._offsets.setdefault((zone, wall), {})
+        days = (first + np.flatnonzero(present)).tolist()
+        missing = [day for day in days if day not in cache]
+        if missing:
+            starts = np.array(missing, dtype=np.int64) * DAY_NS
+            start_offsets = exact_offsets(zone, starts, wall)
+            end_offsets = exact_offsets(zone, starts + (DAY_NS - 1), wall)
+            cache.update(zip(missing, np.where(start_offsets == end_offsets, start_offsets, CHANGING).tolist()))
+        offsets = np.zeros(len(present), dtype=np.int64)
+        offsets[present] = [cache[day] for day in days]
+        return offsets
+
+@instrument(kind='step')
+def parse_and_validate_timestamps(df, date_format=None, parser=None, clock=None):
     """
     Parse date column and create hour, weekday columns.
     Handles both date-only and timestamp formats.
+    parser (a DateParser) carries the pinned format and parsed dates
+    across chunks; otherwise one is created, pinned to date_format or
+    to the format pandas would infer. With clock (a LocalClock), hour,
+    date and weekday are taken on each user's local clock.
     """
     logger.info("Parsing and validating timestamps...")
     
@@ -42,10 +328,13 @@ def parse_and_validate_timestamps(df):
         logger.error(f"No 'date' column found! Available: {list(df.columns)}")
         raise ValueError("Date column not found")
     
-    # Use pandas default inference - handles all timestamp formats
+    parser = parser or DateParser(date_format)
     try:
-        df['date'] = pd.to_datetime(df['date'], errors='coerce')
-        logger.info("Successfully parsed dates using pandas inference")
+        df['date'] = parser.parse(df['date'])
+        if parser.date_format == 'mixed':
+            logger.info(f"Parsed dates per value (fallback formats: {parser.fallback_formats})")
+        else:
+            logger.info(f"Successfully parsed dates using format {parser.date_format}")
     except Exception as e:
         logger.error(f"Failed to parse dates: {e}")
         raise
@@ -54,70 +343,314 @@ def parse_and_validate_timestamps(df):
     invalid_dates = df[df['date'].isna()].shape[0]
     if invalid_dates > 0:
         logger.warning(f"Found {invalid_dates} rows with invalid dates, removing...")
-        df = df[df['date'].notna()]
+        df = df[df['date'].notna()].copy()
     
     # Extract hour from timestamp (important for "midnight" detection)
-    if 'hour' not in df.columns:
-        df['hour'] = df['date'].dt.hour
+    hour_given = 'hour' in df.columns
+    if not hour_given:
+        df['hour'] = df['date'].dt.hour.astype('int8')
         logger.info("Extracted hour from timestamp")
     else:
-        df['hour'] = df['hour'].astype(int)
+        # Exported hours must be whole hours of the day before they are narrowed to int8
+        hours = pd.to_numeric(df['hour'], errors='coerce')
+        valid_hours = hours.between(0, 23)
+        if not pd.api.types.is_integer_dtype(hours):
+            valid_hours &= hours % 1 == 0
+        invalid_hours = int((~valid_hours).sum())
+        if invalid_hours > 0:
+            logger.warning(f"Found {invalid_hours} rows with hours outside 0-23, removing...")
+            df = df[valid_hours].copy()
+            hours = hours[valid_hours]
+        df['hour'] = hours.astype('int8')
+    
+    if clock is not None:
+        if 'user_id' not in df.columns:
+            raise ValueError("user_id column needed for per-user timezones")
+        # An export with date and hour columns: the session starts at that hour of the date
+        exported = df['date'].dt.normalize() + pd.to_timedelta(df['hour'], unit='h') if hour_given else df['date']
+        df['date'] = clock.localize(exported, df['user_id'])
+        df['hour'] = df['date'].dt.hour.astype('int8')
+        logger.info("Converted timestamps to each user's local time")
     
-    # Create date_only and weekday
-    df['date_only'] = df['date'].dt.date
-    df['weekday'] = df['date'].dt.day_name()
+    # Create date_only (datetime64 at midnight) and weekday (categorical, int8 codes)
+    df['date_only'] = df['date'].dt.normalize()
+    df['weekday'] = pd.Categorical.from_codes(
+        df['date'].dt.dayofweek.to_numpy().astype('int8'), categories=WEEKDAY_NAMES
+    )
     
     logger.info(f"After parsing: {len(df)} valid rows")
     logger.info(f"Date range: {df['date_only'].min()} to {df['date_only'].max()}")
-    logger.info(f"Hour distribution:\n{df['hour'].value_counts().sort_index()}")
+    if verbose():
+        logger.info(f"Hour distribution:\n{df['hour'].value_counts().sort_index()}")
     
     return df
 
-def flag_feed_apps(df):
-    """Flag rows where app_name is a feed-based app."""
+def feed_app_rules(rules_file=FEED_APP_RULES_FILE):
+    """The feed-app rules of config, extended by the JSON rules_file if one is set."""
+    rules = {
+        'feed_apps': sorted(FEED_APPS),
+        'aliases': dict(FEED_APP_ALIASES),
+        'patterns': list(FEED_APP_PATTERNS),
+        'non_feed_patterns': list(NON_FEED_APP_PATTERNS),
+    }
+    if rules_file:
+        with open(rules_file, encoding='utf-8') as f:
+            extra = json.load(f)
+        unknown = set(extra) - set(rules)
+        if unknown:
+            raise ValueError(f"Unknown feed-app rule keys in {rules_file}: {', '.join(sorted(unknown))}")
+        feed_apps = set(rules['feed_apps']) | {normalize_app_name(app) for app in extra.get('feed_apps', [])}
+        rules['feed_apps'] = sorted(feed_apps)
+        rules['aliases'].update(extra.get('aliases', {}))
+        rules['patterns'] += extra.get('patterns', [])
+        rules['non_feed_patterns'] += extra.get('non_feed_patterns', [])
+    return rules
+
+def normalize_app_name(name):
+    """Lowercase, strip and collapse inner whitespace: ' YouTube  Shorts' -> 'youtube shorts'."""
+    return ' '.join(str(name).lower().split())
+
+class AppClassifier:
+    """
+    Feed-app flags of distinct app names, remembered across chunks and runs.
+    
+    A name is normalised and mapped through the aliases, then it is a feed
+    app if it is in FEED_APPS, not if it matches a non-feed pattern, and
+    otherwise if it matches a feed pattern - so "Instagram Lite" and
+    "YouTube Shorts (beta)" count while "YouTube Music" doesn't. Each raw
+    name is classified once; flags() only looks up the categories of a
+    chunk, so the cost grows with the number of distinct apps, not rows.
+    Saved flags are discarded on load when the rules have changed.
+    """
+    
+    def __init__(self, rules=None):
+        self.rules = rules or feed_app_rules()
+        self.feed_apps = set(self.rules['feed_apps'])
+        self.aliases = {normalize_app_name(k): normalize_app_name(v) for k, v in self.rules['aliases'].items()}
+        self.patterns = [re.compile(p) for p in self.rules['patterns']]
+        self.non_feed_patterns = [re.compile(p) for p in self.rules['non_feed_patterns']]
+        self.fingerprint = hashlib.sha256(json.dumps(self.rules, sort_keys=True).encode()).hexdigest()[:16]
+        self._flags = {}
+        self.classified = 0
+    
+    def __len__(self):
+        return len(self._flags)
+    
+    def classify(self, name):
+        """Whether one app name is a feed app (not cached)."""
+        name = normalize_app_name(name)
+        name = self.aliases.get(name, name)
+        if name in self.feed_apps:
+            return True
+        if any(p.search(name) for p in self.non_feed_patterns):
+            return False
+        return any(p.search(name) for p in self.patterns)
+    
+    def flags(self, names):
+        """Boolean array of feed flags for distinct names (e.g. a categorical's categories)."""
+        cache = self._flags
+        for name in names:
+            if name not in cache:
+                cache[name] = self.classify(name)
+                self.classified += 1
+        return np.fromiter((cache[name] for name in names), dtype=bool, count=len(names))
+    
+    def save(self, path):
+        """Persist the flags with the rules' fingerprint, replacing path atomically."""
+        path = Path(path)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': self.fingerprint, 'flags': self._flags}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path, rules=None):
+        """Restore flags saved by save(); none if the file is missing or the rules differ."""
+        classifier = cls(rules)
+        if Path(path).exists():
+            with open(path, encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('fingerprint') == classifier.fingerprint:
+                classifier._flags.update(saved['flags'])
+            else:
+                logger.info("Feed-app rules changed; re-classifying app names")
+        return classifier
+
+@instrument(kind='step')
+def flag_feed_apps(df, classifier=None):
+    """
+    Flag rows where app_name is a feed-based app.
+    classifier (an AppClassifier) keeps the flags of app names across
+    chunks; otherwise one is created from the configured rules.
+    """
     logger.info("Flagging feed apps...")
     
     # Handle different column names
     if 'app_name' not in df.columns:
         if 'App Name' in df.columns:
-            df.rename(columns={'App Name': 'app_name'}, inplace=True)
+            df = df.rename(columns={'App Name': 'app_name'})
         elif 'app' in df.columns:
-            df.rename(columns={'app': 'app_name'}, inplace=True)
+            df = df.rename(columns={'app': 'app_name'})
     
-    df['app_name_lower'] = df['app_name'].str.lower().str.strip()
-    df['is_feed_app'] = df['app_name_lower'].isin(FEED_APPS)
+    # Classify each distinct app once, then broadcast the flag by category code
+    df['app_name'] = df['app_name'].astype('category')
+    categories = df['app_name'].cat.categories
+    if classifier is None:
+        classifier = AppClassifier()
+    feed_categories = classifier.flags(categories.astype(str))
+    codes = df['app_name'].cat.codes.to_numpy()
+    df['is_feed_app'] = np.where(codes >= 0, feed_categories[codes], False)
     
     feed_count = df['is_feed_app'].sum()
     logger.info(f"Found {feed_count} feed app sessions out of {len(df)}")
-    logger.info(f"Feed apps in data: {sorted(df[df['is_feed_app']]['app_name'].unique())}")
+    if verbose():
+        logger.info(f"Feed apps in data: {sorted(categories[feed_categories])}")
     
-    return df.drop(columns=['app_name_lower'])
+    return df
 
+@instrument(kind='step')
 def flag_midnight_sessions(df):
     """Flag rows where hour is between 00:00 and 05:59."""
     logger.info("Flagging midnight sessions (00:00–05:59)...")
-    df['is_midnight'] = df['hour'].astype(int).isin(MIDNIGHT_HOURS)
+    df['is_midnight'] = df['hour'].isin(MIDNIGHT_HOURS)
     midnight_count = df['is_midnight'].sum()
     logger.info(f"Found {midnight_count} midnight sessions")
     return df
 
-def clean_data(df):
-    """Remove or impute invalid/missing data."""
+class SeenKeys:
+    """
+    Natural keys (user_id, app_name, date, hour) already emitted by earlier
+    chunks, kept exactly so no distinct session is ever dropped.
+    
+    Each key is packed into one int64 - user_id, an app code and the hour,
+    grouped by date in sorted arrays - so memory is the chunk being
+    filtered plus KEY_BYTES per distinct key seen (nbytes), about a tenth
+    of a Python set of hashes. That is the bound: removing duplicates
+    across an unsorted export needs every earlier key, and the sessions
+    unique index (schema version 03) still rejects any duplicate at load.
+    """
+    
+    KEY_BYTES = 8
+    # key = (user_id + 2^31) << 31 | app code << 5 | hour
+    APP_BITS = 26
+    HOUR_BITS = 5
+    
+    def __init__(self):
+        self._apps = {}
+        self._days = {}
+    
+    def __len__(self):
+        return sum(len(keys) for keys in self._days.values())
+    
+    @property
+    def nbytes(self):
+        """Bytes held by the stored keys."""
+        return sum(keys.nbytes for keys in self._days.values())
+    
+    def _app_codes(self, apps):
+        """Code of each app name, assigning new codes in order of first appearance."""
+        apps = apps.astype('category')
+        for name in apps.cat.categories:
+            self._apps.setdefault(name, len(self._apps))
+        if len(self._apps) >= 1 << self.APP_BITS:
+            raise ValueError(f"More than {1 << self.APP_BITS} distinct app names")
+        lookup = np.array([self._apps[name] for name in apps.cat.categories] + [0], dtype=np.int64)
+        return lookup[apps.cat.codes.to_numpy()]
+    
+    def pack(self, df, subset):
+        """(day number, packed key) arrays of df's rows; subset names the user, app, date and hour columns."""
+        user, app, date, hour = subset
+        hours = df[hour].to_numpy(dtype=np.int64)
+        if len(hours) and (hours.min() < 0 or hours.max() >= 1 << self.HOUR_BITS):
+            raise ValueError(f"Hours outside 0-{(1 << self.HOUR_BITS) - 1} in '{hour}'")
+        days = pd.to_datetime(df[date]).to_numpy(dtype='datetime64[D]').astype(np.int64)
+        keys = (df[user].to_numpy(dtype=np.int64) - USER_ID_MIN) << (self.APP_BITS + self.HOUR_BITS)
+        keys |= self._app_codes(df[app]) << self.HOUR_BITS
+        keys |= hours
+        return days, keys
+    
+    def filter_new(self, df, subset):
+        """Drop rows whose key was seen before (or earlier in df) and remember the rest."""
+        days, keys = self.pack(df, subset)
+        keep = np.zeros(len(df), dtype=bool)
+        # Rows grouped by day, first occurrences first
+        order = np.lexsort((np.arange(len(df)), keys, days))
+        sorted_days = days[order]
+        day_starts = np.flatnonzero(np.r_[True, sorted_days[1:] != sorted_days[:-1]]) if len(df) else []
+        for start, stop in zip(day_starts, np.append(day_starts[1:], len(df))):
+            rows = order[start:stop]
+            day_keys = keys[rows]
+            new = np.ones(len(rows), dtype=bool)
+            new[1:] = day_keys[1:] != day_keys[:-1]
+            seen = self._days.get(days[rows[0]], np.empty(0, dtype=np.int64))
+            if len(seen):
+                positions = np.minimum(np.searchsorted(seen, day_keys), len(seen) - 1)
+                new &= seen[positions] != day_keys
+            keep[rows[new]] = True
+            if new.any():
+                self._days[days[rows[0]]] = np.union1d(seen, day_keys[new])
+        return df[keep]
+    
+    def update(self, other):
+        """Add the keys of another SeenKeys (its app codes are mapped onto this one's)."""
+        names = sorted(other._apps, key=other._apps.get)
+        remap = self._app_codes(pd.Series(names, dtype=object)) if names else np.empty(0, dtype=np.int64)
+        app_mask = ((1 << self.APP_BITS) - 1) << self.HOUR_BITS
+        for day, keys in other._days.items():
+            keys = (keys & ~app_mask) | (remap[(keys & app_mask) >> self.HOUR_BITS] << self.HOUR_BITS)
+            self._days[day] = np.union1d(self._days.get(day, np.empty(0, dtype=np.int64)), keys)
+    
+    def save(self, path):
+        """Persist the keys so a later run can continue deduplicating."""
+        days = np.array(sorted(self._days), dtype=np.int64)
+        with open(path, 'wb') as f:
+            np.savez(
+                f, apps=np.array(sorted(self._apps, key=self._apps.get), dtype=object), days=days,
+                counts=np.array([len(self._days[day]) for day in days], dtype=np.int64),
+                keys=np.concatenate([self._days[day] for day in days]) if len(days) else np.empty(0, dtype=np.int64),
+            )
+    
+    @classmethod
+    def load(cls, path):
+        """Restore keys saved by save(); an empty set if the file doesn't exist."""
+        seen_keys = cls()
+        if not Path(path).exists():
+            return seen_keys
+        data = np.load(path, allow_pickle=True)
+        if not isinstance(data, np.lib.npyio.NpzFile):
+            # Hashed keys from before exact keys; the unique index still rejects those sessions at load
+            logger.warning(f"[WARNING]  {path} holds hashed keys from an older version; starting with no keys")
+            return seen_keys
+        seen_keys._apps = {name: code for code, name in enumerate(data['apps'].tolist())}
+        bounds = np.cumsum(data['counts'])
+        for day, keys in zip(data['days'].tolist(), np.split(data['keys'], bounds[:-1])):
+            seen_keys._days[day] = keys
+        return seen_keys
+
+# sessions.user_id is an INTEGER, so ids outside int32 are rejected rather than wrapped
+USER_ID_MIN, USER_ID_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+@instrument(kind='step')
+def clean_data(df, seen_keys=None):
+    """
+    Remove or impute invalid/missing data.
+    seen_keys (a SeenKeys) extends duplicate removal across chunks.
+    """
     logger.info("Cleaning data...")
     
     # Rename screen_time_min to duration_minutes (YOUR CSV HAS THIS)
     if 'screen_time_min' in df.columns:
-        df.rename(columns={'screen_time_min': 'duration_minutes'}, inplace=True)
+        df = df.rename(columns={'screen_time_min': 'duration_minutes'})
         logger.info("Renamed 'screen_time_min' to 'duration_minutes'")
     # Check for other variations
     elif 'screen_time' in df.columns:
-        df.rename(columns={'screen_time': 'duration_minutes'}, inplace=True)
+        df = df.rename(columns={'screen_time': 'duration_minutes'})
     elif 'Screen Time' in df.columns:
-        df.rename(columns={'Screen Time': 'duration_minutes'}, inplace=True)
+        df = df.rename(columns={'Screen Time': 'duration_minutes'})
     elif 'duration' in df.columns:
-        df.rename(columns={'duration': 'duration_minutes'}, inplace=True)
+        df = df.rename(columns={'duration': 'duration_minutes'})
     elif 'Duration' in df.columns:
-        df.rename(columns={'Duration': 'duration_minutes'}, inplace=True)
+        df = df.rename(columns={'Duration': 'duration_minutes'})
     
     # Remove rows with missing critical values
     initial_count = len(df)
@@ -131,20 +664,31 @@ def clean_data(df):
     
     # Remove rows with invalid durations
     if 'duration_minutes' in df.columns:
-        df = df[(df['duration_minutes'] > 0) & (df['duration_minutes'] <= 1000)]
+        df = df[(df['duration_minutes'] > 0) & (df['duration_minutes'] <= 1000)].copy()
         logger.info(f"Kept rows with duration in (0, 1000] minutes")
     
-    # Ensure numeric columns
+    # Ensure numeric columns; user ids must be whole numbers that fit sessions.user_id (INTEGER)
     if 'user_id' in df.columns:
-        df['user_id'] = pd.to_numeric(df['user_id'], errors='coerce').fillna(0).astype(int)
+        user_ids = pd.to_numeric(df['user_id'], errors='coerce')
+        valid_ids = user_ids.between(USER_ID_MIN, USER_ID_MAX)
+        if not pd.api.types.is_integer_dtype(user_ids):
+            valid_ids &= user_ids % 1 == 0
+        invalid_ids = int((~valid_ids).sum())
+        if invalid_ids > 0:
+            logger.warning(f"Found {invalid_ids} rows with user ids that are not INTEGER values, removing...")
+            df = df[valid_ids].copy()
+            user_ids = user_ids[valid_ids]
+        df['user_id'] = user_ids.astype('int32')
     if 'duration_minutes' in df.columns:
-        df['duration_minutes'] = pd.to_numeric(df['duration_minutes'], errors='coerce')
+        df['duration_minutes'] = pd.to_numeric(df['duration_minutes'], errors='coerce').astype(float)
     
     # Remove duplicates
     initial_count = len(df)
     subset_cols = [col for col in ['user_id', 'app_name', 'date_only', 'hour'] if col in df.columns]
     if subset_cols:
         df = df.drop_duplicates(subset=subset_cols, keep='first')
+        if seen_keys is not None:
+            df = seen_keys.filter_new(df, subset_cols)
     
     dropped_duplicates = initial_count - len(df)
     if dropped_duplicates > 0:
@@ -154,49 +698,88 @@ def clean_data(df):
     return df
 
 
-def transform_pipeline(csv_path):
-    """Run full ETL transformation pipeline."""
+@instrument(kind='step')
+def select_output_columns(df):
+    """Rename and order columns to match the 'sessions' table schema."""
+    # Rename columns for database schema
+    df = df.rename(columns={
+        'date_only': 'session_date',
+        'weekday': 'session_weekday',
+        'hour': 'session_hour'
+    })
+    
+    # Handle app_category if it exists
+    if 'app_category' not in df.columns:
+        if 'App Category' in df.columns:
+            df = df.rename(columns={'App Category': 'app_category'})
+        elif 'category' in df.columns:
+            df = df.rename(columns={'category': 'app_category'})
+        else:
+            df['app_category'] = 'Unknown'
+    df['app_category'] = df['app_category'].astype('category')
+    
+    # Select and order columns for database insertion
+    output_cols = [
+        'user_id', 'app_name', 'session_date', 'session_hour', 'session_weekday',
+        'duration_minutes', 'app_category', 'is_feed_app', 'is_midnight'
+    ]
+    return df[[col for col in output_cols if col in df.columns]]
+
+def transform_frame(df, parser=None, clock=None, classifier=None, seen_keys=None):
+    """
+    Run the transform steps on one raw frame (a whole export, a chunk or a
+    micro-batch); parser, clock, classifier and seen_keys carry state
+    across frames as in parse_and_validate_timestamps, flag_feed_apps and
+    clean_data.
+    """
+    df = parse_and_validate_timestamps(df, parser=parser, clock=clock)
+    df = flag_feed_apps(df, classifier=classifier)
+    df = flag_midnight_sessions(df)
+    df = clean_data(df, seen_keys=seen_keys)
+    return select_output_columns(df)
+
+def save_app_classes(classifier, path=FEED_APP_CACHE):
+    """Save the classifier's flags if it classified new names; a failed save only costs a re-classification."""
+    if classifier.classified == 0:
+        return
+    try:
+        classifier.save(path)
+    except OSError as e:
+        logger.warning(f"[WARNING]  Could not save feed-app flags to {path}: {e}")
+
+@instrument(kind='task')
+def transform_pipeline(csv_path, classifier=None, profile=None):
+    """
+    Run full ETL transformation pipeline.
+    classifier defaults to the feed-app flags saved by earlier runs; the
+    output is added to profile (a SessionProfile) when one is given, and
+    profiled for the summary only then or when verbose.
+    """
     try:
         # Extract
         df = load_raw_csv(csv_path)
         
         # Transform
-        df = parse_and_validate_timestamps(df)
-        df = flag_feed_apps(df)
-        df = flag_midnight_sessions(df)
-        df = clean_data(df)
-        
-        # Rename columns for database schema
-        df = df.rename(columns={
-            'date_only': 'session_date',
-            'weekday': 'session_weekday',
-            'hour': 'session_hour'
-        })
-        
-        # Handle app_category if it exists
-        if 'app_category' not in df.columns:
-            if 'App Category' in df.columns:
-                df.rename(columns={'App Category': 'app_category'}, inplace=True)
-            elif 'category' in df.columns:
-                df.rename(columns={'category': 'app_category'}, inplace=True)
-            else:
-                df['app_category'] = 'Unknown'
-        
-        # Select and order columns for database insertion
-        output_cols = [
-            'user_id', 'app_name', 'session_date', 'session_hour', 'session_weekday',
-            'duration_minutes', 'app_category', 'is_feed_app', 'is_midnight'
-        ]
-        df = df[[col for col in output_cols if col in df.columns]]
+        app_classes = AppClassifier.load(FEED_APP_CACHE) if classifier is None else classifier
+        df = transform_frame(df, clock=LocalClock.from_config(), classifier=app_classes)
+        if classifier is None:
+            save_app_classes(app_classes)
         
         logger.info(f"[SUCCESS] Transformation complete. Final shape: {df.shape}")
         logger.info(f"\nData Summary:")
-        logger.info(f"  Total sessions: {len(df)}")
-        logger.info(f"  Date range: {df['session_date'].min()} to {df['session_date'].max()}")
-        logger.info(f"  Unique users: {df['user_id'].nunique()}")
-        logger.info(f"  Feed sessions: {df['is_feed_app'].sum()}")
-        logger.info(f"  Midnight sessions: {df['is_midnight'].sum()}")
-        logger.info(f"  Midnight feed sessions: {(df['is_feed_app'] & df['is_midnight']).sum()}")
+        if profile is not None or verbose():
+            frame_profile = SessionProfile()
+            frame_profile.update(df)
+            if profile is not None:
+                profile.merge(frame_profile)
+            for line in summary_lines(frame_profile.summary()):
+                logger.info(line)
+        else:
+            logger.info(f"  Total sessions: {len(df)}")
+            logger.info(f"  Date range: {df['session_date'].min()} to {df['session_date'].max()}")
+            logger.info(f"  Feed sessions: {df['is_feed_app'].sum()}")
+            logger.info(f"  Midnight sessions: {df['is_midnight'].sum()}")
+            logger.info(f"  Midnight feed sessions: {(df['is_feed_app'] & df['is_midnight']).sum()}")
         
         return df
     
@@ -204,14 +787,93 @@ def transform_pipeline(csv_path):
         logger.error(f"Error in transform pipeline: {e}", exc_info=True)
         raise
 
+def transform_pipeline_chunked(csv_path, chunk_size=CHUNK_SIZE, classifier=None, profile=None):
+    """
+    Run the ETL transformation as a generator over fixed-size chunks.
+    
+    Yields cleaned DataFrames whose concatenation equals transform_pipeline's
+    output. Peak memory is bounded by chunk_size plus the hashed keys kept
+    for cross-chunk deduplication. classifier defaults to the feed-app
+    flags saved by earlier runs; app names are classified once per run.
+    Each chunk is added to profile (a SessionProfile) when one is given;
+    chunks are profiled for the summary only then or when verbose.
+    """
+    seen_keys = SeenKeys()
+    date_parser = DateParser()
+    clock = LocalClock.from_config()
+    app_classes = AppClassifier.load(FEED_APP_CACHE) if classifier is None else classifier
+    file_profile = SessionProfile() if profile is not None or verbose() else None
+    total_rows = 0
+    feed_sessions = 0
+    midnight_sessions = 0
+    midnight_feed_sessions = 0
+    min_date = None
+    max_date = None
+    chunk_number = 0
+    
+    try:
+        for chunk_number, df in enumerate(iter_raw_csv(csv_path, chunk_size), start=1):
+            logger.info(f"Transforming chunk {chunk_number} ({len(df)} rows)...")
+            
+            # The parser pins the date format from the first chunk, as pandas
+            # infers it from the first value, so the whole file parses alike
+            df = transform_frame(df, parser=date_parser, clock=clock, classifier=app_classes, seen_keys=seen_keys)
+            if file_profile is not None:
+                file_profile.update(df)
+            elif len(df) > 0:
+                feed_sessions += int(df['is_feed_app'].sum())
+                midnight_sessions += int(df['is_midnight'].sum())
+                midnight_feed_sessions += int((df['is_feed_app'] & df['is_midnight']).sum())
+                chunk_min, chunk_max = df['session_date'].min(), df['session_date'].max()
+                min_date = chunk_min if min_date is None else min(min_date, chunk_min)
+                max_date = chunk_max if max_date is None else max(max_date, chunk_max)
+            total_rows += len(df)
+            
+            yield df
+        
+        if classifier is None:
+            save_app_classes(app_classes)
+        if profile is not None:
+            profile.merge(file_profile)
+        logger.info(f"[SUCCESS] Streaming transformation complete. {total_rows} rows in {chunk_number} chunks")
+        logger.info(f"\nData Summary:")
+        if file_profile is not None:
+            for line in summary_lines(file_profile.summary()):
+                logger.info(line)
+        else:
+            logger.info(f"  Total sessions: {total_rows}")
+            logger.info(f"  Date range: {min_date} to {max_date}")
+            logger.info(f"  Feed sessions: {feed_sessions}")
+            logger.info(f"  Midnight sessions: {midnight_sessions}")
+            logger.info(f"  Midnight feed sessions: {midnight_feed_sessions}")
+        logger.info(f"  Unique dedup keys: {len(seen_keys)}")
+        logger.info(f"  App names classified: {app_classes.classified} new, {len(app_classes)} known")
+    
+    except Exception as e:
+        logger.error(f"Error in streaming transform pipeline: {e}", exc_info=True)
+        raise
+
 def save_cleaned_csv(df, output_path):
     """Save cleaned dataframe to CSV."""
     df.to_csv(output_path, index=False)
     logger.info(f"[SUCCESS] Saved cleaned data to {output_path}")
 
+def save_cleaned_csv_chunks(chunks, output_path):
+    """Stream cleaned chunks to a single CSV, writing the header once."""
+    total_rows = 0
+    header_written = False
+    for df in chunks:
+        df.to_csv(output_path, index=False, mode='a' if header_written else 'w',
+                  header=not header_written)
+        header_written = True
+        total_rows += len(df)
+    logger.info(f"[SUCCESS] Saved {total_rows} cleaned rows to {output_path}")
+    return total_rows
+
 if __name__ == '__main__':
     input_csv = DATA_RAW / 'screen_time_app_usage_dataset.csv'
     output_csv = DATA_PROCESSED / 'cleaned_sessions.csv'
+    output_parquet = DATA_PROCESSED / 'cleaned_sessions.parquet'
     
     if not input_csv.exists():
         logger.error(f" Input CSV not found: {input_csv}")
@@ -220,7 +882,20 @@ if __name__ == '__main__':
         logger.info(f"   And place the CSV file at: {input_csv}")
         exit(1)
     
-    df_clean = transform_pipeline(input_csv)
-    save_cleaned_csv(df_clean, output_csv)
+    profile = SessionProfile() if data_profile() else None
+    if CHUNK_SIZE > 0:
+        df_clean = transform_pipeline_chunked(input_csv, CHUNK_SIZE, profile=profile)
+    else:
+        df_clean = transform_pipeline(input_csv, profile=profile)
+    
+    if INTERMEDIATE_FORMAT == 'csv':
+        if CHUNK_SIZE > 0:
+            save_cleaned_csv_chunks(df_clean, output_csv)
+        else:
+            save_cleaned_csv(df_clean, output_csv)
+    else:
+        write_sessions(df_clean, output_parquet)
+    if profile is not None:
+        record_profile(profile, run_id())
     logger.info("\n[SUCCESS] ETL pipeline completed successfully!")
 
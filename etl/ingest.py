@@ -0,0 +1,291 @@
+"""
+ingest.py - Transform every raw export in a directory in parallel.
+
+Files in DATA_RAW are transformed concurrently in a process pool, each into
+a Parquet part, then merged into the run's own sessions.parquet under
+RUNS_DIR with duplicate sessions removed across files and across runs.
+Parts are merged in order of their content hash, so the output doesn't
+depend on file names or discovery order. A manifest remembers ingested
+files by path, size, mtime and content hash, so re-runs only transform new
+or changed files. A run's manifest entries and dedup keys stay pending next
+to its output until load_to_db has loaded it (commit_run), so a failed load
+is retried rather than skipped. With data profiling on, each worker
+profiles its files' sessions; the profiles are merged into the run's data
+profile, saved once the run is committed.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from .config import (
+    DATA_RAW, DATA_PROCESSED, LOG_FILE, CHUNK_SIZE,
+    INGEST_WORKERS, INGEST_PATTERN, INGEST_MANIFEST, INGEST_KEYS
+)
+from .columnar import write_sessions, iter_sessions
+from .etl_pipeline import transform_pipeline, transform_pipeline_chunked, SeenKeys
+from .metrics import instrument, run_id, data_profile
+from .profiling import SessionProfile, merge_profiles, record_profile
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_FILE, encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Same natural key clean_data deduplicates on, in output column names
+DEDUP_COLUMNS = ['user_id', 'app_name', 'session_date', 'session_hour']
+
+# Per-file transform output, one subdirectory per run (runs may overlap), removed once merged
+PARTS_DIR = DATA_PROCESSED / 'ingest_parts'
+
+# One directory per ingest run: its sessions and pending manifest update, removed once loaded
+RUNS_DIR = DATA_PROCESSED / 'ingest_runs'
+RUN_SESSIONS = 'sessions.parquet'
+RUN_PENDING = 'pending.json'
+RUN_KEYS = 'keys.npy'
+
+def run_parts_dir():
+    """This run's directory for transform parts, so concurrent runs never remove each other's."""
+    return PARTS_DIR / run_id()
+
+def discover_files(directory=DATA_RAW, pattern=INGEST_PATTERN):
+    """Return the raw files under directory matching pattern."""
+    return sorted(path for path in Path(directory).glob(pattern) if path.is_file())
+
+def file_stat(path):
+    """Cheap change check: (size, mtime in ns)."""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def file_digest(path, block_size=1 << 20):
+    """BLAKE2b hash of the file contents."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(path=INGEST_MANIFEST):
+    """Ingested files keyed by resolved path (empty if nothing was ingested yet)."""
+    if not Path(path).exists():
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(manifest, path=INGEST_MANIFEST):
+    # Write then rename, so an interrupted run never leaves a truncated manifest
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def is_ingested(manifest, path):
+    """True if path was ingested before and its size and mtime are unchanged."""
+    entry = manifest.get(str(path))
+    return entry is not None and (entry['size'], entry['mtime_ns']) == file_stat(path)
+
+def transform_file(path, part_path, known_digests=frozenset(), chunk_size=CHUNK_SIZE, profile=False):
+    """
+    Worker task: hash one raw file and, unless its content was ingested
+    before, transform it into a Parquet part. Returns the manifest entry,
+    with the part's data profile when profile is true.
+    """
+    start = time.perf_counter()
+    size, mtime_ns = file_stat(path)
+    digest = file_digest(path)
+    entry = {'size': size, 'mtime_ns': mtime_ns, 'digest': digest, 'rows': 0, 'part': None}
+    
+    if digest in known_digests:
+        entry['duplicate_content'] = True
+    else:
+        part_profile = SessionProfile() if profile else None
+        if chunk_size > 0:
+            frames = transform_pipeline_chunked(path, chunk_size, profile=part_profile)
+        else:
+            frames = transform_pipeline(path, profile=part_profile)
+        entry['rows'] = write_sessions(frames, part_path)
+        entry['part'] = str(part_path)
+        if part_profile is not None:
+            entry['profile'] = part_profile.to_dict()
+    entry['seconds'] = time.perf_counter() - start
+    return str(path), entry
+
+def pending_files(manifest, directory=DATA_RAW, pattern=INGEST_PATTERN):
+    """Return (all files, files new or changed since the manifest was written)."""
+    files = [path.resolve() for path in discover_files(directory, pattern)]
+    return files, [path for path in files if not is_ingested(manifest, path)]
+
+def transform_files(pending, parts_dir, manifest, workers=INGEST_WORKERS):
+    """Transform pending files into Parquet parts in a process pool; returns entries by path."""
+    parts_dir.mkdir(parents=True, exist_ok=True)
+    known_digests = frozenset(entry['digest'] for entry in manifest.values())
+    workers = max(1, min(workers, len(pending)))
+    
+    logger.info(f"Transforming {len(pending)} files across {workers} worker processes...")
+    entries = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(transform_file, path, parts_dir / f"part-{i:05d}.parquet", known_digests,
+                        profile=data_profile())
+            for i, path in enumerate(pending)
+        ]
+        for future in as_completed(futures):
+            path, entry = future.result()
+            entries[path] = entry
+            note = " (content already ingested, skipped)" if entry.get('duplicate_content') else ""
+            logger.info(f"  {Path(path).name}: {entry['rows']} rows in {entry['seconds']:.2f}s{note}")
+    return entries
+
+def iter_new_sessions(entries, seen_keys):
+    """
+    Yield the parts' sessions in content-hash order, dropping sessions
+    whose natural key an earlier part (or run) already produced.
+    """
+    merged_digests = set()
+    for entry in sorted(entries.values(), key=lambda e: e['digest']):
+        if entry['part'] is None or entry['digest'] in merged_digests:
+            continue
+        merged_digests.add(entry['digest'])
+        for df in iter_sessions(entry['part'], batch_size=CHUNK_SIZE or 500_000):
+            yield seen_keys.filter_new(df, DEDUP_COLUMNS)
+
+def run_profile(entries):
+    """Merge the parts' data profiles, each distinct content once as in iter_new_sessions."""
+    profiles = {}
+    for entry in entries.values():
+        if 'profile' in entry:
+            profiles.setdefault(entry['digest'], SessionProfile.from_dict(entry['profile']))
+    return merge_profiles(profiles.values())
+
+def manifest_entries(entries):
+    """Manifest entries for transformed files (without their parts and profiles)."""
+    ingested_at = datetime.now().isoformat(timespec='seconds')
+    return {
+        path: {
+            'size': entry['size'], 'mtime_ns': entry['mtime_ns'], 'digest': entry['digest'],
+            'rows': entry['rows'], 'ingested_at': ingested_at,
+        }
+        for path, entry in entries.items()
+    }
+
+def record_ingested(manifest, entries, seen_keys):
+    """Add entries to the manifest and persist it with the dedup keys and the run's data profile."""
+    manifest.update(manifest_entries(entries))
+    seen_keys.save(INGEST_KEYS)
+    save_manifest(manifest)
+    if any('profile' in entry for entry in entries.values()):
+        record_profile(run_profile(entries), run_id())
+
+def pending_runs(runs_dir=RUNS_DIR):
+    """Ingest runs written but not yet loaded, oldest first."""
+    if not Path(runs_dir).exists():
+        return []
+    return sorted(path for path in Path(runs_dir).iterdir() if (path / RUN_PENDING).exists())
+
+def stage_run(run_dir, entries, seen_keys, full_refresh=False):
+    """Save the run's manifest entries, dedup keys and data profile next to its output, to commit after the load."""
+    pending = {'manifest': manifest_entries(entries), 'full_refresh': full_refresh, 'run_id': run_id()}
+    if any('profile' in entry for entry in entries.values()):
+        pending['profile'] = run_profile(entries).to_dict()
+    seen_keys.save(run_dir / RUN_KEYS)
+    # Written last: a run directory without it is incomplete and never loaded
+    with open(run_dir / RUN_PENDING, 'w', encoding='utf-8') as f:
+        json.dump(pending, f, indent=2, sort_keys=True)
+
+def load_pending(run_dir):
+    """A staged run's (manifest entries, dedup keys, pending record)."""
+    with open(Path(run_dir) / RUN_PENDING, encoding='utf-8') as f:
+        pending = json.load(f)
+    return pending['manifest'], SeenKeys.load(Path(run_dir) / RUN_KEYS), pending
+
+def commit_run(run_dir):
+    """
+    Record a loaded run as ingested: add its files to the manifest and its
+    keys to the dedup keys (a full refresh replaces both), save its data
+    profile, and remove the run directory.
+    """
+    entries, run_keys, pending = load_pending(run_dir)
+    manifest = {} if pending['full_refresh'] else load_manifest(INGEST_MANIFEST)
+    seen_keys = SeenKeys() if pending['full_refresh'] else SeenKeys.load(INGEST_KEYS)
+    manifest.update(entries)
+    seen_keys.update(run_keys)
+    seen_keys.save(INGEST_KEYS)
+    save_manifest(manifest, INGEST_MANIFEST)
+    if 'profile' in pending:
+        record_profile(SessionProfile.from_dict(pending['profile']), pending['run_id'])
+    shutil.rmtree(run_dir, ignore_errors=True)
+    logger.info(f"[SUCCESS] Recorded ingest run {Path(run_dir).name}: {len(entries)} files")
+
+@instrument(kind='task')
+def ingest_directory(directory=DATA_RAW, workers=INGEST_WORKERS, pattern=INGEST_PATTERN, full_refresh=False,
+                     runs_dir=RUNS_DIR):
+    """
+    Transform all new or changed raw files in directory into a new run
+    directory under runs_dir.
+    
+    The run's sessions.parquet receives only sessions not ingested by
+    earlier runs, loaded or still pending, ready for load_to_db, which
+    commits the run once it is loaded. full_refresh=True forgets the
+    manifest and dedup keys and re-ingests every file. Returns a dict with
+    file and row counts and the run directory (None if nothing was new).
+    """
+    manifest = {} if full_refresh else load_manifest(INGEST_MANIFEST)
+    seen_keys = SeenKeys() if full_refresh else SeenKeys.load(INGEST_KEYS)
+    if not full_refresh:
+        # Runs not loaded yet count as ingested, so their sessions aren't written twice
+        for staged_dir in pending_runs(runs_dir):
+            entries, run_keys, _ = load_pending(staged_dir)
+            manifest.update(entries)
+            seen_keys.update(run_keys)
+    
+    files, pending = pending_files(manifest, directory, pattern)
+    logger.info(f"Found {len(files)} files in {directory}, {len(pending)} new or changed")
+    if not pending:
+        logger.info("[SUCCESS] No new raw files; nothing to ingest")
+        return {'files': len(files), 'ingested': 0, 'rows': 0, 'seconds': 0.0, 'run_dir': None}
+    
+    # Named by start time, so pending runs sort oldest first
+    run_dir = Path(runs_dir) / f"{datetime.now():%Y%m%dT%H%M%S%f}"
+    parts_dir = run_parts_dir()
+    try:
+        start = time.perf_counter()
+        entries = transform_files(pending, parts_dir, manifest, workers)
+        run_dir.mkdir(parents=True, exist_ok=True)
+        rows = write_sessions(iter_new_sessions(entries, seen_keys), run_dir / RUN_SESSIONS)
+        stage_run(run_dir, entries, seen_keys, full_refresh)
+        elapsed = time.perf_counter() - start
+        logger.info(f"[SUCCESS] Ingested {len(pending)} files: {rows} new sessions in {elapsed:.2f}s "
+                    f"({run_dir / RUN_SESSIONS}, recorded once loaded)")
+        return {'files': len(files), 'ingested': len(pending), 'rows': rows, 'seconds': elapsed, 'run_dir': run_dir}
+    
+    except Exception as e:
+        shutil.rmtree(run_dir, ignore_errors=True)
+        logger.error(f"[ERROR] Error ingesting {directory}: {e}", exc_info=True)
+        raise
+    
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Transform every new raw export in a directory for load_to_db.")
+    parser.add_argument('--directory', default=str(DATA_RAW), help="directory of raw CSV exports")
+    parser.add_argument('--pattern', default=INGEST_PATTERN, help="file glob within the directory")
+    parser.add_argument('--workers', type=int, default=INGEST_WORKERS, help="worker processes")
+    parser.add_argument('--full-refresh', action='store_true',
+                        help="forget previously ingested files and re-ingest everything")
+    args = parser.parse_args()
+    
+    ingest_directory(Path(args.directory), workers=args.workers, pattern=args.pattern,
+                     full_refresh=args.full_refresh)
+    logger.info("[SUCCESS] Directory ingestion complete!")
@@ -1,12 +1,29 @@
 """
-load_to_db.py - Load cleaned CSV data into PostgreSQL.
+load_to_db.py - Load cleaned session data into PostgreSQL.
+
+Input is re-sliced into fixed-size batches, each identified by a hash of
+its contents and committed in its own transaction together with its
+rollup delta and a checkpoint row. A re-run after a failure skips the
+batches already committed, and the natural key on sessions makes
+re-loading a row skip it (or overwrite it, with on_conflict='upsert').
 """
 
+import hashlib
+import time
 import pandas as pd
 import logging
 from sqlalchemy import create_engine, text
 from pathlib import Path
-from .config import DATABASE_URL, DATA_PROCESSED, LOG_FILE
+from .config import (
+    DATABASE_URL, DATA_PROCESSED, LOG_FILE, LOAD_BACKEND, CHUNK_SIZE, INTERMEDIATE_FORMAT,
+    LOAD_BATCH_ROWS, LOAD_ON_CONFLICT
+)
+from .columnar import iter_sessions
+from .db import copy_frame
+from .rollup import upsert_rollup
+from .schema import is_partitioned, ensure_partitions
+from .metrics import instrument
+from .ingest import RUN_SESSIONS, pending_runs, commit_run
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,8 +35,246 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def load_to_database(csv_path, chunk_size=500):
-    """Load cleaned CSV into PostgreSQL 'sessions' table."""
+# At most one row per natural key in 'sessions' (schema version 03)
+NATURAL_KEY = ['user_id', 'app_name', 'session_date', 'session_hour']
+
+# Rows a batch writes, signed for the rollup: +1 written, -1 the row an upsert replaced
+WRITTEN_TABLE_SQL = """
+CREATE TEMP TABLE load_written (
+    user_id INTEGER,
+    app_name VARCHAR(100),
+    session_date DATE,
+    session_hour INTEGER,
+    is_feed_app BOOLEAN,
+    is_midnight BOOLEAN,
+    duration_minutes NUMERIC(10, 2),
+    sign SMALLINT
+) ON COMMIT DROP
+"""
+
+WRITE_BATCH_SQL = """
+WITH {previous}written AS (
+    INSERT INTO sessions ({columns})
+    SELECT {columns} FROM load_stage
+    ON CONFLICT ({key}) {action}
+    RETURNING {key}, is_feed_app, is_midnight, duration_minutes
+)
+INSERT INTO load_written
+SELECT {key}, is_feed_app, is_midnight, duration_minutes, 1 FROM written
+"""
+
+# Upserts also record the rows they overwrite (read before the update, same snapshot)
+PREVIOUS_ROWS_SQL = """previous AS (
+    SELECT {key}, s.is_feed_app, s.is_midnight, s.duration_minutes
+    FROM sessions s JOIN load_stage USING ({key})
+), """
+
+REPLACED_ROWS_SQL = """
+UNION ALL
+SELECT {key}, p.is_feed_app, p.is_midnight, p.duration_minutes, -1
+FROM previous p JOIN written USING ({key})
+"""
+
+CONFLICT_MODES = ('skip', 'upsert')
+
+def copy_frames(conn, frames, table='sessions', chunk_size=None):
+    """
+    Stream DataFrames into a table with PostgreSQL COPY FROM STDIN.
+    Each frame is serialised to an in-memory CSV buffer and copied through
+    the connection's psycopg2 cursor. Returns rows copied.
+    """
+    total_rows = 0
+    with conn.connection.cursor() as cursor:
+        for df in frames:
+            if len(df) == 0:
+                continue
+            copy_frame(cursor, df, table)
+            total_rows += len(df)
+    return total_rows
+
+def to_sql_frames(conn, frames, table='sessions', chunk_size=500):
+    """Insert DataFrames with multi-row INSERTs via df.to_sql (fallback backend)."""
+    total_rows = 0
+    for df in frames:
+        if len(df) == 0:
+            continue
+        df.to_sql(
+            table,
+            con=conn,
+            if_exists='append',
+            index=False,
+            method='multi',
+            chunksize=chunk_size
+        )
+        total_rows += len(df)
+    return total_rows
+
+LOAD_BACKENDS = {
+    'copy': copy_frames,
+    'to_sql': to_sql_frames,
+}
+
+def iter_batches(frames, batch_rows=LOAD_BATCH_ROWS):
+    """
+    Re-slice frames into batches of batch_rows rows (the last may be
+    shorter), so batch boundaries and hashes don't depend on how the
+    input happened to be chunked.
+    """
+    pending, buffered = [], 0
+    for df in frames:
+        start = 0
+        while start < len(df):
+            take = min(batch_rows - buffered, len(df) - start)
+            pending.append(df.iloc[start:start + take])
+            buffered += take
+            start += take
+            if buffered == batch_rows:
+                yield pd.concat(pending, ignore_index=True)
+                pending, buffered = [], 0
+    if buffered:
+        yield pd.concat(pending, ignore_index=True)
+
+def batch_hash(df):
+    """Hash of a batch's column names and rows, in order."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(','.join(df.columns).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def write_batch_sql(columns, on_conflict):
+    """INSERT of the staged batch into sessions, recording signed rows in load_written."""
+    key = ', '.join(NATURAL_KEY)
+    if on_conflict == 'skip':
+        return WRITE_BATCH_SQL.format(previous='', columns=', '.join(columns), key=key, action="DO NOTHING")
+    
+    updated = [col for col in columns if col not in NATURAL_KEY]
+    action = (
+        "DO UPDATE SET " + ", ".join(f"{col} = EXCLUDED.{col}" for col in updated)
+        + f" WHERE ({', '.join(f'sessions.{col}' for col in updated)})"
+        + f" IS DISTINCT FROM ({', '.join(f'EXCLUDED.{col}' for col in updated)})"
+    )
+    return (WRITE_BATCH_SQL.format(previous=PREVIOUS_ROWS_SQL.format(key=key), columns=', '.join(columns),
+                                   key=key, action=action)
+            + REPLACED_ROWS_SQL.format(key=key))
+
+def write_batch(conn, df, digest, backend, on_conflict, chunk_size, update_rollup, partitioned):
+    """
+    Write one batch in the caller's transaction: stage it, insert it with
+    the conflict rule, add its rollup delta and record its checkpoint.
+    Returns (rows written, rows that hit an existing key, rows repeating a
+    key earlier in the batch, dates written).
+    """
+    if partitioned:
+        ensure_partitions(conn, pd.to_datetime(df['session_date'].unique()).date)
+    
+    # Keep one row per key, so the statement never touches a row twice
+    keep = 'first' if on_conflict == 'skip' else 'last'
+    staged = df.drop_duplicates(subset=NATURAL_KEY, keep=keep)
+    columns = list(staged.columns)
+    conn.execute(text(f"CREATE TEMP TABLE load_stage ON COMMIT DROP AS SELECT {', '.join(columns)} "
+                      f"FROM sessions WITH NO DATA"))
+    conn.execute(text(WRITTEN_TABLE_SQL))
+    LOAD_BACKENDS[backend](conn, [staged], table='load_stage', chunk_size=chunk_size)
+    conn.execute(text(write_batch_sql(columns, on_conflict)))
+    
+    written, replaced = conn.execute(text(
+        "SELECT COUNT(*) FILTER (WHERE sign > 0), COUNT(*) FILTER (WHERE sign < 0) FROM load_written"
+    )).one()
+    dates = set(conn.execute(text("SELECT DISTINCT session_date FROM load_written WHERE sign > 0")).scalars())
+    if update_rollup and written > 0:
+        upsert_rollup(conn, 'load_written')
+    conn.execute(text("""
+        INSERT INTO etl_load_checkpoints (batch_hash, rows_in, rows_written)
+        VALUES (:batch_hash, :rows_in, :rows_written)
+    """), {'batch_hash': digest, 'rows_in': len(df), 'rows_written': written})
+    
+    # Rows already present: skipped, or replaced (upserts of identical rows are neither);
+    # a key repeated within the batch is counted once, as a duplicate, not as present
+    duplicates = len(df) - len(staged)
+    existing = len(staged) - written if on_conflict == 'skip' else replaced
+    return written, existing, duplicates, dates
+
+@instrument(kind='task')
+def load_frames(frames, backend=LOAD_BACKEND, chunk_size=500, engine=None, update_rollup=True,
+                on_conflict=LOAD_ON_CONFLICT, batch_rows=LOAD_BATCH_ROWS):
+    """
+    Load transformed sessions into the 'sessions' table without a CSV round-trip.
+    
+    frames may be a single DataFrame or an iterable of chunks (e.g. from
+    transform_pipeline_chunked). They are loaded in batches of batch_rows,
+    each committed in its own transaction with its sessions_hourly_rollup
+    delta and a checkpoint; batches committed by an earlier (interrupted)
+    run are skipped. Rows whose natural key exists are skipped or, with
+    on_conflict='upsert', overwrite the stored row. When sessions is
+    partitioned, the monthly partitions for each batch are created first.
+    Returns a dict with rows written, rows already present, rows repeating
+    a key within their batch, seconds, rows/sec, batch counts and the set
+    of session dates written (the dirty dates for compute_mdi).
+    """
+    if backend not in LOAD_BACKENDS:
+        raise ValueError(f"Unknown load backend '{backend}'. Choose from {sorted(LOAD_BACKENDS)}")
+    if on_conflict not in CONFLICT_MODES:
+        raise ValueError(f"Unknown conflict mode '{on_conflict}'. Choose from {list(CONFLICT_MODES)}")
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    
+    owns_engine = engine is None
+    if owns_engine:
+        engine = create_engine(DATABASE_URL, echo=False)
+    
+    stats = {'backend': backend, 'rows': 0, 'rows_in': 0, 'existing': 0, 'duplicates': 0, 'batches': 0,
+             'skipped_batches': 0}
+    dates = set()
+    try:
+        with engine.connect() as conn:
+            if conn.execute(text("SELECT to_regclass('etl_load_checkpoints')")).scalar() is None:
+                raise RuntimeError("etl_load_checkpoints not found; run `python -m etl migrate` first")
+            partitioned = is_partitioned(conn)
+        
+        logger.info(f"Inserting into 'sessions' table using '{backend}' backend "
+                    f"(batches of {batch_rows} rows, on conflict: {on_conflict})...")
+        start = time.perf_counter()
+        for number, df in enumerate(iter_batches(frames, batch_rows), start=1):
+            digest = batch_hash(df)
+            stats['batches'] += 1
+            stats['rows_in'] += len(df)
+            with engine.begin() as conn:
+                committed = conn.execute(
+                    text("SELECT 1 FROM etl_load_checkpoints WHERE batch_hash = :batch_hash"), {'batch_hash': digest}
+                ).scalar()
+                if committed:
+                    stats['skipped_batches'] += 1
+                    logger.info(f"  Batch {number} ({len(df)} rows) already committed, skipped")
+                    continue
+                written, existing, duplicates, batch_dates = write_batch(
+                    conn, df, digest, backend, on_conflict, chunk_size, update_rollup, partitioned
+                )
+            stats['rows'] += written
+            stats['existing'] += existing
+            stats['duplicates'] += duplicates
+            dates.update(batch_dates)
+            logger.info(f"  Batch {number}: {written} of {len(df)} rows written, {existing} already present, "
+                        f"{duplicates} duplicated within the batch")
+        
+        elapsed = time.perf_counter() - start
+        rows_per_sec = stats['rows_in'] / elapsed if elapsed > 0 else float('inf')
+        logger.info(f"[SUCCESS] Wrote {stats['rows']} of {stats['rows_in']} rows in {stats['batches']} batches "
+                    f"({stats['skipped_batches']} already committed, {stats['existing']} rows already present, "
+                    f"{stats['duplicates']} duplicated within a batch) "
+                    f"in {elapsed:.2f}s ({rows_per_sec:,.0f} rows/sec, backend={backend})")
+        return {**stats, 'seconds': elapsed, 'rows_per_sec': rows_per_sec, 'dates': dates}
+    finally:
+        if owns_engine:
+            engine.dispose()
+
+def load_to_database(csv_path, chunk_size=500, backend=LOAD_BACKEND, on_conflict=LOAD_ON_CONFLICT):
+    """
+    Load cleaned sessions into PostgreSQL 'sessions' table.
+    Accepts the typed Parquet intermediate (streamed batch by batch, no
+    re-parsing) or the cleaned CSV export. Safe to re-run after a failure:
+    committed batches and already loaded sessions are skipped.
+    Returns the load_frames stats, including the dates written.
+    """
     logger.info(f"Loading data from {csv_path} into PostgreSQL...")
     
     try:
@@ -31,25 +286,19 @@ def load_to_database(csv_path, chunk_size=500):
         with engine.connect() as conn:
             conn.execute(text("SELECT 1"))
         
-        # Read cleaned CSV
-        df = pd.read_csv(csv_path)
-        logger.info(f"[SUCCESS] Loaded {len(df)} rows from cleaned CSV")
-        
-        # Ensure date column is datetime
-        df['session_date'] = pd.to_datetime(df['session_date'])
+        if Path(csv_path).suffix == '.parquet':
+            # Typed batches go straight to the loader
+            df = iter_sessions(csv_path, batch_size=CHUNK_SIZE or 500_000)
+        else:
+            # Read cleaned CSV
+            df = pd.read_csv(csv_path)
+            logger.info(f"[SUCCESS] Loaded {len(df)} rows from cleaned CSV")
+            
+            # Ensure date column is datetime
+            df['session_date'] = pd.to_datetime(df['session_date'])
         
         # Insert into 'sessions' table
-        logger.info(f"Inserting {len(df)} rows into 'sessions' table...")
-        df.to_sql(
-            'sessions',
-            con=engine,
-            if_exists='append',
-            index=False,
-            method='multi',
-            chunksize=chunk_size
-        )
-        
-        logger.info(f"[SUCCESS] Successfully inserted {len(df)} rows")
+        stats = load_frames(df, backend=backend, chunk_size=chunk_size, engine=engine, on_conflict=on_conflict)
         
         # Verify insertion
         with engine.connect() as conn:
@@ -58,19 +307,38 @@ def load_to_database(csv_path, chunk_size=500):
             logger.info(f"[SUCCESS] Total rows in 'sessions' table: {total_rows}")
         
         engine.dispose()
-        return True
+        return stats
     
     except Exception as e:
         logger.error(f"[ERROR] Error loading data: {e}", exc_info=True)
         raise
 
+def load_ingest_runs(chunk_size=500, backend=LOAD_BACKEND, on_conflict=LOAD_ON_CONFLICT):
+    """
+    Load the runs written by etl.ingest, oldest first, recording each as
+    ingested only once it is loaded. A failed load leaves it and later
+    runs pending for the next attempt. Returns the number of runs loaded.
+    """
+    runs = pending_runs()
+    for run_dir in runs:
+        load_to_database(run_dir / RUN_SESSIONS, chunk_size=chunk_size, backend=backend, on_conflict=on_conflict)
+        commit_run(run_dir)
+    return len(runs)
+
 if __name__ == '__main__':
+    # Runs staged by etl.ingest take precedence over the single-file transform output
+    if load_ingest_runs() > 0:
+        logger.info("[SUCCESS] Data loading complete!")
+        exit(0)
+    
     csv_file = DATA_PROCESSED / 'cleaned_sessions.csv'
+    parquet_file = DATA_PROCESSED / 'cleaned_sessions.parquet'
+    input_file = parquet_file if INTERMEDIATE_FORMAT != 'csv' else csv_file
     
-    if not csv_file.exists():
-        logger.error(f"[ERROR] Cleaned CSV not found: {csv_file}")
+    if not input_file.exists():
+        logger.error(f"[ERROR] Cleaned data not found: {input_file}")
         logger.info("Run etl_pipeline.py first")
         exit(1)
     
-    load_to_database(csv_file)
+    load_to_database(input_file)
     logger.info("[SUCCESS] Data loading complete!")
@@ -0,0 +1,190 @@
+"""
+mdi_kernel.py - Vectorised in-process MDI for arbitrary grouping keys.
+
+Computes the same metrics as the SQL aggregation (feed time, total midnight
+time, average feed session, session counts and the MDI score with the same
+epsilon) directly on transformed session frames, so new grains (week, user,
+app, weekday, ...) and dry runs or backfills need no database. Rows are
+mapped to dense group ids once and every metric is a np.bincount over them.
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+import logging
+from pathlib import Path
+from .config import DATA_RAW, DATA_PROCESSED, LOG_FILE, MDI_EPSILON, CHUNK_SIZE
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_FILE, encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Additive partial aggregates; everything else is derived from them
+SUM_COLUMNS = [
+    'feed_time_minutes', 'total_midnight_time_minutes',
+    'num_feed_midnight_sessions', 'num_midnight_sessions'
+]
+
+METRIC_COLUMNS = [
+    'feed_time_minutes', 'total_midnight_time_minutes', 'avg_feed_session_minutes',
+    'num_feed_midnight_sessions', 'num_midnight_sessions', 'mdi_score'
+]
+
+# Columns the kernel reads besides the grouping keys
+INPUT_COLUMNS = ['duration_minutes', 'is_feed_app', 'is_midnight']
+
+def group_ids(df, keys):
+    """
+    Map each row to a dense group id over the given keys.
+    keys are column names of df or arrays aligned with it (e.g. a derived
+    week). Returns (ids, key frame with one sorted row per group); rows
+    with a missing key get id -1, as groupby drops them.
+    """
+    columns = {}
+    for i, key in enumerate(keys):
+        if isinstance(key, str):
+            columns[key] = df[key]
+        else:
+            columns[getattr(key, 'name', None) or f'key_{i}'] = pd.Series(np.asarray(key), index=df.index)
+    
+    codes, levels = [], []
+    for column in columns.values():
+        column_codes, uniques = pd.factorize(column, sort=True)
+        codes.append(column_codes)
+        levels.append(pd.Index(uniques))
+    
+    valid = np.logical_and.reduce([c >= 0 for c in codes])
+    shape = tuple(max(len(level), 1) for level in levels)
+    combined = np.ravel_multi_index([np.where(valid, c, 0) for c in codes], shape)
+    ids, uniques = pd.factorize(combined[valid], sort=True)
+    
+    row_ids = np.full(len(df), -1, dtype=np.int64)
+    row_ids[valid] = ids
+    key_codes = np.unravel_index(uniques, shape)
+    key_frame = pd.DataFrame({
+        name: level.take(level_codes)
+        for name, level, level_codes in zip(columns, levels, key_codes)
+    })
+    return row_ids, key_frame
+
+def mdi_sums(ids, n_groups, duration, is_feed_app, is_midnight):
+    """Per-group additive sums for the MDI metrics via np.bincount."""
+    valid = ids >= 0
+    ids = ids[valid]
+    duration = np.asarray(duration, dtype=np.float64)[valid]
+    midnight = np.asarray(is_midnight, dtype=bool)[valid]
+    feed_midnight = midnight & np.asarray(is_feed_app, dtype=bool)[valid]
+    
+    return {
+        'feed_time_minutes': np.bincount(ids, weights=np.where(feed_midnight, duration, 0.0), minlength=n_groups),
+        'total_midnight_time_minutes': np.bincount(ids, weights=np.where(midnight, duration, 0.0), minlength=n_groups),
+        'num_feed_midnight_sessions': np.bincount(ids[feed_midnight], minlength=n_groups),
+        'num_midnight_sessions': np.bincount(ids[midnight], minlength=n_groups),
+    }
+
+def aggregate_frame(df, keys, decimals=2):
+    """
+    Partial MDI sums for one frame (or chunk), one row per group.
+    Durations are rounded to the 2 decimals sessions.duration_minutes
+    stores, so results match the SQL aggregation over the loaded table.
+    """
+    ids, key_frame = group_ids(df, keys)
+    duration = df['duration_minutes'].astype(float)
+    if decimals is not None:
+        duration = duration.round(decimals)
+    sums = mdi_sums(ids, len(key_frame), duration.to_numpy(),
+                    df['is_feed_app'].to_numpy(), df['is_midnight'].to_numpy())
+    for column in SUM_COLUMNS:
+        key_frame[column] = sums[column]
+    return key_frame
+
+def finalize(df_sums, epsilon=MDI_EPSILON):
+    """Derive avg_feed_session_minutes and mdi_score from combined sums."""
+    df = df_sums.copy()
+    feed_time = df['feed_time_minutes'].to_numpy(dtype=np.float64)
+    feed_count = df['num_feed_midnight_sessions'].to_numpy()
+    avg_feed = np.divide(feed_time, feed_count, out=np.zeros(len(df)), where=feed_count > 0)
+    
+    df['avg_feed_session_minutes'] = avg_feed
+    df['mdi_score'] = feed_time / (df['total_midnight_time_minutes'].to_numpy(dtype=np.float64) + epsilon) * avg_feed
+    return df
+
+def compute_mdi_frame(frames, keys=('session_date',), decimals=2):
+    """
+    Compute MDI metrics grouped by keys from transformed sessions.
+    frames may be a single DataFrame or an iterable of chunks (e.g. from
+    transform_pipeline_chunked); chunk sums are merged before scoring.
+    Returns one row per group, sorted by the keys.
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    keys = list(keys)
+    
+    partials = [aggregate_frame(df, keys, decimals) for df in frames if len(df) > 0]
+    if not partials:
+        names = [k if isinstance(k, str) else f'key_{i}' for i, k in enumerate(keys)]
+        return pd.DataFrame(columns=names + METRIC_COLUMNS)
+    
+    key_names = [c for c in partials[0].columns if c not in SUM_COLUMNS]
+    if len(partials) == 1:
+        combined = partials[0]
+    else:
+        combined = pd.concat(partials, ignore_index=True).groupby(
+            key_names, as_index=False, sort=True, observed=True)[SUM_COLUMNS].sum()
+    return finalize(combined)[key_names + METRIC_COLUMNS]
+
+def daily_mdi(frames):
+    """mdi_daily-shaped rows (date_recorded, weekday, metrics) without the database."""
+    df = compute_mdi_frame(frames, keys=['session_date'])
+    df = df.rename(columns={'session_date': 'date_recorded'})
+    dates = pd.to_datetime(df['date_recorded'])
+    df['date_recorded'] = dates.dt.date
+    df['weekday'] = dates.dt.day_name()
+    return df[['date_recorded', 'weekday'] + METRIC_COLUMNS]
+
+def user_daily_mdi(frames):
+    """mdi_user_daily-shaped rows (user_id, date_recorded, weekday, metrics)."""
+    df = compute_mdi_frame(frames, keys=['user_id', 'session_date'])
+    df = df.rename(columns={'session_date': 'date_recorded'})
+    dates = pd.to_datetime(df['date_recorded'])
+    df['date_recorded'] = dates.dt.date
+    df['weekday'] = dates.dt.day_name()
+    return df[['user_id', 'date_recorded', 'weekday'] + METRIC_COLUMNS]
+
+def load_input(path):
+    """Transformed sessions from the Parquet/CSV intermediate, or a raw CSV via the transform."""
+    path = Path(path)
+    if path.suffix == '.parquet':
+        from .columnar import iter_sessions
+        return iter_sessions(path, batch_size=CHUNK_SIZE or 500_000)
+    if path.resolve().parent == DATA_RAW.resolve():
+        from .etl_pipeline import transform_pipeline, transform_pipeline_chunked
+        return transform_pipeline_chunked(path, CHUNK_SIZE) if CHUNK_SIZE > 0 else transform_pipeline(path)
+    return pd.read_csv(path, parse_dates=['session_date'])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Dry-run MDI over transformed sessions, without the database.")
+    parser.add_argument('--input', default=str(DATA_PROCESSED / 'cleaned_sessions.parquet'),
+                        help="cleaned Parquet/CSV, or a CSV under data/raw to run the transform first")
+    parser.add_argument('--by', nargs='+', default=['session_date'],
+                        help="grouping columns, e.g. session_date, user_id, app_name, session_weekday")
+    parser.add_argument('--output', help="write the result to this CSV instead of printing it")
+    args = parser.parse_args()
+    
+    if not Path(args.input).exists():
+        logger.error(f"[ERROR] Input not found: {args.input}")
+        exit(1)
+    
+    df_mdi = compute_mdi_frame(load_input(args.input), keys=args.by)
+    logger.info(f"[SUCCESS] Computed MDI for {len(df_mdi)} groups by {', '.join(args.by)}")
+    if args.output:
+        df_mdi.to_csv(args.output, index=False)
+        logger.info(f"[SUCCESS] Saved MDI to {args.output}")
+    else:
+        print(df_mdi.to_string(index=False))
@@ -0,0 +1,189 @@
+"""
+metrics.py - Structured per-stage performance metrics.
+
+measure() and the instrument() decorator record wall time, CPU time, peak
+RSS, rows in/out and rows/sec for a block or call and append them as one
+JSON line to METRICS_FILE. With profiling on, each stage (or a standalone
+stage entry point) is also captured with cProfile. Expensive diagnostic summaries
+(value_counts, nunique, describe) are only computed when verbose() is true.
+"""
+
+import cProfile
+import functools
+import json
+import os
+import sys
+import time
+import uuid
+import logging
+import pandas as pd
+from contextlib import contextmanager
+from datetime import datetime
+from .config import LOG_FILE, DATA_LOGS, METRICS_FILE, ETL_VERBOSE, ETL_PROFILE, ETL_DATA_PROFILE
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_FILE, encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = DATA_LOGS / 'profiles'
+
+def _new_run_id():
+    return f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+# Worker processes inherit the run id through the environment
+_settings = {
+    'verbose': ETL_VERBOSE, 'profile': ETL_PROFILE, 'data_profile': ETL_DATA_PROFILE, 'metrics_file': METRICS_FILE,
+    'run_id': os.environ.setdefault('ETL_RUN_ID', _new_run_id()),
+}
+_active = []  # names of the measured blocks currently open, innermost last
+_profiling = []  # the block currently captured by cProfile (at most one)
+
+# Record kinds: 'run' (orchestrator), 'stage', 'task' (stage entry points),
+# 'step' (transform steps), 'db' (database calls) and 'batch' (watch micro-batches)
+PROFILED_KINDS = ('stage', 'task')
+
+def configure(verbose=None, profile=None, metrics_file=None, data_profile=None):
+    """Override the ETL_VERBOSE / ETL_PROFILE / ETL_METRICS_FILE / ETL_DATA_PROFILE settings at runtime."""
+    if verbose is not None:
+        _settings['verbose'] = verbose
+    if profile is not None:
+        _settings['profile'] = profile
+    if data_profile is not None:
+        _settings['data_profile'] = data_profile
+    if metrics_file is not None:
+        _settings['metrics_file'] = metrics_file
+
+def start_run():
+    """Start a new run id for the records that follow (and for new workers)."""
+    _settings['run_id'] = os.environ['ETL_RUN_ID'] = _new_run_id()
+    return _settings['run_id']
+
+def run_id():
+    """The current run id (shared by this run's worker processes)."""
+    return _settings['run_id']
+
+def verbose():
+    """True when expensive diagnostic summaries should be computed and logged."""
+    return _settings['verbose'] or _settings['profile']
+
+def data_profile():
+    """True when each run's transformed sessions should be profiled and the profile saved."""
+    return _settings['data_profile'] or verbose()
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None if unavailable)."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes on Linux
+        return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    return getattr(info, 'peak_wset', info.rss) / (1 << 20)
+
+def _children_cpu():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def write_metrics(record):
+    """Append one metrics record as a JSON line."""
+    with open(_settings['metrics_file'], 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+
+@contextmanager
+def measure(name, kind='step', rows_in=None, **fields):
+    """
+    Measure the enclosed block and write its metrics record on exit.
+    Yields the record so the block can set rows_out (or rows_in) and
+    extra fields; the record is complete once the block has exited.
+    """
+    record = {
+        'run_id': _settings['run_id'], 'name': name, 'kind': kind,
+        'parent': _active[-1] if _active else None,
+        'started_at': datetime.now().isoformat(timespec='milliseconds'),
+        'pid': os.getpid(), 'rows_in': rows_in, 'rows_out': None, **fields,
+    }
+    profiler = None
+    if _settings['profile'] and kind in PROFILED_KINDS and not _profiling:
+        profiler = cProfile.Profile()
+        _profiling.append(name)
+    
+    _active.append(name)
+    wall_start, cpu_start, children_start = time.perf_counter(), time.process_time(), _children_cpu()
+    if profiler:
+        profiler.enable()
+    try:
+        yield record
+        record['status'] = 'ok'
+    except BaseException as e:
+        record['status'] = 'error'
+        record['error'] = repr(e)
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+            _profiling.pop()
+        wall = time.perf_counter() - wall_start
+        _active.pop()
+        
+        rows = record['rows_out'] if record['rows_out'] is not None else record['rows_in']
+        record.update({
+            'wall_seconds': round(wall, 6),
+            'cpu_seconds': round(time.process_time() - cpu_start, 6),
+            'children_cpu_seconds': round(_children_cpu() - children_start, 6),
+            'peak_rss_mb': peak_rss_mb(),
+            'rows_per_sec': round(rows / wall, 1) if rows is not None and wall > 0 else None,
+        })
+        if profiler:
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            profile_path = PROFILE_DIR / f"{record['run_id']}-{name}.prof"
+            profiler.dump_stats(profile_path)
+            record['profile'] = str(profile_path)
+        try:
+            write_metrics(record)
+        except OSError as e:
+            logger.warning(f"[WARNING] Could not write metrics for '{name}': {e}")
+
+def _count_rows(value):
+    """Row count of a DataFrame, an int row count, or a stats dict with 'rows'."""
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, dict) and isinstance(value.get('rows'), int):
+        return value['rows']
+    return None
+
+def instrument(name=None, kind='step'):
+    """
+    Decorator form of measure(). rows_in is taken from the first DataFrame
+    argument and rows_out from the return value (a DataFrame, a row count
+    or a dict with 'rows').
+    """
+    def decorator(fn):
+        label = name or fn.__name__
+        
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            rows_in = next((len(a) for a in args if isinstance(a, pd.DataFrame)), None)
+            with measure(label, kind=kind, rows_in=rows_in) as record:
+                result = fn(*args, **kwargs)
+                record['rows_out'] = _count_rows(result)
+            return result
+        return wrapper
+    return decorator
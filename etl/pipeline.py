@@ -0,0 +1,166 @@
+"""
+pipeline.py - Run the ETL stages in one process as a DAG.
+
+Stages share one pooled engine and hand their results to downstream stages
+in memory: transformed frames stream straight into the loader (no cleaned
+file is written and re-read), the loader keeps the hourly rollup that the
+MDI stages aggregate, only days whose MDI changed are scored for anomalies
+(a full MDI rebuild is replayed without re-reading mdi_daily), and the
+dashboard summary is refreshed once at the end. Stages whose inputs haven't
+changed are skipped: unchanged raw files per the ingest manifest, and rollup rows
+older than each MDI stage's watermark.
+"""
+
+import shutil
+import logging
+from graphlib import TopologicalSorter
+from sqlalchemy import create_engine
+from .config import DATABASE_URL, DATA_RAW, LOG_FILE, INGEST_WORKERS, INGEST_PATTERN, MDI_WORKERS, INGEST_KEYS
+from .ingest import (
+    run_parts_dir, load_manifest, pending_files, transform_files, iter_new_sessions, record_ingested
+)
+from .etl_pipeline import SeenKeys
+from .load_to_db import load_frames
+from .calculate_mdi import compute_mdi
+from .calculate_user_mdi import compute_user_mdi
+from .detect_anomalies import detect_anomalies
+from .series_anomalies import detect_user_anomalies
+from .schema import refresh_mdi_summary
+from .metrics import measure, start_run
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_FILE, encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+def transform_stage(context, upstream):
+    """Transform new or changed raw files; yields deduplicated frames lazily."""
+    manifest = load_manifest()
+    files, pending = pending_files(manifest, context['directory'], context['pattern'])
+    logger.info(f"Found {len(files)} files in {context['directory']}, {len(pending)} new or changed")
+    if not pending:
+        return None
+    
+    seen_keys = SeenKeys.load(INGEST_KEYS)
+    entries = transform_files(pending, context['parts_dir'], manifest, context['workers'])
+    return {
+        'rows': sum(entry['rows'] for entry in entries.values()),
+        'frames': iter_new_sessions(entries, seen_keys),
+        # Called by the loader once the sessions are committed
+        'commit': lambda: record_ingested(manifest, entries, seen_keys),
+    }
+
+def load_stage(context, upstream):
+    """Stream the transformed frames into sessions and the hourly rollup."""
+    batch = upstream.get('transform')
+    if batch is None:
+        return None
+    stats = load_frames(batch['frames'], engine=context['engine'])
+    batch['commit']()
+    return stats if stats['rows'] > 0 else None
+
+def mdi_stage(context, upstream):
+    """Recompute daily MDI for dates whose rollup rows changed since the watermark."""
+    df_agg = compute_mdi(full_rebuild=context['full_rebuild'], engine=context['engine'])
+    return df_agg if len(df_agg) > 0 else None
+
+def user_mdi_stage(context, upstream):
+    """Recompute per-user MDI for changed dates (its workers open their own connections)."""
+    stats = compute_user_mdi(workers=context['mdi_workers'], full_rebuild=context['full_rebuild'],
+                             engine=context['engine'])
+    return stats if stats['rows'] > 0 else None
+
+def anomalies_stage(context, upstream):
+    """Score the days whose daily MDI changed (replay every day on a full rebuild)."""
+    df_agg = upstream.get('mdi')
+    if df_agg is None and not context['full_rebuild']:
+        return None
+    # A full MDI rebuild holds every day already; otherwise read all scores back
+    df_mdi = df_agg if context['full_rebuild'] else None
+    df_anomalies = detect_anomalies(engine=context['engine'], df_mdi=df_mdi, full_rebuild=context['full_rebuild'])
+    return {'rows': 0 if df_anomalies is None else len(df_anomalies)}
+
+def user_anomalies_stage(context, upstream):
+    """Re-score every user's MDI series when per-user MDI changed (always on a full rebuild)."""
+    if upstream.get('user_mdi') is None and not context['full_rebuild']:
+        return None
+    df_anomalies = detect_user_anomalies(engine=context['engine'])
+    return {'rows': 0 if df_anomalies is None else len(df_anomalies)}
+
+def summary_stage(context, upstream):
+    """Refresh the materialized MDI summary when daily MDI or z-scores changed."""
+    if upstream.get('mdi') is None and upstream.get('anomalies') is None and not context['full_rebuild']:
+        return None
+    rows = refresh_mdi_summary(engine=context['engine'])
+    return None if rows is None else {'rows': rows}
+
+# Stage name -> (upstream stages, function(context, upstream outputs))
+STAGES = {
+    'transform': ([], transform_stage),
+    'load': (['transform'], load_stage),
+    'mdi': (['load'], mdi_stage),
+    'user_mdi': (['load'], user_mdi_stage),
+    'anomalies': (['mdi'], anomalies_stage),
+    'user_anomalies': (['user_mdi'], user_anomalies_stage),
+    'summary': (['mdi', 'anomalies'], summary_stage),
+}
+
+def run_pipeline(stages=None, full_rebuild=False, directory=DATA_RAW, pattern=INGEST_PATTERN,
+                 workers=INGEST_WORKERS, mdi_workers=MDI_WORKERS):
+    """
+    Run the selected stages (all by default) in dependency order.
+    
+    A stage that returns None had nothing new to do; stages left out of
+    the selection count as unchanged. full_rebuild recomputes every MDI
+    date and re-scores anomalies. Each stage's metrics record (see
+    etl.metrics) goes to the metrics file; returns {stage: record}.
+    Raises ValueError for a stage name not in STAGES.
+    """
+    selected = list(STAGES) if stages is None else list(stages)
+    unknown = [name for name in selected if name not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown pipeline stages: {', '.join(unknown)} (expected some of {', '.join(STAGES)})")
+    order = [name for name in TopologicalSorter({name: deps for name, (deps, _) in STAGES.items()}).static_order()
+             if name in selected]
+    
+    engine = create_engine(DATABASE_URL, pool_size=2, max_overflow=2, pool_pre_ping=True)
+    context = {
+        'engine': engine, 'full_rebuild': full_rebuild, 'directory': directory, 'pattern': pattern,
+        'workers': workers, 'mdi_workers': mdi_workers,
+    }
+    outputs, summary = {}, {}
+    name = None
+    
+    try:
+        run_id = start_run()
+        context['parts_dir'] = run_parts_dir()
+        logger.info(f"Running pipeline stages: {' -> '.join(order)} (run {run_id})")
+        with measure('pipeline', kind='run', stages=order):
+            for name in order:
+                deps, stage = STAGES[name]
+                with measure(name, kind='stage') as record:
+                    output = stage(context, {dep: outputs.get(dep) for dep in deps})
+                    record['skipped'] = output is None
+                    record['rows_out'] = len(output) if hasattr(output, 'columns') else (output or {}).get('rows')
+                outputs[name] = output
+                summary[name] = record
+                if record['skipped']:
+                    logger.info(f"[SUCCESS] Stage '{name}' up to date, skipped ({record['wall_seconds']:.2f}s)")
+                else:
+                    logger.info(f"[SUCCESS] Stage '{name}' complete in {record['wall_seconds']:.2f}s")
+        return summary
+    
+    except Exception as e:
+        where = "before the first stage" if name is None else f"at stage '{name}'"
+        logger.error(f"[ERROR] Pipeline failed {where}: {e}", exc_info=True)
+        raise
+    
+    finally:
+        if 'parts_dir' in context:
+            shutil.rmtree(context['parts_dir'], ignore_errors=True)
+        engine.dispose()
@@ -0,0 +1,443 @@
+"""
+profiling.py - Mergeable sketches of the transformed sessions.
+
+A SessionProfile summarises sessions chunk by chunk in fixed memory:
+HyperLogLog sketches count distinct users and apps, a t-digest keeps
+duration quantiles, and exact counters hold the hour and weekday
+histograms, midnight and feed sessions and sessions per feed app.
+Profiles of chunks, worker processes and runs merge into one, so a
+streamed or parallel transform reports what a single pass would (the
+distinct counts and quantiles within their sketch error). Each run's
+profile is saved under DATA_PROFILE_DIR, and compare() reports the
+drift between two runs.
+"""
+
+import argparse
+import base64
+import json
+import os
+import zlib
+import logging
+import numpy as np
+import pandas as pd
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from .config import LOG_FILE, DATA_PROFILE_DIR, WEEKDAY_NAMES
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_FILE, encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# 2^14 one-byte registers: about 0.8% standard error on distinct counts
+HLL_PRECISION = 14
+
+# t-digest compression: about compression / 2 centroids, tighter towards the tails
+TDIGEST_COMPRESSION = 200
+
+# Batches whose sampled values are at most this share distinct (e.g. minutes
+# rounded to 0.1) are counted per distinct value instead of sorted in full
+REPEATS_MAX_UNIQUE_SHARE = 0.5
+
+DURATION_QUANTILES = [0.5, 0.9, 0.95, 0.99]
+
+def bit_length(values):
+    """Number of significant bits of each uint64 (0 for 0), exact via float64 halves."""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+
+class HyperLogLog:
+    """Distinct count of hashed values in 2^p registers; sketches merge by register-wise max."""
+    
+    def __init__(self, p=HLL_PRECISION):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+    
+    def add(self, values):
+        """
+        Add values (any array-like); each distinct value of the batch is
+        hashed once. Categoricals hash like their values, so categorical
+        and plain chunks count the same names once.
+        """
+        uniques = pd.Series(pd.unique(pd.Series(values).dropna()))
+        if len(uniques) == 0:
+            return
+        hashes = pd.util.hash_pandas_object(uniques, index=False).to_numpy()
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        # Rank of the first set bit among the remaining 64 - p bits
+        rest = hashes << np.uint64(self.p)
+        ranks = np.minimum(64 - bit_length(rest) + 1, 64 - self.p + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, ranks)
+    
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+    
+    def count(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros > 0:
+            # Small cardinalities: linear counting of the empty registers
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+    
+    def to_dict(self):
+        return {'p': self.p, 'registers': base64.b64encode(zlib.compress(self.registers.tobytes())).decode('ascii')}
+    
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['p'])
+        sketch.registers = np.frombuffer(zlib.decompress(base64.b64decode(data['registers'])), dtype=np.uint8).copy()
+        return sketch
+
+class TDigest:
+    """
+    Quantile sketch of a numeric column: a merging t-digest with the k1
+    scale function. Each batch is sorted and clustered with NumPy, one
+    centroid per unit of k, then merged with the digest's centroids.
+    """
+    
+    def __init__(self, compression=TDIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+    
+    @property
+    def count(self):
+        return float(self.weights.sum())
+    
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if self._repeats(values):
+            # Rounded values: count each distinct value, then sort only those
+            codes, uniques = pd.factorize(values)
+            weights = np.bincount(codes[codes >= 0], minlength=len(uniques)).astype(np.float64)
+            values, weights = self._sorted(uniques, weights)
+        else:
+            values = np.sort(values)
+            values = values[:np.searchsorted(values, np.nan)]  # NaNs sort last
+            weights = np.ones(len(values))
+        if len(values) == 0:
+            return
+        self.min = min(self.min, values[0])
+        self.max = max(self.max, values[-1])
+        # Cluster the batch on its own (already sorted), then fold its centroids in
+        means, weights = self._cluster(values, weights)
+        self.means, self.weights = self._cluster(*self._sorted(np.concatenate([self.means, means]),
+                                                               np.concatenate([self.weights, weights])))
+    
+    def merge(self, other):
+        if other.count > 0:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self.means, self.weights = self._cluster(*self._sorted(np.concatenate([self.means, other.means]),
+                                                                   np.concatenate([self.weights, other.weights])))
+        return self
+    
+    @staticmethod
+    def _repeats(values, sample_size=10_000):
+        """True when a sample of values is mostly repeats, so counting distinct values beats a full sort."""
+        sample = values[:sample_size]
+        return len(sample) > 0 and len(pd.unique(sample)) <= REPEATS_MAX_UNIQUE_SHARE * len(sample)
+    
+    @staticmethod
+    def _sorted(means, weights):
+        order = np.argsort(means, kind='stable')
+        return means[order], weights[order]
+    
+    def _cluster(self, means, weights):
+        """Merge sorted (mean, weight) points into one centroid per unit of k; returns the centroids."""
+        cumulative = np.cumsum(weights)
+        q_left = (cumulative - weights) / cumulative[-1]
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q_left - 1)
+        cluster = np.floor(k)
+        starts = np.flatnonzero(np.concatenate(([True], cluster[1:] != cluster[:-1])))
+        cluster_weights = np.add.reduceat(weights, starts)
+        return np.add.reduceat(means * weights, starts) / cluster_weights, cluster_weights
+    
+    def quantile(self, q):
+        """Estimated quantile(s) q in [0, 1] (NaN when empty)."""
+        if self.count == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        # Centroids sit at the middle of their weight; the extremes pin the ends
+        centers = np.cumsum(self.weights) - self.weights / 2
+        positions = np.concatenate(([0.0], centers, [self.count]))
+        values = np.concatenate(([self.min], self.means, [self.max]))
+        return np.interp(np.asarray(q) * self.count, positions, values)
+    
+    def to_dict(self):
+        return {
+            'compression': self.compression, 'min': None if self.count == 0 else self.min,
+            'max': None if self.count == 0 else self.max,
+            'means': self.means.tolist(), 'weights': self.weights.tolist(),
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        digest = cls(data['compression'])
+        digest.means = np.asarray(data['means'], dtype=np.float64)
+        digest.weights = np.asarray(data['weights'], dtype=np.float64)
+        if data['min'] is not None:
+            digest.min, digest.max = data['min'], data['max']
+        return digest
+
+class SessionProfile:
+    """
+    Sketches and counters of transformed sessions (select_output_columns'
+    columns), updated per chunk and merged across workers and runs.
+    """
+    
+    def __init__(self):
+        self.rows = 0
+        self.users = HyperLogLog()
+        self.apps = HyperLogLog()
+        self.durations = TDigest()
+        self.hours = np.zeros(24, dtype=np.int64)
+        self.weekdays = np.zeros(7, dtype=np.int64)
+        self.midnight_sessions = 0
+        self.feed_sessions = 0
+        self.midnight_feed_sessions = 0
+        self.feed_apps = Counter()
+        self.min_date = None
+        self.max_date = None
+    
+    def update(self, df):
+        """Add a frame of transformed sessions."""
+        if len(df) == 0:
+            return
+        self.rows += len(df)
+        self.users.add(df['user_id'])
+        self.apps.add(df['app_name'])
+        self.durations.add(df['duration_minutes'].to_numpy(dtype=np.float64))
+        self.hours += np.bincount(df['session_hour'].to_numpy(dtype=np.int64), minlength=24)[:24]
+        weekdays = pd.Categorical(df['session_weekday'], categories=WEEKDAY_NAMES).codes
+        self.weekdays += np.bincount(weekdays[weekdays >= 0], minlength=7)
+        
+        feed = df['is_feed_app'].to_numpy(dtype=bool)
+        midnight = df['is_midnight'].to_numpy(dtype=bool)
+        self.feed_sessions += int(feed.sum())
+        self.midnight_sessions += int(midnight.sum())
+        self.midnight_feed_sessions += int((feed & midnight).sum())
+        feed_counts = df.loc[feed, 'app_name'].value_counts()
+        self.feed_apps.update({str(app): int(n) for app, n in feed_counts.items() if n > 0})
+        
+        dates = df['session_date']
+        self._extend_dates(pd.Timestamp(dates.min()).date().isoformat(), pd.Timestamp(dates.max()).date().isoformat())
+    
+    def _extend_dates(self, first, last):
+        if first is not None:
+            self.min_date = first if self.min_date is None else min(self.min_date, first)
+            self.max_date = last if self.max_date is None else max(self.max_date, last)
+    
+    def merge(self, other):
+        """Add another profile (of other chunks, workers or runs) into this one."""
+        self.rows += other.rows
+        self.users.merge(other.users)
+        self.apps.merge(other.apps)
+        self.durations.merge(other.durations)
+        self.hours += other.hours
+        self.weekdays += other.weekdays
+        self.midnight_sessions += other.midnight_sessions
+        self.feed_sessions += other.feed_sessions
+        self.midnight_feed_sessions += other.midnight_feed_sessions
+        self.feed_apps.update(other.feed_apps)
+        self._extend_dates(other.min_date, other.max_date)
+        return self
+    
+    def summary(self):
+        """The profile's report: counts, distinct estimates, quantiles and histograms."""
+        quantiles = self.durations.quantile(DURATION_QUANTILES)
+        return {
+            'rows': self.rows,
+            'distinct_users': self.users.count(),
+            'distinct_apps': self.apps.count(),
+            'date_range': [self.min_date, self.max_date],
+            'duration_minutes': {
+                'min': None if self.rows == 0 else float(self.durations.min),
+                **{f"p{round(q * 100)}": None if self.rows == 0 else round(float(v), 2)
+                   for q, v in zip(DURATION_QUANTILES, quantiles)},
+                'max': None if self.rows == 0 else float(self.durations.max),
+            },
+            'hours': self.hours.tolist(),
+            'weekdays': dict(zip(WEEKDAY_NAMES, self.weekdays.tolist())),
+            'midnight_sessions': self.midnight_sessions,
+            'feed_sessions': self.feed_sessions,
+            'midnight_feed_sessions': self.midnight_feed_sessions,
+            'feed_apps': dict(self.feed_apps.most_common()),
+        }
+    
+    def to_dict(self):
+        return {
+            'rows': self.rows, 'users': self.users.to_dict(), 'apps': self.apps.to_dict(),
+            'durations': self.durations.to_dict(), 'hours': self.hours.tolist(), 'weekdays': self.weekdays.tolist(),
+            'midnight_sessions': self.midnight_sessions, 'feed_sessions': self.feed_sessions,
+            'midnight_feed_sessions': self.midnight_feed_sessions, 'feed_apps': dict(self.feed_apps),
+            'min_date': self.min_date, 'max_date': self.max_date,
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        profile = cls()
+        profile.rows = data['rows']
+        profile.users = HyperLogLog.from_dict(data['users'])
+        profile.apps = HyperLogLog.from_dict(data['apps'])
+        profile.durations = TDigest.from_dict(data['durations'])
+        profile.hours = np.asarray(data['hours'], dtype=np.int64)
+        profile.weekdays = np.asarray(data['weekdays'], dtype=np.int64)
+        profile.midnight_sessions = data['midnight_sessions']
+        profile.feed_sessions = data['feed_sessions']
+        profile.midnight_feed_sessions = data['midnight_feed_sessions']
+        profile.feed_apps = Counter(data['feed_apps'])
+        profile.min_date, profile.max_date = data['min_date'], data['max_date']
+        return profile
+
+def merge_profiles(profiles):
+    """One profile of many (None entries are skipped)."""
+    merged = SessionProfile()
+    for profile in profiles:
+        if profile is not None:
+            merged.merge(profile)
+    return merged
+
+def save_profile(profile, run_id, directory=DATA_PROFILE_DIR):
+    """Write the run's profile (sketches and summary) to directory/<run_id>.json; returns the path."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{run_id}.json"
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'run_id': run_id, 'created_at': datetime.now().isoformat(timespec='seconds'),
+            'summary': profile.summary(), 'profile': profile.to_dict(),
+        }, f)
+    os.replace(tmp_path, path)
+    return path
+
+def saved_runs(directory=DATA_PROFILE_DIR):
+    """Run ids with a saved profile, oldest first (run ids start with their timestamp)."""
+    return sorted(path.stem for path in Path(directory).glob('*.json'))
+
+def load_profile(run_id, directory=DATA_PROFILE_DIR):
+    with open(Path(directory) / f"{run_id}.json", encoding='utf-8') as f:
+        return SessionProfile.from_dict(json.load(f)['profile'])
+
+def distribution_distance(before, after):
+    """Total variation distance between two histograms (0 = same shape, 1 = disjoint)."""
+    before, after = np.asarray(before, dtype=np.float64), np.asarray(after, dtype=np.float64)
+    if before.sum() == 0 or after.sum() == 0:
+        return None
+    return round(float(np.abs(before / before.sum() - after / after.sum()).sum() / 2), 4)
+
+def share(part, total):
+    return part / total if total else None
+
+def compare(before, after):
+    """Drift from profile before to profile after, as a dict of changes."""
+    old, new = before.summary(), after.summary()
+    drift = {
+        'rows': [old['rows'], new['rows']],
+        'distinct_users': [old['distinct_users'], new['distinct_users']],
+        'distinct_apps': [old['distinct_apps'], new['distinct_apps']],
+        'duration_minutes': {key: [old['duration_minutes'][key], new['duration_minutes'][key]]
+                             for key in new['duration_minutes']},
+        'midnight_share': [share(old['midnight_sessions'], old['rows']), share(new['midnight_sessions'], new['rows'])],
+        'feed_share': [share(old['feed_sessions'], old['rows']), share(new['feed_sessions'], new['rows'])],
+        'hour_distance': distribution_distance(before.hours, after.hours),
+        'weekday_distance': distribution_distance(before.weekdays, after.weekdays),
+        'new_feed_apps': sorted(set(new['feed_apps']) - set(old['feed_apps'])),
+        'missing_feed_apps': sorted(set(old['feed_apps']) - set(new['feed_apps'])),
+    }
+    return drift
+
+def format_share(value):
+    return '-' if value is None else f"{value:.1%}"
+
+def summary_lines(summary):
+    """Log lines of a profile summary."""
+    durations = summary['duration_minutes']
+    hours = summary['hours']
+    lines = [
+        f"  Sessions: {summary['rows']} ({summary['date_range'][0]} to {summary['date_range'][1]})",
+        f"  Distinct users: ~{summary['distinct_users']}, apps: ~{summary['distinct_apps']}",
+        f"  Duration minutes: p50 {durations['p50']}, p90 {durations['p90']}, p95 {durations['p95']}, "
+        f"p99 {durations['p99']} (max {durations['max']})",
+        f"  Midnight sessions: {summary['midnight_sessions']} ({format_share(share(summary['midnight_sessions'], summary['rows']))}), "
+        f"feed: {summary['feed_sessions']}, midnight feed: {summary['midnight_feed_sessions']}",
+        f"  Sessions by hour: {' '.join(str(n) for n in hours)}",
+        f"  Sessions by weekday: {', '.join(f'{day[:3]} {n}' for day, n in summary['weekdays'].items())}",
+    ]
+    if summary['feed_apps']:
+        lines.append(f"  Feed apps: {', '.join(f'{app} ({n})' for app, n in summary['feed_apps'].items())}")
+    return lines
+
+def drift_lines(drift):
+    """Log lines of compare()'s drift."""
+    def change(pair):
+        before, after = pair
+        return f"{before} -> {after}"
+    durations = drift['duration_minutes']
+    lines = [
+        f"  Sessions {change(drift['rows'])}; distinct users (est.) {change(drift['distinct_users'])}, "
+        f"apps {change(drift['distinct_apps'])}",
+        f"  Duration p50 {change(durations['p50'])}, p95 {change(durations['p95'])}",
+        f"  Midnight share {' -> '.join(map(format_share, drift['midnight_share']))}, "
+        f"feed share {' -> '.join(map(format_share, drift['feed_share']))}",
+        f"  Hour distribution distance {drift['hour_distance']}, weekday {drift['weekday_distance']} (0 = unchanged)",
+    ]
+    if drift['new_feed_apps'] or drift['missing_feed_apps']:
+        lines.append(f"  Feed apps new: {drift['new_feed_apps'] or '-'}, gone: {drift['missing_feed_apps'] or '-'}")
+    return lines
+
+def record_profile(profile, run_id, directory=DATA_PROFILE_DIR):
+    """Log the profile, save it for run_id and log its drift from the previous saved run."""
+    previous = [run for run in saved_runs(directory) if run < run_id]
+    for line in summary_lines(profile.summary()):
+        logger.info(line)
+    try:
+        path = save_profile(profile, run_id, directory)
+    except OSError as e:
+        logger.warning(f"[WARNING]  Could not save the data profile of run {run_id}: {e}")
+        return None
+    logger.info(f"[SUCCESS] Saved data profile to {path}")
+    if previous:
+        logger.info(f"Drift from run {previous[-1]}:")
+        for line in drift_lines(compare(load_profile(previous[-1], directory), profile)):
+            logger.info(line)
+    return path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Show saved data profiles and the drift between runs.")
+    parser.add_argument('--run', help="run id to show (default: the latest)")
+    parser.add_argument('--against', help="run id to compare with (default: the run before --run)")
+    parser.add_argument('--all', action='store_true', help="merge every saved run into one profile")
+    parser.add_argument('--list', action='store_true', help="list the saved runs")
+    args = parser.parse_args()
+    
+    runs = saved_runs()
+    if not runs:
+        logger.error(f"[ERROR] No data profiles in {DATA_PROFILE_DIR}; run a transform first")
+        exit(1)
+    if args.list:
+        print('\n'.join(runs))
+    elif args.all:
+        print(f"{len(runs)} runs merged ({runs[0]} to {runs[-1]}):")
+        print('\n'.join(summary_lines(merge_profiles(load_profile(run) for run in runs).summary())))
+    else:
+        run = args.run or runs[-1]
+        profile = load_profile(run)
+        print(f"Run {run}:")
+        print('\n'.join(summary_lines(profile.summary())))
+        against = args.against or next((r for r in reversed(runs) if r < run), None)
+        if against:
+            print(f"Drift from run {against}:")
+            print('\n'.join(drift_lines(compare(load_profile(against), profile))))
@@ -0,0 +1,110 @@
+"""
+rollup.py - Maintain the sessions_hourly_rollup pre-aggregate.
+
+One row per (session_date, session_hour, user_id, is_feed_app) holding the
+session count, sum(duration) and sum(duration^2). load_to_db adds the
+delta of each batch it writes in the batch's transaction, and the MDI
+stages aggregate the rollup instead of raw sessions.
+"""
+
+import argparse
+import logging
+from sqlalchemy import create_engine, text
+from .config import DATABASE_URL, LOG_FILE
+from .metrics import instrument
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_FILE, encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# MDI aggregates over rollup rows; callers add the grouping keys and WHERE clause
+MDI_ROLLUP_AGGREGATES = """
+    TRIM(TO_CHAR(session_date, 'Day')) as weekday,
+    COALESCE(SUM(duration_sum) FILTER (WHERE is_feed_app AND is_midnight), 0)
+        as feed_time_minutes,
+    COALESCE(SUM(duration_sum) FILTER (WHERE is_midnight), 0)
+        as total_midnight_time_minutes,
+    SUM(duration_sum) FILTER (WHERE is_feed_app AND is_midnight)
+        / NULLIF(SUM(session_count) FILTER (WHERE is_feed_app AND is_midnight), 0)
+        as avg_feed_session_minutes,
+    COALESCE(SUM(session_count) FILTER (WHERE is_feed_app AND is_midnight), 0)::BIGINT
+        as num_feed_midnight_sessions,
+    COALESCE(SUM(session_count) FILTER (WHERE is_midnight), 0)::BIGINT
+        as num_midnight_sessions
+"""
+
+UPSERT_SQL = """
+INSERT INTO sessions_hourly_rollup (
+    session_date, session_hour, user_id, is_feed_app, is_midnight,
+    session_count, duration_sum, duration_sum_sq
+)
+SELECT
+    session_date, session_hour, user_id, is_feed_app, is_midnight,
+    session_count, duration_sum, duration_sum_sq
+FROM {source}
+ON CONFLICT (session_date, session_hour, user_id, is_feed_app) DO UPDATE SET
+    is_midnight = EXCLUDED.is_midnight,
+    session_count = sessions_hourly_rollup.session_count + EXCLUDED.session_count,
+    duration_sum = sessions_hourly_rollup.duration_sum + EXCLUDED.duration_sum,
+    duration_sum_sq = sessions_hourly_rollup.duration_sum_sq + EXCLUDED.duration_sum_sq,
+    updated_at = CURRENT_TIMESTAMP,
+    change_xid = pg_current_xact_id();
+"""
+
+# Rollup delta from signed session rows: +1 for a row written, -1 for a row it replaced
+SIGNED_DELTA_SOURCE = """(
+    SELECT
+        session_date, session_hour, user_id, is_feed_app,
+        BOOL_OR(is_midnight) as is_midnight,
+        SUM(sign) as session_count,
+        SUM(sign * duration_minutes) as duration_sum,
+        SUM(sign * duration_minutes * duration_minutes) as duration_sum_sq
+    FROM {table}
+    GROUP BY session_date, session_hour, user_id, is_feed_app
+) AS delta"""
+
+@instrument(kind='db')
+def upsert_rollup(conn, table):
+    """
+    Add the signed session rows in table (columns of sessions plus sign)
+    to sessions_hourly_rollup in one set-based upsert. Durations come
+    from the stored NUMERIC(10,2) values, so the rollup matches an
+    aggregate over the loaded table. Returns the keys touched.
+    """
+    return conn.execute(text(UPSERT_SQL.format(source=SIGNED_DELTA_SOURCE.format(table=table)))).rowcount
+
+def rebuild_rollup(conn):
+    """Recompute the whole rollup from raw sessions (backfill after upgrading)."""
+    conn.execute(text("TRUNCATE sessions_hourly_rollup"))
+    source = """(
+        SELECT
+            session_date, session_hour, user_id, is_feed_app,
+            BOOL_OR(is_midnight) as is_midnight,
+            COUNT(*) as session_count,
+            SUM(duration_minutes) as duration_sum,
+            SUM(duration_minutes * duration_minutes) as duration_sum_sq
+        FROM sessions
+        GROUP BY session_date, session_hour, user_id, is_feed_app
+    ) AS raw"""
+    conn.execute(text(UPSERT_SQL.format(source=source)))
+    return conn.execute(text("SELECT COUNT(*) FROM sessions_hourly_rollup")).scalar()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Maintain the sessions_hourly_rollup table.")
+    parser.add_argument('--rebuild', action='store_true', help="recompute the rollup from raw sessions")
+    args = parser.parse_args()
+    
+    if args.rebuild:
+        engine = create_engine(DATABASE_URL)
+        with engine.begin() as conn:
+            keys = rebuild_rollup(conn)
+        engine.dispose()
+        logger.info(f"[SUCCESS] Rebuilt sessions_hourly_rollup with {keys} keys")
+    else:
+        parser.print_help()
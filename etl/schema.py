@@ -0,0 +1,144 @@
+"""
+schema.py - Apply the SQL schema versions and maintain partitions.
+
+sql/NN_*.sql are schema versions applied in order, one transaction each.
+Every file is idempotent; schema_migrations records the checksum applied,
+so unchanged files are skipped on later runs (a changed file re-applies
+every later one too, as they build on it). Version 02 range-partitions
+sessions by month (load_to_db creates the partitions a load needs) and
+materializes the dashboard summary, refreshed here without blocking reads.
+"""
+
+import argparse
+import hashlib
+import logging
+from datetime import date
+from sqlalchemy import create_engine, text
+from .config import DATABASE_URL, PROJECT_ROOT, LOG_FILE
+from .metrics import instrument
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_FILE, encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+SQL_DIR = PROJECT_ROOT / 'sql'
+
+MDI_SUMMARY_VIEW = 'mv_mdi_summary'
+
+def schema_files(directory=SQL_DIR):
+    """Schema version files in the order they apply."""
+    return sorted(directory.glob('[0-9][0-9]_*.sql'))
+
+def applied_versions(conn):
+    """Checksums of the schema versions applied so far, by version."""
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(100) PRIMARY KEY,
+            checksum VARCHAR(64) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+    return dict(conn.execute(text("SELECT version, checksum FROM schema_migrations")).all())
+
+def apply_migrations(engine=None, force=False):
+    """
+    Apply schema versions that are new or changed since they were last
+    applied, and every version after them (every version with force=True).
+    Returns the versions applied.
+    """
+    owns_engine = engine is None
+    if owns_engine:
+        engine = create_engine(DATABASE_URL)
+    
+    try:
+        with engine.begin() as conn:
+            applied = applied_versions(conn)
+        
+        versions = []
+        for path in schema_files():
+            sql = path.read_text(encoding='utf-8')
+            checksum = hashlib.sha256(sql.encode('utf-8')).hexdigest()
+            if not force and not versions and applied.get(path.stem) == checksum:
+                continue
+            logger.info(f"Applying schema version {path.stem}...")
+            with engine.begin() as conn:
+                # Raw DBAPI cursor: the scripts hold literal % (format() patterns)
+                with conn.connection.cursor() as cursor:
+                    cursor.execute(sql)
+                conn.execute(text("""
+                    INSERT INTO schema_migrations (version, checksum) VALUES (:version, :checksum)
+                    ON CONFLICT (version) DO UPDATE SET
+                        checksum = EXCLUDED.checksum,
+                        applied_at = CURRENT_TIMESTAMP
+                """), {'version': path.stem, 'checksum': checksum})
+            versions.append(path.stem)
+        
+        if versions:
+            logger.info(f"[SUCCESS] Applied schema versions: {', '.join(versions)}")
+        else:
+            logger.info("[SUCCESS] Schema is up to date")
+        return versions
+    
+    except Exception as e:
+        logger.error(f"[ERROR] Error applying schema migrations: {e}", exc_info=True)
+        raise
+    
+    finally:
+        if owns_engine:
+            engine.dispose()
+
+def is_partitioned(conn, table='sessions'):
+    """True if table is a partitioned table (schema version 02 and later)."""
+    return bool(conn.execute(
+        text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)"), {'table': table}
+    ).scalar())
+
+def ensure_partitions(conn, dates):
+    """Create the monthly sessions partitions covering dates; returns their names."""
+    months = sorted({date(d.year, d.month, 1) for d in dates})
+    return [
+        conn.execute(text("SELECT create_sessions_partition(:month)"), {'month': month}).scalar()
+        for month in months
+    ]
+
+@instrument(kind='db')
+def refresh_mdi_summary(engine=None):
+    """
+    Refresh the materialized MDI summary CONCURRENTLY, so dashboards keep
+    reading the previous snapshot meanwhile. Returns its row count, or
+    None before schema version 02 created it.
+    """
+    owns_engine = engine is None
+    if owns_engine:
+        engine = create_engine(DATABASE_URL)
+    
+    try:
+        with engine.begin() as conn:
+            if conn.execute(text("SELECT to_regclass(:view)"), {'view': MDI_SUMMARY_VIEW}).scalar() is None:
+                logger.warning(f"[WARNING] {MDI_SUMMARY_VIEW} not found; run `python -m etl migrate` to create it")
+                return None
+            conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {MDI_SUMMARY_VIEW}"))
+            rows = conn.execute(text(f"SELECT COUNT(*) FROM {MDI_SUMMARY_VIEW}")).scalar()
+        logger.info(f"[SUCCESS] Refreshed {MDI_SUMMARY_VIEW} ({rows} days)")
+        return rows
+    
+    except Exception as e:
+        logger.error(f"[ERROR] Error refreshing {MDI_SUMMARY_VIEW}: {e}", exc_info=True)
+        raise
+    
+    finally:
+        if owns_engine:
+            engine.dispose()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Apply the sql/ schema versions to DATABASE_URL.")
+    parser.add_argument('--force', action='store_true', help="re-apply every version, changed or not")
+    args = parser.parse_args()
+    
+    apply_migrations(force=args.force)
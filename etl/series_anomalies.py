@@ -0,0 +1,288 @@
+"""
+series_anomalies.py - Vectorised anomaly detection across many MDI series.
+
+Scores every series at once (per user from mdi_user_daily, or any grouping
+of transformed sessions, e.g. per app): rows map to dense (series, weekday)
+group ids with mdi_kernel.group_ids, and each day's baseline - the mean
+and standard deviation, or the median and MAD scaled to estimate a
+standard deviation, of the other days in its group - comes from
+np.bincount and sorts, with no per-series or per-row Python. The
+weekday-seasonal baseline compares a user's Friday with that user's
+other Fridays; where a baseline's MAD is 0 (a mostly-zero series), the
+mean absolute deviation scaled likewise stands in. Anomalies are
+bulk-inserted into anomaly_log under a series key such as 'user_id=17'.
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+import logging
+from pathlib import Path
+from sqlalchemy import create_engine, text
+from .config import (
+    DATABASE_URL, DATA_PROCESSED, LOG_FILE, ANOMALY_MIN_DAYS, SERIES_ANOMALY_SEASONALITY, SERIES_ANOMALY_ROBUST
+)
+from .db import copy_frame
+from .metrics import instrument
+from .mdi_kernel import group_ids, compute_mdi_frame, load_input
+from .detect_anomalies import ANOMALY_COLUMNS, BASELINE_COLUMNS, flag_anomalies
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_FILE, encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+SEASONALITIES = ('weekday', 'none')
+
+# MAD of a normal sample times this estimates its standard deviation
+MAD_SCALE = 1.4826
+
+# Likewise for the mean absolute deviation (sqrt(pi / 2)), used where the MAD is 0
+MEAN_AD_SCALE = 1.2533
+
+# z-scores are stored as NUMERIC(10, 4)
+Z_SCORE_LIMIT = 999_999
+
+USER_KEYS = ['user_id']
+
+def group_medians(ids, values, counts):
+    """Median of values per group id (NaN for empty groups), from a single sort."""
+    ordered = values[np.lexsort((values, ids))]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    medians = np.full(len(counts), np.nan)
+    present = counts > 0
+    lower = starts[present] + (counts[present] - 1) // 2
+    upper = starts[present] + counts[present] // 2
+    medians[present] = (ordered[lower] + ordered[upper]) / 2
+    return medians
+
+def other_medians(ids, values, counts):
+    """Per row, the median of the other values in its group (NaN if it has none), from a single sort."""
+    order = np.lexsort((values, ids))
+    ordered = values[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rank = np.empty(len(values), dtype=np.int64)
+    rank[order] = np.arange(len(values)) - starts[ids[order]]
+    # Middle positions among the n - 1 others, shifted past the row's own position
+    others = counts[ids] - 1
+    lower = (others - 1) // 2
+    upper = others // 2
+    lower = starts[ids] + lower + (lower >= rank)
+    upper = starts[ids] + upper + (upper >= rank)
+    medians = (ordered[np.clip(lower, 0, None)] + ordered[np.clip(upper, 0, None)]) / 2
+    medians[others < 1] = np.nan
+    return medians
+
+def group_baselines(ids, n_groups, values, robust=False):
+    """
+    Per row, (center, scale, days) of the other rows of its group id - the
+    row itself is left out, so an outlier can't pull its own baseline: the
+    mean and sample standard deviation, or with robust=True the median and
+    MAD * MAD_SCALE. Where the MAD is 0 (e.g. a series that is mostly
+    zeros) the scale falls back to MEAN_AD_SCALE times the mean absolute
+    deviation. Rows with id -1 or a NaN value get NaN and 0 days.
+    """
+    center = np.full(len(values), np.nan)
+    scale = np.full(len(values), np.nan)
+    days = np.zeros(len(values), dtype=np.int64)
+    valid = (ids >= 0) & ~np.isnan(values)
+    ids, values = ids[valid], values[valid]
+    counts = np.bincount(ids, minlength=n_groups)
+    others = counts[ids] - 1
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if robust:
+            row_center = other_medians(ids, values, counts)
+            # The others' absolute deviations from the series median
+            deviations = np.abs(values - group_medians(ids, values, counts)[ids])
+            mad = other_medians(ids, deviations, counts)
+            mean_deviation = (np.bincount(ids, weights=deviations, minlength=n_groups)[ids] - deviations) / others
+            row_scale = np.where(mad > 0, MAD_SCALE * mad, MEAN_AD_SCALE * mean_deviation)
+            row_scale[others < 1] = np.nan
+        else:
+            means = np.bincount(ids, weights=values, minlength=n_groups) / np.maximum(counts, 1)
+            squares = np.bincount(ids, weights=(values - means[ids]) ** 2, minlength=n_groups)
+            row_center = (counts[ids] * means[ids] - values) / others
+            row_squares = squares[ids] - (values - means[ids]) ** 2 * counts[ids] / others
+            row_scale = np.sqrt(np.maximum(row_squares, 0) / (others - 1))
+            row_center[others < 1] = np.nan
+            row_scale[others < 2] = np.nan
+    
+    center[valid] = row_center
+    scale[valid] = row_scale
+    days[valid] = others
+    return center, scale, days
+
+def score_series(df, keys, seasonality=SERIES_ANOMALY_SEASONALITY, robust=SERIES_ANOMALY_ROBUST,
+                 min_days=ANOMALY_MIN_DAYS, value='mdi_score'):
+    """
+    z-scores of df[value] against its series' baseline (one series per
+    combination of keys; per weekday too with seasonality='weekday').
+    Each day is scored against the other days of its series. Returns keys,
+    date_recorded and value with the baseline columns and z_score; days
+    whose baseline has fewer than min_days days or no spread get none.
+    """
+    if seasonality not in SEASONALITIES:
+        raise ValueError(f"Unknown seasonality '{seasonality}' (expected one of {', '.join(SEASONALITIES)})")
+    keys = list(keys)
+    ids, key_frame = group_ids(df, keys + (['weekday'] if seasonality == 'weekday' else []))
+    values = df[value].to_numpy(dtype=np.float64)
+    center, scale, days = group_baselines(ids, len(key_frame), values, robust)
+    
+    df_scored = df[keys + ['date_recorded', value]].reset_index(drop=True)
+    df_scored['baseline_mean'] = center
+    df_scored['baseline_std'] = scale
+    df_scored['baseline_days'] = pd.array(days, dtype='Int64')
+    
+    scored = (days >= min_days) & (scale > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_scores = (values - center) / scale
+    df_scored['z_score'] = np.clip(np.where(scored, z_scores, np.nan), -Z_SCORE_LIMIT, Z_SCORE_LIMIT)
+    return df_scored
+
+def series_keys(df, keys):
+    """
+    Series key per row: 'key=value' pairs joined by commas, e.g.
+    'user_id=17', formatted once per series (None for a missing key).
+    """
+    ids, key_frame = group_ids(df, keys)
+    labels = [key + '=' + key_frame[key].astype(str) for key in keys]
+    series_key = labels[0]
+    for label in labels[1:]:
+        series_key = series_key + ',' + label
+    series_key = np.append(series_key.to_numpy(dtype=object), None)
+    return pd.Series(series_key[ids], index=df.index)
+
+@instrument(kind='db')
+def write_user_scores(conn, df_scored, table='mdi_user_daily'):
+    """Write z-scores and baselines back to mdi_user_daily via a COPY'd stage; returns rows changed."""
+    columns = ['z_score'] + BASELINE_COLUMNS
+    conn.execute(text("""
+        CREATE TEMP TABLE user_z_score_stage (
+            user_id INTEGER,
+            date_recorded DATE,
+            z_score NUMERIC,
+            baseline_mean DOUBLE PRECISION,
+            baseline_std DOUBLE PRECISION,
+            baseline_days INTEGER,
+            PRIMARY KEY (user_id, date_recorded)
+        ) ON COMMIT DROP
+    """))
+    with conn.connection.cursor() as cursor:
+        copy_frame(cursor, df_scored[USER_KEYS + ['date_recorded'] + columns], 'user_z_score_stage')
+    assignments = ', '.join(f"{column} = s.{column}" for column in columns)
+    changed = ' OR '.join(f"m.{column} IS DISTINCT FROM s.{column}" for column in columns)
+    result = conn.execute(text(f"""
+        UPDATE {table} AS m
+        SET {assignments}
+        FROM user_z_score_stage AS s
+        WHERE m.user_id = s.user_id
+          AND m.date_recorded = s.date_recorded
+          AND ({changed})
+    """))
+    return result.rowcount
+
+@instrument(kind='db')
+def replace_anomalies(conn, df_anomalies, series_prefix, table='anomaly_log'):
+    """
+    Replace every logged anomaly whose series_key starts with series_prefix
+    by df_anomalies, COPY'd straight into the log. Returns rows deleted.
+    """
+    result = conn.execute(
+        text(f"DELETE FROM {table} WHERE starts_with(series_key, :prefix)"), {'prefix': series_prefix}
+    )
+    if len(df_anomalies) > 0:
+        with conn.connection.cursor() as cursor:
+            copy_frame(cursor, df_anomalies[['series_key'] + ANOMALY_COLUMNS + BASELINE_COLUMNS], table)
+    return result.rowcount
+
+@instrument(kind='task')
+def detect_user_anomalies(engine=None, seasonality=SERIES_ANOMALY_SEASONALITY, robust=SERIES_ANOMALY_ROBUST,
+                          min_days=ANOMALY_MIN_DAYS):
+    """
+    Score every user's daily MDI series at once and replace the per-user
+    anomalies in anomaly_log. Returns the anomalies found (None if none).
+    """
+    owns_engine = engine is None
+    
+    try:
+        if owns_engine:
+            engine = create_engine(DATABASE_URL)
+            logger.info("[SUCCESS] Database connection established")
+        
+        with engine.begin() as conn:
+            query = text("SELECT user_id, date_recorded, weekday, mdi_score FROM mdi_user_daily ORDER BY user_id, date_recorded;")
+            df_mdi = pd.read_sql(query, con=conn)
+            if len(df_mdi) == 0:
+                logger.warning("[WARNING]  No per-user MDI data found. Run calculate_user_mdi.py first.")
+                return None
+            
+            baseline = f"{'median/MAD' if robust else 'mean/std'}{' per weekday' if seasonality == 'weekday' else ''}"
+            logger.info(f"[SUCCESS] Fetched {len(df_mdi)} user-days of {df_mdi['user_id'].nunique()} users; "
+                        f"scoring against each user's {baseline}")
+            
+            df_scored = score_series(df_mdi, USER_KEYS, seasonality, robust, min_days)
+            df_anomalies = flag_anomalies(df_scored, series_keys(df_scored, USER_KEYS))
+            logger.info(f"  Days scored: {int(df_scored['z_score'].notna().sum())} of {len(df_scored)}")
+            logger.info(f"\n Found {len(df_anomalies)} anomalies in {df_anomalies['series_key'].nunique()} users")
+            
+            updated = write_user_scores(conn, df_scored)
+            replaced = replace_anomalies(conn, df_anomalies, series_prefix='user_id=')
+        
+        logger.info(f"[SUCCESS] Updated mdi_user_daily with z_scores ({updated} rows changed)")
+        logger.info(f"[SUCCESS] Replaced {replaced} per-user anomalies in 'anomaly_log' with {len(df_anomalies)}")
+        return df_anomalies if len(df_anomalies) > 0 else None
+    
+    except Exception as e:
+        logger.error(f"[ERROR] Error detecting per-user anomalies: {e}", exc_info=True)
+        raise
+    
+    finally:
+        if owns_engine:
+            engine.dispose()
+
+def session_series_anomalies(frames, keys, seasonality=SERIES_ANOMALY_SEASONALITY, robust=SERIES_ANOMALY_ROBUST,
+                             min_days=ANOMALY_MIN_DAYS):
+    """Anomalies of the daily MDI per keys (e.g. app_name) of transformed sessions, without the database."""
+    df_mdi = compute_mdi_frame(frames, keys=list(keys) + ['session_date'])
+    dates = pd.to_datetime(df_mdi['session_date'])
+    df_mdi['date_recorded'] = dates.dt.date
+    df_mdi['weekday'] = dates.dt.day_name()
+    df_scored = score_series(df_mdi, keys, seasonality, robust, min_days)
+    return flag_anomalies(df_scored, series_keys(df_scored, keys))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Score many MDI series at once: per user into anomaly_log, or any grouping of sessions (dry run)."
+    )
+    parser.add_argument('--by', nargs='+',
+                        help="score the daily MDI per these session columns (e.g. app_name) without the database")
+    parser.add_argument('--input', default=str(DATA_PROCESSED / 'cleaned_sessions.parquet'),
+                        help="transformed sessions for --by (as for mdi_kernel)")
+    parser.add_argument('--output', help="write --by anomalies to this CSV instead of printing them")
+    parser.add_argument('--seasonality', choices=SEASONALITIES, default=SERIES_ANOMALY_SEASONALITY)
+    parser.add_argument('--robust', action=argparse.BooleanOptionalAction, default=SERIES_ANOMALY_ROBUST,
+                        help="median/MAD baseline instead of mean/std")
+    parser.add_argument('--min-days', type=int, default=ANOMALY_MIN_DAYS)
+    args = parser.parse_args()
+    
+    if args.by is None:
+        detect_user_anomalies(seasonality=args.seasonality, robust=args.robust, min_days=args.min_days)
+        logger.info("[SUCCESS] Per-user anomaly detection complete!")
+    else:
+        if not Path(args.input).exists():
+            logger.error(f"[ERROR] Input not found: {args.input}")
+            exit(1)
+        df_anomalies = session_series_anomalies(load_input(args.input), args.by, args.seasonality, args.robust,
+                                                args.min_days)
+        logger.info(f"[SUCCESS] Found {len(df_anomalies)} anomalies by {', '.join(args.by)}")
+        if args.output:
+            df_anomalies.to_csv(args.output, index=False)
+            logger.info(f"[SUCCESS] Saved anomalies to {args.output}")
+        else:
+            print(df_anomalies.to_string(index=False))
@@ -0,0 +1,201 @@
+"""
+testing.py - Synthetic data and result checks shared by the tests and benchmarks.
+
+Seeded session exports in the Kaggle schema (generate_chunks, write_csv),
+date columns in mixed export formats, synthetic daily MDI for the anomaly
+stages, and comparisons of computed MDI against SQL or the reference query.
+Nothing here runs in the pipeline itself.
+"""
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from sqlalchemy import text
+from .calculate_user_mdi import reference_user_mdi, USER_MDI_COLUMNS
+
+# Synthetic exports (python -m benchmarks.generate_sessions writes them to CSV). App popularity
+# is Zipf-skewed within feed and non-feed apps, and the midnight share drifts from day to day so
+# MDI has spikes to detect. Rows come in fixed 1M-row blocks, each with its own seed, so the same
+# arguments always give the same rows and memory stays bounded even at 100M rows.
+
+SCALES = {'100k': 100_000, '1m': 1_000_000, '10m': 10_000_000, '100m': 100_000_000}
+
+BLOCK_ROWS = 1_000_000
+
+# (app_name, category), most popular first within each group
+FEED_APPS = [
+    ('TikTok', 'Social Media'), ('Instagram', 'Social Media'), ('YouTube', 'Entertainment'),
+    ('Facebook', 'Social Media'), ('Snapchat', 'Social Media'), ('Reddit', 'Social Media'),
+    ('X', 'Social Media'), ('Pinterest', 'Social Media'), ('Threads', 'Social Media'),
+]
+OTHER_APPS = [
+    ('WhatsApp', 'Communication'), ('Chrome', 'Utilities'), ('Gmail', 'Productivity'),
+    ('Spotify', 'Entertainment'), ('Netflix', 'Entertainment'), ('Maps', 'Navigation'),
+    ('Slack', 'Productivity'), ('Zoom', 'Productivity'), ('Calendar', 'Productivity'),
+    ('Camera', 'Utilities'),
+]
+
+def parse_rows(value):
+    """Row count from a scale name ('100k', '1m', ...) or a plain integer."""
+    return SCALES[value.lower()] if value.lower() in SCALES else int(value.replace('_', ''))
+
+def zipf_weights(n, exponent=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+def day_midnight_shares(seed, days, midnight_share):
+    """Per-day midnight share with log-normal drift around the target."""
+    rng = np.random.default_rng(seed)
+    return np.clip(midnight_share * np.exp(rng.normal(0.0, 0.35, days)), 0.0, 0.95)
+
+def user_weights(seed, users):
+    """Log-normal activity per user: a few heavy users, a long light tail."""
+    weights = np.random.default_rng([seed, 0]).lognormal(0.0, 1.0, users)
+    return weights / weights.sum()
+
+def make_block(rows, rng, user_p, dates, day_shares, feed_share=0.3, timestamps=False, dirty_share=0.0):
+    """One block of raw export rows."""
+    day = rng.integers(0, len(dates), rows)
+    midnight = rng.random(rows) < day_shares[day]
+    hour = np.where(midnight, rng.integers(0, 6, rows), rng.integers(6, 24, rows))
+    
+    feed = rng.random(rows) < feed_share
+    feed_idx = rng.choice(len(FEED_APPS), rows, p=zipf_weights(len(FEED_APPS)))
+    other_idx = rng.choice(len(OTHER_APPS), rows, p=zipf_weights(len(OTHER_APPS)))
+    app_names = np.array([a for a, _ in FEED_APPS] + [a for a, _ in OTHER_APPS], dtype=object)
+    categories = np.array([c for _, c in FEED_APPS] + [c for _, c in OTHER_APPS], dtype=object)
+    app = np.where(feed, feed_idx, len(FEED_APPS) + other_idx)
+    
+    # Late-night feed sessions run longer
+    duration = rng.gamma(2.0, 12.0, rows) * np.where(feed & midnight, 1.5, 1.0)
+    duration = np.minimum(duration, 900.0).round(1) + 0.1
+    
+    if timestamps:
+        offsets = pd.to_timedelta(hour * 3600 + rng.integers(0, 3600, rows), unit='s')
+        date = (pd.DatetimeIndex(dates[day]) + offsets).strftime('%Y-%m-%d %H:%M:%S').to_numpy(dtype=object)
+    else:
+        date = dates[day].strftime('%Y-%m-%d').to_numpy(dtype=object)
+    
+    df = pd.DataFrame({
+        'user_id': rng.choice(len(user_p), rows, p=user_p) + 1,
+        'app_name': app_names[app],
+        'date': date,
+        'hour': hour,
+        'screen_time_min': duration,
+        'category': categories[app],
+    })
+    
+    if dirty_share > 0:
+        # Unparseable dates and missing durations for clean_data to drop
+        # (never the first row, which pandas infers the date format from)
+        dirty = rng.random(rows) < dirty_share
+        dirty[0] = False
+        bad_date = dirty & (rng.random(rows) < 0.5)
+        df.loc[bad_date, 'date'] = 'not a date'
+        df.loc[dirty & ~bad_date, 'screen_time_min'] = np.nan
+    return df
+
+def generate_chunks(rows, seed=42, users=None, midnight_share=0.25, feed_share=0.3,
+                    start='2024-01-01', days=365, timestamps=False, dirty_share=0.0):
+    """
+    Yield DataFrames of at most BLOCK_ROWS rows, rows in total.
+    users defaults to one per 1,000 rows (at least 100), so most
+    (user, app, date, hour) keys stay unique at every scale.
+    """
+    users = users or max(100, rows // 1000)
+    dates = pd.date_range(start, periods=days)
+    day_shares = day_midnight_shares(seed, days, midnight_share)
+    user_p = user_weights(seed, users)
+    for block, offset in enumerate(range(0, rows, BLOCK_ROWS)):
+        rng = np.random.default_rng([seed, block + 1])
+        yield make_block(min(BLOCK_ROWS, rows - offset), rng, user_p, dates, day_shares,
+                         feed_share=feed_share, timestamps=timestamps, dirty_share=dirty_share)
+
+def write_csv(path, rows, **options):
+    """Write a synthetic export to path; returns rows written."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    for df in generate_chunks(rows, **options):
+        df.to_csv(path, index=False, mode='a' if written else 'w', header=not written)
+        written += len(df)
+    return written
+
+def mixed_dates(rows, seed):
+    """Timestamps in two export formats, with every 100th row unparseable."""
+    dates = next(generate_chunks(rows, seed=seed, timestamps=True))['date']
+    stamps = pd.to_datetime(dates)
+    android = stamps.dt.strftime('%m/%d/%Y %I:%M %p')
+    dates = dates.where(stamps.dt.second % 2 == 0, android)
+    dates.iloc[::100] = 'unknown'
+    return dates
+
+# Daily MDI for the anomaly stages
+UPSERT_DAYS = """
+    INSERT INTO mdi_daily (date_recorded, weekday, mdi_score)
+    VALUES (:date_recorded, :weekday, :mdi_score)
+    ON CONFLICT (date_recorded) DO UPDATE SET
+        mdi_score = EXCLUDED.mdi_score,
+        updated_at = CURRENT_TIMESTAMP,
+        change_xid = pg_current_xact_id()
+"""
+
+def make_days(n_days, seed=42):
+    """Synthetic daily MDI with a weekly cycle, a slow drift and a few spikes."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2015-01-01', periods=n_days)
+    scores = 5 + 2 * (dates.dayofweek >= 4) + np.linspace(0, 3, n_days) + rng.gamma(2.0, 1.0, n_days)
+    scores[rng.choice(n_days, n_days // 50, replace=False)] *= 3
+    return pd.DataFrame({
+        'date_recorded': dates.date, 'weekday': dates.day_name(), 'mdi_score': scores.round(4),
+    })
+
+def upsert_days(engine, df):
+    """Insert or overwrite the scores of df's days in mdi_daily."""
+    with engine.begin() as conn:
+        conn.execute(text(UPSERT_DAYS), df.to_dict('records'))
+
+def snapshot(engine):
+    """Stored scores and baselines of every day, and the anomaly log, for comparing runs."""
+    with engine.connect() as conn:
+        scores = pd.read_sql(text("""
+            SELECT date_recorded, z_score, baseline_mean, baseline_std, baseline_days
+            FROM mdi_daily ORDER BY date_recorded
+        """), conn)
+        logged = pd.read_sql(text("SELECT date_of_anomaly, z_score FROM anomaly_log ORDER BY date_of_anomaly"), conn)
+    return scores.set_index('date_recorded').astype(float), logged
+
+# The SQL side reads NUMERIC(10,2) minutes; the score is compared at 4 decimals
+TOLERANCES = [
+    ('feed_time_minutes', 5e-3), ('total_midnight_time_minutes', 5e-3),
+    ('avg_feed_session_minutes', 5e-3), ('mdi_score', 5e-5),
+    ('num_feed_midnight_sessions', 0), ('num_midnight_sessions', 0),
+]
+
+def count_mismatches(kernel, sql, keys):
+    """Rows missing on either side or differing beyond the stored precision."""
+    kernel = kernel.assign(date_recorded=pd.to_datetime(kernel['date_recorded']))
+    sql = sql.assign(date_recorded=pd.to_datetime(sql['date_recorded']))
+    merged = kernel.merge(sql, on=keys, how='outer', suffixes=('_kernel', '_sql'), indicator=True)
+    mismatched = merged['_merge'] != 'both'
+    mismatched |= merged['weekday_kernel'] != merged['weekday_sql']
+    for column, atol in TOLERANCES:
+        ours = merged[f'{column}_kernel'].astype(float)
+        theirs = merged[f'{column}_sql'].astype(float)
+        mismatched |= ~np.isclose(ours, theirs, rtol=1e-9, atol=atol + 1e-9)
+    return int(mismatched.sum())
+
+def check_against_reference(engine):
+    """Return the number of (user_id, date) rows that differ from the reference."""
+    reference = reference_user_mdi(engine)
+    stored = pd.read_sql(f"SELECT {', '.join(USER_MDI_COLUMNS)} FROM mdi_user_daily", engine)
+    merged = reference.merge(stored, on=['user_id', 'date_recorded'], how='outer',
+                             suffixes=('_ref', '_db'), indicator=True)
+    mismatched = merged['_merge'] != 'both'
+    # The table stores minutes at 2 decimals and the score at 4
+    for column, atol in [('feed_time_minutes', 5e-3), ('total_midnight_time_minutes', 5e-3),
+                         ('avg_feed_session_minutes', 5e-3), ('mdi_score', 5e-5),
+                         ('num_feed_midnight_sessions', 0), ('num_midnight_sessions', 0)]:
+        ref = merged[f'{column}_ref'].astype(float)
+        db = merged[f'{column}_db'].astype(float)
+        mismatched |= ~np.isclose(ref, db, rtol=0, atol=atol + 1e-9)
+    return int(mismatched.sum()), len(reference)
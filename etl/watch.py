@@ -0,0 +1,381 @@
+"""
+watch.py - Near-real-time micro-batch ingestion.
+
+Tails a landing directory (new CSV or JSONL files) or a growing JSONL
+stream and loads sessions within seconds to minutes of their arrival. An
+asyncio reader puts raw frames on a bounded queue (a full queue pauses
+reading), a batcher closes a micro-batch when it holds batch_rows rows or
+its oldest row is batch_seconds old, and the batch is transformed with
+the usual transform steps, bulk-loaded, and the daily MDI of its dates
+and their anomaly scores are updated. Files and stream offsets are
+recorded only once their batch is committed, so a restart resumes where
+the last committed batch ended. Each batch writes a metrics record with
+its latency from arrival to scored MDI; with data profiling on, batches
+are added to the watch's data profile, saved when the watch stops.
+"""
+
+import asyncio
+import io
+import json
+import os
+import signal
+import time
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from pathlib import Path
+from sqlalchemy import create_engine
+from .config import (
+    DATABASE_URL, LOG_FILE, WATCH_DIRECTORY, WATCH_BATCH_ROWS, WATCH_BATCH_SECONDS, WATCH_POLL_SECONDS,
+    WATCH_QUEUE_FRAMES, WATCH_STATE, FEED_APP_CACHE
+)
+from .etl_pipeline import AppClassifier, DateParser, LocalClock, transform_frame, save_app_classes
+from .load_to_db import load_frames
+from .calculate_mdi import compute_mdi
+from .detect_anomalies import detect_anomalies
+from .schema import refresh_mdi_summary
+from .metrics import measure, start_run, data_profile
+from .profiling import SessionProfile, record_profile
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_FILE, encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Landing files by suffix; anything else (e.g. a '.part' still being uploaded) is ignored
+LANDING_SUFFIXES = ('.csv', '.jsonl', '.ndjson')
+
+# Bytes of a JSONL stream parsed per frame
+STREAM_BLOCK_BYTES = 8 << 20
+
+# A stream line longer than this is skipped rather than buffered until its end
+STREAM_MAX_LINE_BYTES = 64 << 20
+
+# Put in place of a frame when the open batch reaches its age limit
+BATCH_DUE = object()
+
+def load_state(path=WATCH_STATE):
+    """Files and stream offsets already loaded ({'files': {...}, 'offsets': {...}})."""
+    if not Path(path).exists():
+        return {'files': {}, 'offsets': {}}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_state(state, path=WATCH_STATE):
+    # Write then rename, so an interrupted watcher never leaves a truncated state file
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def read_jsonl(text):
+    """Raw sessions of JSONL text, values kept as written (dates parse in the transform)."""
+    return pd.read_json(io.StringIO(text), lines=True, dtype=False, convert_dates=False)
+
+class DirectorySource:
+    """
+    New files in a landing directory, read in frames of chunk_rows rows.
+    A file is picked up once it hasn't changed for settle_seconds, and is
+    recorded as loaded by the checkpoint of its last frame.
+    """
+    
+    def __init__(self, directory, state, chunk_rows, settle_seconds=WATCH_POLL_SECONDS):
+        self.directory = Path(directory)
+        self.state = state
+        self.chunk_rows = chunk_rows
+        self.settle_seconds = settle_seconds
+        self._queued = set()
+    
+    def __str__(self):
+        return f"directory {self.directory}"
+    
+    def ready_files(self):
+        now = time.time()
+        files = []
+        for path in self.directory.glob('*'):
+            if path.suffix.lower() not in LANDING_SUFFIXES or not path.is_file():
+                continue
+            stat = path.stat()
+            key = str(path.resolve())
+            entry = self.state['files'].get(key)
+            loaded = entry is not None and (entry['size'], entry['mtime_ns']) == (stat.st_size, stat.st_mtime_ns)
+            if not loaded and key not in self._queued and now - stat.st_mtime >= self.settle_seconds:
+                files.append((stat.st_mtime_ns, key, stat))
+        return [(Path(key), stat) for _, key, stat in sorted(files)]
+    
+    def frames(self):
+        """Yield (raw frame, checkpoint) for every ready file; checkpoint is None until a file's last frame."""
+        for path, stat in self.ready_files():
+            key = str(path)
+            self._queued.add(key)
+            if path.suffix.lower() == '.csv':
+                reader = pd.read_csv(path, chunksize=self.chunk_rows)
+            else:
+                reader = pd.read_json(path, lines=True, dtype=False, convert_dates=False, chunksize=self.chunk_rows)
+            rows = 0
+            previous = None
+            with reader:
+                for df in reader:
+                    if previous is not None:
+                        yield previous, None
+                    previous = df
+                    rows += len(df)
+            entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'rows': rows,
+                     'loaded_at': datetime.now().isoformat(timespec='seconds')}
+            yield (previous if previous is not None else pd.DataFrame()), {'files': {key: entry}}
+    
+    def committed(self, checkpoint):
+        for key in checkpoint.get('files', {}):
+            self._queued.discard(key)
+
+class StreamSource:
+    """
+    Complete lines appended to a JSONL file since the recorded offset.
+    A file that shrinks (truncated or rotated) is read again from the start.
+    Lines longer than a block are buffered whole, up to max_line_bytes;
+    longer ones are skipped with a warning. The unfinished last line (or
+    the progress through one being skipped) is kept across polls, so each
+    poll reads only the bytes appended since the last.
+    """
+    
+    def __init__(self, path, state, block_bytes=STREAM_BLOCK_BYTES, max_line_bytes=STREAM_MAX_LINE_BYTES):
+        self.path = Path(path)
+        self.key = str(self.path.resolve())
+        self.offset = state['offsets'].get(self.key, 0)
+        self.block_bytes = block_bytes
+        self.max_line_bytes = max_line_bytes
+        self._pending = b''  # bytes read after self.offset that don't end a line yet
+        self._skipped = 0  # bytes of an over-long line read after self.offset, while skipping it
+    
+    def __str__(self):
+        return f"stream {self.path}"
+    
+    @property
+    def position(self):
+        """Where the next read starts: past the offset, the partial line and the skipped bytes."""
+        return self.offset + len(self._pending) + self._skipped
+    
+    def frames(self):
+        """Yield (raw frame, checkpoint) per block of complete lines; the checkpoint is the offset after it."""
+        if not self.path.exists():
+            return
+        if self.path.stat().st_size < self.position:
+            logger.warning(f"[WARNING]  {self.path} shrank below offset {self.position}; reading it from the start")
+            self.offset, self._pending, self._skipped = 0, b'', 0
+        with open(self.path, 'rb') as f:
+            f.seek(self.position)
+            while True:
+                if self._skipped and not self._skip_line(f):
+                    return
+                block = f.read(self.block_bytes)
+                data = self._pending + block
+                end = data.rfind(b'\n') + 1
+                if end == 0:
+                    if len(data) >= self.max_line_bytes:
+                        # Over the limit: skip to the end of the line
+                        self._pending, self._skipped = b'', len(data)
+                        continue
+                    self._pending = data
+                    if len(block) < self.block_bytes:
+                        # No complete line yet (a writer is mid-line); continue it on the next poll
+                        return
+                    # A line longer than a block: keep reading until it ends
+                    continue
+                self.offset += end
+                self._pending = data[end:]
+                yield read_jsonl(data[:end].decode('utf-8')), {'offsets': {self.key: self.offset}}
+    
+    def _skip_line(self, f):
+        """Read on through the over-long line at the offset; True once past its end (the rest becomes pending)."""
+        while block := f.read(self.block_bytes):
+            newline = block.find(b'\n')
+            if newline < 0:
+                self._skipped += len(block)
+                continue
+            length = self._skipped + newline + 1
+            logger.warning(f"[WARNING]  Skipped a {length}-byte line at offset {self.offset} of {self.path} "
+                           f"(over {self.max_line_bytes} bytes)")
+            self.offset += length
+            self._pending, self._skipped = block[newline + 1:], 0
+            return True
+        return False
+    
+    def committed(self, checkpoint):
+        pass
+
+async def read_source(source, frames, stop, poll_seconds, once):
+    """Put (arrival time, raw frame, checkpoint) on frames until stopped (or, with once, caught up)."""
+    while not stop.is_set():
+        # Blocking file reads run in a thread, one frame at a time, so the bounded
+        # queue limits how far reading gets ahead of loading
+        iterator = source.frames()
+        while (item := await asyncio.to_thread(next, iterator, None)) is not None:
+            await frames.put((time.time(), *item))
+            if stop.is_set():
+                break
+        if once:
+            break
+        try:
+            await asyncio.wait_for(stop.wait(), poll_seconds)
+        except asyncio.TimeoutError:
+            pass
+    await frames.put(None)
+
+async def form_batches(frames, batches, batch_rows, batch_seconds):
+    """Group frames into batches of at least batch_rows rows or batch_seconds of age; None ends."""
+    batch = None
+    while True:
+        timeout = None if batch is None else max(0.0, batch['first_arrival'] + batch_seconds - time.time())
+        try:
+            item = await asyncio.wait_for(frames.get(), timeout)
+        except asyncio.TimeoutError:
+            item = BATCH_DUE
+        
+        if item is not None and item is not BATCH_DUE:
+            arrived_at, df, checkpoint = item
+            if batch is None:
+                batch = {'frames': [], 'checkpoints': [], 'rows': 0, 'first_arrival': arrived_at}
+            batch['frames'].append(df)
+            batch['rows'] += len(df)
+            if checkpoint is not None:
+                batch['checkpoints'].append(checkpoint)
+            if batch['rows'] < batch_rows:
+                continue
+        
+        if batch is not None:
+            batch['closed_at'] = time.time()
+            await batches.put(batch)
+            batch = None
+        if item is None:
+            await batches.put(None)
+            return
+
+def process_batch(batch, number, context):
+    """Transform, load and score one batch, then record its checkpoints. Returns its metrics record."""
+    with measure('watch_batch', kind='batch', rows_in=batch['rows'], batch=number) as record:
+        started = time.time()
+        record['queue_seconds'] = round(started - batch['closed_at'], 6)
+        
+        df = pd.concat(batch['frames'], ignore_index=True) if batch['rows'] > 0 else None
+        stats = {'rows': 0, 'dates': set()}
+        if df is not None:
+            classified = context['classifier'].classified
+            # A fresh parser per batch infers the date format as a one-off transform of it would
+            df = transform_frame(df, parser=DateParser(), clock=context['clock'], classifier=context['classifier'])
+            if context['classifier'].classified > classified:
+                save_app_classes(context['classifier'])
+            record['transform_seconds'] = round(time.time() - started, 6)
+            if len(df) > 0:
+                stats = load_frames(df, engine=context['engine'])
+                if context['profile'] is not None:
+                    context['profile'].update(df)
+        record['load_seconds'] = round(time.time() - started - record.get('transform_seconds', 0), 6)
+        
+        # Only the dates this batch wrote: their MDI, then the anomaly scores of changed days
+        if stats['dates']:
+            scored = time.time()
+            compute_mdi(dates=stats['dates'], engine=context['engine'])
+            detect_anomalies(engine=context['engine'])
+            refresh_mdi_summary(engine=context['engine'])
+            record['score_seconds'] = round(time.time() - scored, 6)
+        
+        state = context['state']
+        for checkpoint in batch['checkpoints']:
+            state['files'].update(checkpoint.get('files', {}))
+            state['offsets'].update(checkpoint.get('offsets', {}))
+            context['source'].committed(checkpoint)
+        if batch['checkpoints']:
+            save_state(state, context['state_path'])
+        
+        record['rows_out'] = stats['rows']
+        record['dates'] = len(stats['dates'])
+        record['latency_seconds'] = round(time.time() - batch['first_arrival'], 6)
+    return record
+
+async def process_batches(batches, context, records):
+    number = 0
+    while (batch := await batches.get()) is not None:
+        number += 1
+        # In a thread, so reading and batching continue while the batch loads
+        record = await asyncio.to_thread(process_batch, batch, number, context)
+        records.append(record)
+        logger.info(f"[SUCCESS] Batch {number}: {record['rows_out']} of {record['rows_in']} rows loaded, "
+                    f"{record['dates']} dates scored, latency {record['latency_seconds']:.2f}s "
+                    f"(queued {record['queue_seconds']:.2f}s)")
+
+async def watch(directory=WATCH_DIRECTORY, stream=None, batch_rows=WATCH_BATCH_ROWS,
+                batch_seconds=WATCH_BATCH_SECONDS, poll_seconds=WATCH_POLL_SECONDS, queue_frames=WATCH_QUEUE_FRAMES,
+                once=False, engine=None, state_path=WATCH_STATE, stop=None):
+    """
+    Load sessions from a landing directory (or a JSONL stream) in micro-batches until stopped.
+    
+    once=True returns when everything present has been loaded. stop (an
+    asyncio.Event) ends the watch after the batches in flight; SIGINT
+    and SIGTERM set it where the platform allows. Returns the per-batch
+    metrics records.
+    """
+    owns_engine = engine is None
+    if owns_engine:
+        engine = create_engine(DATABASE_URL, pool_size=2, max_overflow=2, pool_pre_ping=True)
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError, ValueError):  # Windows, or not the main thread
+            pass
+    
+    state = load_state(state_path)
+    if stream is not None:
+        source = StreamSource(stream, state)
+    else:
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        # A single pass takes every file as it is; a long-running watch waits for files to settle
+        source = DirectorySource(directory, state, chunk_rows=batch_rows, settle_seconds=0 if once else poll_seconds)
+    context = {
+        'engine': engine, 'state': state, 'state_path': state_path, 'source': source,
+        'clock': LocalClock.from_config(), 'classifier': AppClassifier.load(FEED_APP_CACHE),
+        'profile': SessionProfile() if data_profile() else None,
+    }
+    frames = asyncio.Queue(maxsize=queue_frames)
+    batches = asyncio.Queue(maxsize=1)
+    records = []
+    
+    try:
+        run_id = start_run()
+        logger.info(f"Watching {source} (batches of {batch_rows} rows or {batch_seconds:g}s, run {run_id})")
+        await asyncio.gather(
+            read_source(source, frames, stop, poll_seconds, once),
+            form_batches(frames, batches, batch_rows, batch_seconds),
+            process_batches(batches, context, records),
+        )
+        if records:
+            latencies = np.array([record['latency_seconds'] for record in records])
+            logger.info(f"[SUCCESS] Watch stopped after {len(records)} batches, "
+                        f"{sum(record['rows_out'] for record in records)} rows loaded; latency "
+                        f"p50 {np.percentile(latencies, 50):.2f}s, p95 {np.percentile(latencies, 95):.2f}s, "
+                        f"max {latencies.max():.2f}s")
+            if context['profile'] is not None and context['profile'].rows > 0:
+                record_profile(context['profile'], run_id)
+        else:
+            logger.info("[SUCCESS] Watch stopped; nothing new to load")
+        return records
+    
+    except Exception as e:
+        logger.error(f"[ERROR] Watch failed: {e}", exc_info=True)
+        raise
+    
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.remove_signal_handler(sig)
+            except (NotImplementedError, RuntimeError, ValueError):
+                pass
+        if owns_engine:
+            engine.dispose()
@@ -15,6 +15,20 @@ docker rm doomscroll-postgres 2>$null
 
 Write-Host "✅ Container removed" -ForegroundColor Green
 Write-Host ""
+Write-Host "🧹 Clearing ingest state..." -ForegroundColor Yellow
+
+# Records of what was loaded into the old database; without them nothing would be re-ingested
+$ingestState = @(
+  "data\processed\ingest_manifest.json",
+  "data\processed\ingest_keys.npy",
+  "data\processed\ingest_runs",
+  "data\processed\ingest_parts",
+  "data\processed\watch_state.json"
+)
+$ingestState | Where-Object { Test-Path $_ } | Remove-Item -Recurse -Force
+
+Write-Host "✅ Ingest manifest, dedup keys, pending runs and watch offsets removed" -ForegroundColor Green
+Write-Host ""
 Write-Host "🔄 Reinitializing database..." -ForegroundColor Cyan
 
 & .\scripts\setup_db.ps1
@@ -8,49 +8,14 @@ Write-Host ""
 # Activate virtual environment
 & ".\venv\Scripts\Activate.ps1"
 
-# Step 1: Extract & Transform
-Write-Host "📥 Step 1/4: Extracting and transforming data..." -ForegroundColor Yellow
-python -m etl.etl_pipeline
+# All stages run in one process (transform -> load -> MDI -> anomalies),
+# skipping those whose inputs haven't changed since the last run
+Write-Host "📥 Running pipeline stages..." -ForegroundColor Yellow
+python -m etl run
 if ($LASTEXITCODE -eq 0) {
-  Write-Host "✅ ETL transformation complete" -ForegroundColor Green
+  Write-Host "✅ Pipeline stages complete" -ForegroundColor Green
 } else {
-  Write-Host "❌ ETL transformation failed" -ForegroundColor Red
-  exit 1
-}
-
-Write-Host ""
-
-# Step 2: Load
-Write-Host "📤 Step 2/4: Loading data into PostgreSQL..." -ForegroundColor Yellow
-python -m etl.load_to_db
-if ($LASTEXITCODE -eq 0) {
-  Write-Host "✅ Data load complete" -ForegroundColor Green
-} else {
-  Write-Host "❌ Data load failed" -ForegroundColor Red
-  exit 1
-}
-
-Write-Host ""
-
-# Step 3: Compute MDI
-Write-Host "📊 Step 3/4: Computing MDI metrics..." -ForegroundColor Yellow
-python -m etl.calculate_mdi
-if ($LASTEXITCODE -eq 0) {
-  Write-Host "✅ MDI computation complete" -ForegroundColor Green
-} else {
-  Write-Host "❌ MDI computation failed" -ForegroundColor Red
-  exit 1
-}
-
-Write-Host ""
-
-# Step 4: Detect Anomalies
-Write-Host "🚨 Step 4/4: Detecting anomalies..." -ForegroundColor Yellow
-python -m etl.detect_anomalies
-if ($LASTEXITCODE -eq 0) {
-  Write-Host "✅ Anomaly detection complete" -ForegroundColor Green
-} else {
-  Write-Host "❌ Anomaly detection failed" -ForegroundColor Red
+  Write-Host "❌ Pipeline failed" -ForegroundColor Red
   exit 1
 }
 
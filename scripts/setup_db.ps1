@@ -18,8 +18,11 @@ Start-Sleep -Seconds 5
 Write-Host ""
 Write-Host "🗄️  Initializing schema..." -ForegroundColor Cyan
 
-$schema = Get-Content -Path "sql/01_schema.sql" -Raw
-$schema | docker exec -i doomscroll-postgres psql -U doomscroll_user -d doomscroll_db
+# Schema versions apply in order (python -m etl migrate does the same and records them)
+Get-ChildItem -Path "sql" -Filter "[0-9][0-9]_*.sql" | Sort-Object Name | ForEach-Object {
+  Write-Host "   Applying $($_.Name)" -ForegroundColor White
+  Get-Content -Path $_.FullName -Raw | docker exec -i doomscroll-postgres psql -U doomscroll_user -d doomscroll_db
+}
 
 Write-Host "✅ Schema initialized" -ForegroundColor Green
 Write-Host ""
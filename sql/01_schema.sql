@@ -58,9 +58,70 @@ CREATE TABLE IF NOT EXISTS anomaly_log (
 );
 
 -- Indexes on anomaly_log table
-CREATE INDEX IF NOT EXISTS idx_anomaly_log_date ON anomaly_log(date_of_anomaly);
+-- One row per anomalous day so detector re-runs upsert instead of duplicating.
+-- Upgrading databases: collapse rows logged twice by earlier runs, keeping the latest.
+-- (Skipped once schema version 05 keys the log by series as well as date.)
+DO $$
+BEGIN
+    IF to_regclass('uq_anomaly_log_series_date') IS NOT NULL THEN
+        RETURN;
+    END IF;
+
+    DELETE FROM anomaly_log a
+    USING anomaly_log b
+    WHERE a.date_of_anomaly = b.date_of_anomaly
+      AND a.anomaly_id < b.anomaly_id;
+    DROP INDEX IF EXISTS idx_anomaly_log_date;
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_anomaly_log_date ON anomaly_log(date_of_anomaly);
+END;
+$$;
 CREATE INDEX IF NOT EXISTS idx_anomaly_log_severity ON anomaly_log(severity);
 
+-- Table 4: ETL watermarks (last processed rollup updated_at per stage)
+CREATE TABLE IF NOT EXISTS etl_watermarks (
+    stage VARCHAR(50) PRIMARY KEY,
+    watermark TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Table 5: Per-user daily MDI metrics
+CREATE TABLE IF NOT EXISTS mdi_user_daily (
+    user_id INTEGER NOT NULL,
+    date_recorded DATE NOT NULL,
+    weekday VARCHAR(10) NOT NULL,
+    feed_time_minutes NUMERIC(10, 2) DEFAULT 0,
+    total_midnight_time_minutes NUMERIC(10, 2) DEFAULT 0,
+    avg_feed_session_minutes NUMERIC(10, 2) DEFAULT 0,
+    mdi_score NUMERIC(10, 4) DEFAULT 0,
+    z_score NUMERIC(10, 4),
+    num_midnight_sessions INTEGER DEFAULT 0,
+    num_feed_midnight_sessions INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, date_recorded)
+);
+
+-- Indexes on mdi_user_daily table
+CREATE INDEX IF NOT EXISTS idx_mdi_user_daily_date ON mdi_user_daily(date_recorded);
+
+-- Table 6: Hourly pre-aggregate of sessions, maintained by load_to_db
+CREATE TABLE IF NOT EXISTS sessions_hourly_rollup (
+    session_date DATE NOT NULL,
+    session_hour SMALLINT NOT NULL CHECK (session_hour >= 0 AND session_hour < 24),
+    user_id INTEGER NOT NULL,
+    is_feed_app BOOLEAN NOT NULL,
+    is_midnight BOOLEAN NOT NULL,
+    session_count BIGINT NOT NULL DEFAULT 0,
+    duration_sum NUMERIC(16, 2) NOT NULL DEFAULT 0,
+    duration_sum_sq NUMERIC(22, 4) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (session_date, session_hour, user_id, is_feed_app)
+);
+
+-- Indexes on sessions_hourly_rollup table
+CREATE INDEX IF NOT EXISTS idx_rollup_user_id ON sessions_hourly_rollup(user_id);
+CREATE INDEX IF NOT EXISTS idx_rollup_updated_at ON sessions_hourly_rollup(updated_at);
+
 -- Summary view for Tableau
 CREATE OR REPLACE VIEW v_mdi_summary AS
 SELECT
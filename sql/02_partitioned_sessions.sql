@@ -0,0 +1,97 @@
+-- Schema version 2: monthly range-partitioned sessions and a materialized MDI summary
+-- Applied after 01_schema.sql by `python -m etl migrate`; safe to re-run.
+-- Upgrading a populated database copies every session once, so run it in a quiet window.
+
+-- Create the sessions partition for the month holding month_start (no-op if it exists).
+-- load_to_db calls this for each month in a load before copying the rows.
+CREATE OR REPLACE FUNCTION create_sessions_partition(month_start DATE)
+RETURNS TEXT AS $$
+DECLARE
+    first_day DATE := date_trunc('month', month_start)::DATE;
+    partition_name TEXT := 'sessions_' || to_char(first_day, '"y"YYYY"m"MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF sessions FOR VALUES FROM (%L) TO (%L)',
+        partition_name, first_day, (first_day + INTERVAL '1 month')::DATE
+    );
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Table 1 (version 2): sessions partitioned by session_date, one partition per month.
+-- Upgrading databases: move the version 1 heap aside, copy it into the partitions
+-- covering its dates, and keep session ids (the sequence widens to BIGINT).
+DO $$
+DECLARE
+    month_start DATE;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('sessions')) = 'p' THEN
+        RETURN;
+    END IF;
+
+    DROP INDEX IF EXISTS idx_sessions_date, idx_sessions_user_id, idx_sessions_is_feed_midnight, idx_sessions_hour;
+    ALTER TABLE sessions RENAME TO sessions_unpartitioned;
+    ALTER INDEX IF EXISTS sessions_pkey RENAME TO sessions_unpartitioned_pkey;
+    ALTER SEQUENCE sessions_session_id_seq AS BIGINT;
+
+    CREATE TABLE sessions (
+        session_id BIGINT NOT NULL DEFAULT nextval('sessions_session_id_seq'),
+        user_id INTEGER NOT NULL,
+        app_name VARCHAR(100) NOT NULL,
+        session_date DATE NOT NULL,
+        session_hour INTEGER NOT NULL CHECK (session_hour >= 0 AND session_hour < 24),
+        session_weekday VARCHAR(10) NOT NULL,
+        duration_minutes NUMERIC(10, 2) NOT NULL CHECK (duration_minutes > 0),
+        app_category VARCHAR(50),
+        is_feed_app BOOLEAN DEFAULT FALSE,
+        is_midnight BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (session_id, session_date)
+    ) PARTITION BY RANGE (session_date);
+    ALTER SEQUENCE sessions_session_id_seq OWNED BY sessions.session_id;
+
+    FOR month_start IN
+        SELECT generate_series(date_trunc('month', first_date), last_date, INTERVAL '1 month')::DATE
+        FROM (SELECT MIN(session_date) AS first_date, MAX(session_date) AS last_date FROM sessions_unpartitioned) bounds
+    LOOP
+        PERFORM create_sessions_partition(month_start);
+    END LOOP;
+
+    INSERT INTO sessions SELECT * FROM sessions_unpartitioned;
+    DROP TABLE sessions_unpartitioned;
+END;
+$$;
+
+-- Indexes on sessions table (partitioned: created on every current and future partition)
+CREATE INDEX IF NOT EXISTS idx_sessions_date ON sessions(session_date);
+CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_is_feed_midnight ON sessions(is_feed_app, is_midnight);
+CREATE INDEX IF NOT EXISTS idx_sessions_hour ON sessions(session_hour);
+
+-- Materialized summary for Tableau/Metabase, refreshed CONCURRENTLY by the pipeline
+-- (the unique index is what lets the refresh run without blocking readers)
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_mdi_summary AS
+SELECT
+    date_recorded,
+    weekday,
+    mdi_score,
+    z_score,
+    feed_time_minutes,
+    total_midnight_time_minutes,
+    avg_feed_session_minutes,
+    num_feed_midnight_sessions,
+    CASE
+        WHEN ABS(z_score) > 2 THEN 'EXTREME'
+        WHEN ABS(z_score) > 1.5 THEN 'MODERATE'
+        WHEN ABS(z_score) > 1 THEN 'MILD'
+        ELSE 'NORMAL'
+    END AS anomaly_level
+FROM mdi_daily
+WITH DATA;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_mv_mdi_summary_date ON mv_mdi_summary(date_recorded);
+
+-- Existing dashboards keep querying v_mdi_summary, now an ordered read of the snapshot
+CREATE OR REPLACE VIEW v_mdi_summary AS
+SELECT * FROM mv_mdi_summary
+ORDER BY date_recorded DESC;
@@ -0,0 +1,53 @@
+-- Schema version 3: one session per natural key, and checkpoints for resumable loads
+-- Applied after 02_partitioned_sessions.sql by `python -m etl migrate`; safe to re-run.
+
+-- Batches load_to_db has committed, by content hash; a re-run skips these
+CREATE TABLE IF NOT EXISTS etl_load_checkpoints (
+    batch_hash CHAR(32) PRIMARY KEY,
+    rows_in INTEGER NOT NULL,
+    rows_written INTEGER NOT NULL,
+    loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Upgrading databases: remove sessions loaded more than once (keeping the first copy)
+-- and rebuild the hourly rollup from what remains, so MDI recomputes every date
+DO $$
+DECLARE
+    removed BIGINT;
+BEGIN
+    IF to_regclass('uq_sessions_natural_key') IS NOT NULL THEN
+        RETURN;
+    END IF;
+
+    DELETE FROM sessions
+    WHERE (session_id, session_date) IN (
+        SELECT session_id, session_date
+        FROM (
+            SELECT session_id, session_date, ROW_NUMBER() OVER (
+                PARTITION BY user_id, app_name, session_date, session_hour ORDER BY session_id
+            ) AS copy_number
+            FROM sessions
+        ) copies
+        WHERE copy_number > 1
+    );
+    GET DIAGNOSTICS removed = ROW_COUNT;
+
+    IF removed > 0 THEN
+        RAISE NOTICE 'Removed % duplicate sessions; rebuilding sessions_hourly_rollup', removed;
+        TRUNCATE sessions_hourly_rollup;
+        INSERT INTO sessions_hourly_rollup (
+            session_date, session_hour, user_id, is_feed_app, is_midnight,
+            session_count, duration_sum, duration_sum_sq
+        )
+        SELECT
+            session_date, session_hour, user_id, is_feed_app,
+            BOOL_OR(is_midnight), COUNT(*), SUM(duration_minutes), SUM(duration_minutes * duration_minutes)
+        FROM sessions
+        GROUP BY session_date, session_hour, user_id, is_feed_app;
+    END IF;
+END;
+$$;
+
+-- Natural key of a session (includes session_date, so it also holds per partition)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_sessions_natural_key
+    ON sessions(user_id, app_name, session_date, session_hour);
@@ -0,0 +1,28 @@
+-- Schema version 4: incremental anomaly scoring against a recorded baseline
+-- Applied after 03_idempotent_loads.sql by `python -m etl migrate`; safe to re-run.
+
+-- Running statistics of the anomaly baseline after the last scored day, one row per series.
+-- detect_anomalies resumes from here and scores only days whose MDI changed since watermark.
+CREATE TABLE IF NOT EXISTS anomaly_state (
+    series VARCHAR(50) PRIMARY KEY,
+    method VARCHAR(20) NOT NULL,
+    window_days INTEGER NOT NULL,
+    min_days INTEGER NOT NULL,
+    days INTEGER NOT NULL,
+    mean DOUBLE PRECISION NOT NULL,
+    m2 DOUBLE PRECISION NOT NULL,
+    last_date DATE,
+    watermark TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- The baseline each day was compared to: mean, standard deviation and number of earlier days
+ALTER TABLE mdi_daily
+    ADD COLUMN IF NOT EXISTS baseline_mean DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS baseline_std DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS baseline_days INTEGER;
+
+ALTER TABLE anomaly_log
+    ADD COLUMN IF NOT EXISTS baseline_mean DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS baseline_std DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS baseline_days INTEGER;
@@ -0,0 +1,16 @@
+-- Schema version 5: anomalies of many series (per user, per app, ...) in anomaly_log
+-- Applied after 04_incremental_anomalies.sql by `python -m etl migrate`; safe to re-run.
+
+-- Series a logged day belongs to: 'mdi_daily' for the daily MDI, or key=value pairs
+-- such as 'user_id=17' for the series scored by series_anomalies
+ALTER TABLE anomaly_log ADD COLUMN IF NOT EXISTS series_key VARCHAR(200) NOT NULL DEFAULT 'mdi_daily';
+
+-- One row per series and anomalous day (was one per day)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_anomaly_log_series_date ON anomaly_log(series_key, date_of_anomaly);
+DROP INDEX IF EXISTS uq_anomaly_log_date;
+
+-- The baseline each user-day was compared to (mean/std, or median/scaled MAD when robust)
+ALTER TABLE mdi_user_daily
+    ADD COLUMN IF NOT EXISTS baseline_mean DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS baseline_std DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS baseline_days INTEGER;
@@ -0,0 +1,35 @@
+-- Schema version 6: watermarks in commit order
+-- Applied after 05_series_anomalies.sql by `python -m etl migrate`; safe to re-run.
+
+-- Transaction that last wrote each row. updated_at is the writing transaction's start
+-- time, so a load that commits after a later-started one could fall behind a watermark
+-- already taken; transaction ids below a snapshot's xmin are all finished instead.
+ALTER TABLE sessions_hourly_rollup
+    ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+CREATE INDEX IF NOT EXISTS idx_rollup_change_xid ON sessions_hourly_rollup(change_xid);
+
+ALTER TABLE mdi_daily
+    ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+CREATE INDEX IF NOT EXISTS idx_mdi_daily_change_xid ON mdi_daily(change_xid);
+
+ALTER TABLE mdi_user_daily
+    ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+CREATE INDEX IF NOT EXISTS idx_mdi_user_daily_change_xid ON mdi_user_daily(change_xid);
+
+-- Watermarks become the xmin of the snapshot a stage read from. Upgrading databases:
+-- timestamp watermarks are dropped, so each stage recomputes every date once.
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'etl_watermarks'
+          AND column_name = 'watermark') <> 'xid8' THEN
+        DELETE FROM etl_watermarks;
+        ALTER TABLE etl_watermarks ALTER COLUMN watermark TYPE xid8 USING NULL;
+    END IF;
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'anomaly_state'
+          AND column_name = 'watermark') <> 'xid8' THEN
+        ALTER TABLE anomaly_state ALTER COLUMN watermark TYPE xid8 USING NULL;
+    END IF;
+END;
+$$;
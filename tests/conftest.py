@@ -0,0 +1,38 @@
+import uuid
+import logging
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from etl.schema import apply_migrations
+from etl.etl_pipeline import AppClassifier, DateParser, transform_frame
+from etl.testing import generate_chunks
+
+@pytest.fixture(scope='session')
+def pg_server(tmp_path_factory):
+    """Embedded PostgreSQL for the database tests (skipped without pgserver)."""
+    pgserver = pytest.importorskip('pgserver')
+    # Its exit handler logs after pytest has closed the captured streams
+    logging.getLogger('pgserver').setLevel(logging.WARNING)
+    server = pgserver.get_server(tmp_path_factory.mktemp('pg') / 'pgdata')
+    yield server
+    server.cleanup()
+
+@pytest.fixture
+def engine(pg_server):
+    """Engine on a fresh schema at the latest schema version, dropped afterwards."""
+    schema = f"test_{uuid.uuid4().hex[:8]}"
+    # search_path in the URL (not connect_args) so per-user MDI workers inherit it
+    engine = create_engine(make_url(pg_server.get_uri()).update_query_dict({'options': f'-csearch_path={schema}'}))
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    apply_migrations(engine)
+    yield engine
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+    engine.dispose()
+
+@pytest.fixture(scope='session')
+def sessions():
+    """Transformed synthetic sessions, as load_to_db receives them."""
+    raw = next(generate_chunks(20_000, seed=7, users=200))
+    return transform_frame(raw, parser=DateParser(), classifier=AppClassifier())
@@ -0,0 +1,61 @@
+import json
+import pandas as pd
+import pytest
+from etl.etl_pipeline import AppClassifier, feed_app_rules, flag_feed_apps
+
+@pytest.mark.parametrize('name, is_feed', [
+    ('TikTok', True),
+    ('  tiktok ', True),
+    ('IG', True),
+    ('Twitter / X', True),
+    ('Instagram Lite', True),
+    ('YouTube Shorts (beta)', True),
+    ('YouTube Kids', False),
+    ('YouTube Music', False),
+    ('Facebook Messenger', False),
+    ('Chrome', False),
+])
+def test_classify(name, is_feed):
+    assert AppClassifier().classify(name) is is_feed
+
+def test_flags_are_broadcast_by_category_code():
+    names = ['IG', 'Chrome', 'YouTube Kids', 'TikTok', None, 'Chrome', 'IG']
+    classifier = AppClassifier()
+    df = flag_feed_apps(pd.DataFrame({'app_name': names}), classifier=classifier)
+    
+    assert df['app_name'].dtype == 'category'
+    # A missing name is not a feed app
+    assert df['is_feed_app'].tolist() == [True, False, False, True, False, False, True]
+    # Each distinct name is classified once
+    assert classifier.classified == 4
+    flag_feed_apps(pd.DataFrame({'app_name': ['TikTok', 'Maps']}), classifier=classifier)
+    assert classifier.classified == 5
+
+def test_cached_flags_are_dropped_when_rules_change(tmp_path):
+    cache = tmp_path / 'feed_app_cache.json'
+    classifier = AppClassifier()
+    classifier.flags(['Chrome', 'TikTok'])
+    classifier.save(cache)
+    
+    assert len(AppClassifier.load(cache)) == 2
+    rules = feed_app_rules()
+    rules['feed_apps'].append('chrome')
+    reloaded = AppClassifier.load(cache, rules=rules)
+    assert len(reloaded) == 0
+    assert reloaded.flags(['Chrome']).tolist() == [True]
+
+def test_rules_file_extends_the_configured_rules(tmp_path):
+    rules_file = tmp_path / 'feed_rules.json'
+    rules_file.write_text(json.dumps({
+        'feed_apps': ['  Lemon8 '],
+        'aliases': {'TT': 'TikTok'},
+        'non_feed_patterns': [r'^instagram edits\b'],
+    }))
+    classifier = AppClassifier(feed_app_rules(rules_file))
+    
+    assert classifier.flags(['Lemon8', 'tt', 'Instagram Edits', 'Instagram Lite']).tolist() == [True, True, False, True]
+    assert classifier.fingerprint != AppClassifier().fingerprint
+    
+    rules_file.write_text(json.dumps({'feed_app': ['Lemon8']}))
+    with pytest.raises(ValueError, match='feed_app'):
+        feed_app_rules(rules_file)
@@ -0,0 +1,27 @@
+import pandas as pd
+from sqlalchemy import text
+from etl.calculate_mdi import MDI_COLUMNS, compute_mdi
+from etl.load_to_db import load_frames
+
+def mdi_daily(engine):
+    with engine.connect() as conn:
+        df = pd.read_sql(text(f"SELECT {', '.join(MDI_COLUMNS)} FROM mdi_daily ORDER BY date_recorded"), conn)
+    return df.astype({'mdi_score': float})
+
+def test_incremental_run_recomputes_only_dirty_dates(engine, sessions):
+    dates = sorted(sessions['session_date'].unique())
+    # The second batch adds sessions to a date the first batch already loaded
+    late = (sessions['session_date'] == dates[1]) & (sessions['session_hour'] >= 12)
+    load_frames(sessions[~late], engine=engine)
+    first = compute_mdi(engine=engine)
+    assert len(first) == len(dates)
+    
+    load_frames(sessions[late], engine=engine)
+    second = compute_mdi(engine=engine)
+    assert pd.to_datetime(second['date_recorded']).tolist() == [dates[1]]
+    # Nothing loaded since: nothing to recompute
+    assert compute_mdi(engine=engine).empty
+    
+    incremental = mdi_daily(engine)
+    compute_mdi(full_rebuild=True, engine=engine)
+    pd.testing.assert_frame_equal(incremental, mdi_daily(engine))
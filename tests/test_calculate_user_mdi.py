@@ -0,0 +1,43 @@
+import numpy as np
+from sqlalchemy import text
+from etl.calculate_user_mdi import compute_user_mdi, user_ranges
+from etl.load_to_db import load_frames
+from etl.testing import check_against_reference
+
+def skewed(sessions):
+    """Most sessions from one user, the rest from a handful of far-apart ids."""
+    user_ids = np.where(np.arange(len(sessions)) % 10 < 8, 5, sessions['user_id'] % 4 * 1_000_000 - 2_000_000)
+    return sessions.assign(user_id=user_ids.astype('int32')).drop_duplicates(
+        ['user_id', 'app_name', 'session_date', 'session_hour'])
+
+def test_partitioned_user_mdi_matches_reference(engine, sessions):
+    load_frames(skewed(sessions), engine=engine)
+    with engine.connect() as conn:
+        ranges = user_ranges(conn, 8)
+    stats = compute_user_mdi(workers=2, partitions=8, full_rebuild=True, engine=engine)
+    
+    # Repeated quantiles collapse into fewer ranges that still cover every id
+    assert 1 < len(ranges) < 8
+    assert ranges[0][0] is None and ranges[-1][1] is None
+    assert stats['partitions'] == len(ranges)
+    mismatches, reference_rows = check_against_reference(engine)
+    assert mismatches == 0 and stats['rows'] == reference_rows
+
+def test_more_partitions_than_users(engine, sessions):
+    load_frames(sessions.assign(user_id=np.int32(42)).drop_duplicates(
+        ['user_id', 'app_name', 'session_date', 'session_hour']), engine=engine)
+    stats = compute_user_mdi(workers=2, partitions=16, full_rebuild=True, engine=engine)
+    
+    assert stats['partitions'] == 1
+    assert check_against_reference(engine)[0] == 0
+
+def test_user_mdi_upsert_records_its_transaction(engine, sessions):
+    load_frames(sessions, engine=engine)
+    compute_user_mdi(workers=1, partitions=2, full_rebuild=True, engine=engine)
+    with engine.begin() as conn:
+        before = conn.execute(text("SELECT pg_current_xact_id()")).scalar()
+    compute_user_mdi(workers=1, partitions=2, full_rebuild=True, engine=engine)
+    
+    with engine.connect() as conn:
+        stale = conn.execute(text("SELECT COUNT(*) FROM mdi_user_daily WHERE change_xid <= :xid"), {'xid': before}).scalar()
+    assert stale == 0
@@ -0,0 +1,51 @@
+import pandas as pd
+import pyarrow.parquet as pq
+from sqlalchemy import text
+from etl.columnar import iter_sessions, read_sessions, write_sessions
+from etl.etl_pipeline import AppClassifier, transform_pipeline_chunked
+from etl.load_to_db import load_frames
+from etl.testing import write_csv
+
+def chunks(df, size):
+    return [df.iloc[i:i + size] for i in range(0, len(df), size)]
+
+def test_round_trip_keeps_values_and_dtypes(sessions, tmp_path):
+    path = tmp_path / 'sessions.parquet'
+    assert write_sessions(chunks(sessions, 6_000), path) == len(sessions)
+    df = read_sessions(path)
+    
+    pd.testing.assert_frame_equal(df, sessions.reset_index(drop=True), check_categorical=False)
+    assert df['app_name'].dtype == 'category' and df['session_weekday'].dtype == 'category'
+    assert df['session_hour'].dtype == 'int8' and df['user_id'].dtype == 'int32'
+    assert df['session_date'].dtype == 'datetime64[ns]'
+    
+    subset = read_sessions(path, columns=['user_id', 'session_date'])
+    assert list(subset.columns) == ['user_id', 'session_date']
+
+def test_each_chunk_is_a_row_group(sessions, tmp_path):
+    path = tmp_path / 'sessions.parquet'
+    written = chunks(sessions, 6_000)
+    write_sessions(written + [sessions.iloc[:0]], path)
+    
+    # Empty chunks are skipped
+    assert pq.ParquetFile(path).num_row_groups == len(written)
+    batches = list(iter_sessions(path, batch_size=4_000))
+    assert max(len(batch) for batch in batches) <= 4_000
+    pd.testing.assert_frame_equal(pd.concat(batches, ignore_index=True), read_sessions(path))
+
+def test_transform_to_parquet_to_load(engine, tmp_path):
+    csv_path, path = tmp_path / 'export.csv', tmp_path / 'cleaned_sessions.parquet'
+    write_csv(csv_path, 20_000, seed=4, users=100, dirty_share=0.01)
+    rows = write_sessions(transform_pipeline_chunked(csv_path, 6_000, classifier=AppClassifier()), path)
+    stats = load_frames(iter_sessions(path, batch_size=5_000), engine=engine)
+    
+    expected = read_sessions(path)
+    with engine.connect() as conn:
+        stored = conn.execute(text("""
+            SELECT COUNT(*), SUM(duration_minutes), COUNT(*) FILTER (WHERE is_feed_app), MIN(session_date)
+            FROM sessions
+        """)).one()
+    assert stats['rows'] == rows == stored[0]
+    assert float(stored[1]) == round(expected['duration_minutes'].sum(), 2)
+    assert stored[2] == expected['is_feed_app'].sum()
+    assert stored[3] == expected['session_date'].min().date()
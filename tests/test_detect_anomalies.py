@@ -0,0 +1,30 @@
+import numpy as np
+from sqlalchemy import text
+from etl.detect_anomalies import detect_anomalies
+from etl.testing import make_days, upsert_days, snapshot
+
+def test_incremental_scoring_matches_full_replay(engine):
+    df = make_days(120, seed=3)
+    upsert_days(engine, df.iloc[:100])
+    detect_anomalies(engine=engine, method='rolling', window_days=14)
+    # New days one run at a time, then a late change to a day already scored
+    for i in range(100, 120):
+        upsert_days(engine, df.iloc[i:i + 1])
+        detect_anomalies(engine=engine, method='rolling', window_days=14)
+    upsert_days(engine, df.iloc[[50]].assign(mdi_score=lambda d: d['mdi_score'] * 2))
+    detect_anomalies(engine=engine, method='rolling', window_days=14)
+    scores, logged = snapshot(engine)
+    
+    detect_anomalies(engine=engine, method='rolling', window_days=14, full_rebuild=True)
+    replayed_scores, replayed_logged = snapshot(engine)
+    assert np.isclose(scores, replayed_scores, rtol=0, atol=1e-9, equal_nan=True).all()
+    assert logged.equals(replayed_logged)
+    assert len(logged) > 0
+
+def test_unchanged_days_are_not_rescored(engine):
+    upsert_days(engine, make_days(60, seed=4))
+    detect_anomalies(engine=engine, method='expanding')
+    
+    assert detect_anomalies(engine=engine, method='expanding') is None
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM anomaly_state")).scalar() == 1
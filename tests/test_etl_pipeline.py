@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import pytest
+from etl.etl_pipeline import (
+    AppClassifier, DateParser, SeenKeys, USER_ID_MIN, USER_ID_MAX, clean_data, parse_and_validate_timestamps,
+    transform_pipeline, transform_pipeline_chunked
+)
+from etl.testing import write_csv, generate_chunks, mixed_dates
+
+def raw_sessions(user_ids):
+    return pd.DataFrame({
+        'user_id': user_ids,
+        'app_name': 'TikTok',
+        'date_only': pd.Timestamp('2024-01-01'),
+        'hour': np.arange(len(user_ids), dtype='int8'),
+        'screen_time_min': 5.0,
+    })
+
+def test_clean_data_rejects_user_ids_outside_int32():
+    df = clean_data(raw_sessions(['7', '3000000000', 'abc', '12.5', '-2147483648', '2147483648']))
+    
+    assert df['user_id'].dtype == 'int32'
+    assert df['user_id'].tolist() == [7, -2147483648]
+
+def test_clean_data_keeps_integer_user_ids():
+    df = clean_data(raw_sessions(np.array([1, 2, 2147483647], dtype='int64')))
+    
+    assert df['user_id'].tolist() == [1, 2, 2147483647]
+
+# Dirty rows make each step work on a filtered frame
+@pytest.mark.filterwarnings('error::pandas.errors.SettingWithCopyWarning')
+def test_chunked_transform_matches_in_memory(tmp_path):
+    path = tmp_path / 'export.csv'
+    # Few users, so duplicate keys span chunk boundaries; some rows unparseable
+    write_csv(path, 30_000, seed=3, users=50, timestamps=True, dirty_share=0.01)
+    whole = transform_pipeline(path, classifier=AppClassifier())
+    chunked = pd.concat(transform_pipeline_chunked(path, 7_000, classifier=AppClassifier()), ignore_index=True)
+    
+    pd.testing.assert_frame_equal(chunked, whole.reset_index(drop=True))
+
+# pandas warns when it falls back to per-element parsing
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_date_parser_rejects_the_rows_to_datetime_rejects():
+    columns = [
+        next(generate_chunks(20_000, seed=5, dirty_share=0.01))['date'],
+        next(generate_chunks(20_000, seed=5, timestamps=True, dirty_share=0.01))['date'],
+        mixed_dates(20_000, seed=5),
+    ]
+    for dates in columns:
+        expected = pd.to_datetime(dates, errors='coerce')
+        parser = DateParser()
+        chunked = pd.concat([parser.parse(dates.iloc[i:i + 3_000]) for i in range(0, len(dates), 3_000)])
+        
+        assert expected.isna().sum() > 0
+        pd.testing.assert_series_equal(DateParser().parse(dates), expected)
+        pd.testing.assert_series_equal(chunked, expected)
+
+def key_frame(n, seed, users=50, apps=('TikTok', 'Chrome', 'Maps', 'X')):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'user_id': rng.integers(-3, users, n).astype('int32'),
+        'app_name': pd.Categorical(rng.choice(apps, n)),
+        'date_only': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 30, n), unit='D'),
+        'hour': rng.integers(0, 24, n).astype('int8'),
+    })
+
+KEY_COLUMNS = ['user_id', 'app_name', 'date_only', 'hour']
+
+def test_seen_keys_match_drop_duplicates_across_chunks():
+    df = key_frame(50_000, seed=1)
+    seen_keys = SeenKeys()
+    kept = pd.concat([seen_keys.filter_new(df.iloc[i:i + 7_000], KEY_COLUMNS) for i in range(0, len(df), 7_000)])
+    
+    pd.testing.assert_frame_equal(kept, df.drop_duplicates(KEY_COLUMNS))
+    assert len(seen_keys) == len(kept)
+
+def test_seen_keys_are_exact():
+    # Keys one field apart, including the extreme user ids, are all distinct
+    df = pd.DataFrame({
+        'user_id': np.array([USER_ID_MIN, USER_ID_MAX, 0, 0, 0, 0], dtype='int32'),
+        'app_name': pd.Categorical(['A', 'A', 'A', 'B', 'A', 'A']),
+        'date_only': pd.to_datetime(['2024-01-01'] * 5 + ['2024-01-02']),
+        'hour': np.array([0, 0, 0, 0, 23, 0], dtype='int8'),
+    })
+    seen_keys = SeenKeys()
+    
+    assert len(seen_keys.filter_new(df, KEY_COLUMNS)) == 6
+    assert len(seen_keys.filter_new(df, KEY_COLUMNS)) == 0
+
+def test_seen_keys_memory_is_bounded_by_distinct_keys():
+    seen_keys = SeenKeys()
+    df = key_frame(100_000, seed=2, users=10_000)
+    distinct = len(seen_keys.filter_new(df, KEY_COLUMNS))
+    
+    # KEY_BYTES per distinct key, and nothing more for rows already seen
+    assert seen_keys.nbytes == SeenKeys.KEY_BYTES * distinct
+    seen_keys.filter_new(df, KEY_COLUMNS)
+    assert seen_keys.nbytes == SeenKeys.KEY_BYTES * distinct
+
+def test_seen_keys_round_trip_and_merge(tmp_path):
+    first, second = SeenKeys(), SeenKeys()
+    first.filter_new(key_frame(5_000, seed=3, apps=('TikTok', 'Chrome')), KEY_COLUMNS)
+    # Another run numbers its apps differently
+    second.filter_new(key_frame(5_000, seed=4, apps=('Maps', 'Chrome', 'TikTok')), KEY_COLUMNS)
+    first.save(tmp_path / 'keys.npy')
+    merged = SeenKeys.load(tmp_path / 'keys.npy')
+    merged.update(second)
+    
+    both = pd.concat([key_frame(5_000, seed=3, apps=('TikTok', 'Chrome')),
+                      key_frame(5_000, seed=4, apps=('Maps', 'Chrome', 'TikTok'))])
+    both['app_name'] = both['app_name'].astype('category')
+    assert len(merged) == len(both.drop_duplicates(KEY_COLUMNS))
+    assert len(merged.filter_new(both, KEY_COLUMNS)) == 0
+
+def test_exported_hours_outside_the_day_are_rejected():
+    df = pd.DataFrame({
+        'date': ['2024-01-01'] * 7,
+        'hour': ['0', '23', '24', '-1', '300', '7.5', 'x'],
+    })
+    df = parse_and_validate_timestamps(df)
+    
+    # 300 would wrap to 44 as int8
+    assert df['hour'].dtype == 'int8'
+    assert df['hour'].tolist() == [0, 23]
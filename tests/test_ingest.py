@@ -0,0 +1,47 @@
+import pytest
+from etl import ingest
+from etl.columnar import read_sessions
+from etl.testing import write_csv
+
+@pytest.fixture
+def ingest_state(tmp_path, monkeypatch):
+    """Raw directory and ingest state under tmp_path instead of data/."""
+    monkeypatch.setattr(ingest, 'INGEST_MANIFEST', tmp_path / 'ingest_manifest.json')
+    monkeypatch.setattr(ingest, 'INGEST_KEYS', tmp_path / 'ingest_keys.npy')
+    monkeypatch.setattr(ingest, 'PARTS_DIR', tmp_path / 'ingest_parts')
+    raw = tmp_path / 'raw'
+    write_csv(raw / 'a.csv', 2000, seed=1)
+    write_csv(raw / 'b.csv', 2000, seed=2)
+    return raw, tmp_path / 'ingest_runs'
+
+def test_run_is_recorded_only_when_committed(ingest_state):
+    raw, runs_dir = ingest_state
+    result = ingest.ingest_directory(raw, workers=2, runs_dir=runs_dir)
+    
+    assert result['ingested'] == 2
+    assert ingest.pending_runs(runs_dir) == [result['run_dir']]
+    assert len(read_sessions(result['run_dir'] / ingest.RUN_SESSIONS)) == result['rows']
+    # Nothing is recorded before the load, so a failed load is retried
+    assert not ingest.INGEST_MANIFEST.exists() and not ingest.INGEST_KEYS.exists()
+    
+    ingest.commit_run(result['run_dir'])
+    assert ingest.pending_runs(runs_dir) == []
+    assert sorted(ingest.load_manifest(ingest.INGEST_MANIFEST)) == sorted(str(p.resolve()) for p in raw.iterdir())
+    assert ingest.ingest_directory(raw, workers=2, runs_dir=runs_dir)['run_dir'] is None
+
+def test_pending_run_is_not_ingested_twice(ingest_state):
+    raw, runs_dir = ingest_state
+    first = ingest.ingest_directory(raw, workers=2, runs_dir=runs_dir)
+    write_csv(raw / 'c.csv', 2000, seed=3)
+    second = ingest.ingest_directory(raw, workers=2, runs_dir=runs_dir)
+    
+    # Each run keeps its own output; the second holds only the new file's sessions
+    assert second['ingested'] == 1
+    assert ingest.pending_runs(runs_dir) == [first['run_dir'], second['run_dir']]
+    assert len(read_sessions(first['run_dir'] / ingest.RUN_SESSIONS)) == first['rows']
+    assert len(read_sessions(second['run_dir'] / ingest.RUN_SESSIONS)) == second['rows']
+    
+    for run_dir in ingest.pending_runs(runs_dir):
+        ingest.commit_run(run_dir)
+    assert len(ingest.load_manifest(ingest.INGEST_MANIFEST)) == 3
+    assert ingest.ingest_directory(raw, workers=2, runs_dir=runs_dir)['run_dir'] is None
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+from etl.etl_pipeline import LocalClock, parse_and_validate_timestamps
+
+ZONES = ['America/New_York', 'Europe/Berlin', 'Asia/Kolkata', 'Australia/Lord_Howe']
+USER_TIMEZONES = {user_id: ZONES[user_id % len(ZONES)] for user_id in range(8)}
+# US and EU spring-forward and fall-back days, with a quiet day in between
+DAYS = ['2024-03-10', '2024-03-31', '2024-06-15', '2024-10-27', '2024-11-03']
+
+def sessions(seed=0):
+    """Every 10 minutes of DAYS, for mapped users 0-7 and unmapped users 8-9."""
+    timestamps = pd.DatetimeIndex(np.concatenate([
+        pd.date_range(day, periods=24 * 6, freq='10min').to_numpy() for day in DAYS
+    ]))
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'user_id': rng.integers(0, 10, len(timestamps)),
+        'date': pd.Series(timestamps).sample(frac=1, random_state=seed).to_numpy(),
+    })
+
+def reference(df, source_timezone='UTC', default_timezone=None):
+    """Each row converted on its own by pandas, as LocalClock documents."""
+    local = []
+    for user_id, timestamp in zip(df['user_id'], df['date']):
+        zone = USER_TIMEZONES.get(user_id, default_timezone)
+        if zone is None:
+            local.append(timestamp)
+            continue
+        instant = timestamp.tz_localize(source_timezone, ambiguous=False, nonexistent='shift_forward')
+        local.append(instant.tz_convert(zone).tz_localize(None))
+    return pd.Series(local, index=df.index, name='date', dtype='datetime64[ns]')
+
+@pytest.mark.parametrize('source_timezone', ['UTC', 'America/New_York', 'Europe/Berlin'])
+@pytest.mark.parametrize('default_timezone', [None, 'Asia/Kolkata'])
+def test_localize_matches_per_row_conversion(source_timezone, default_timezone):
+    df = sessions()
+    clock = LocalClock(USER_TIMEZONES, source_timezone, default_timezone)
+    
+    local = clock.localize(df['date'], df['user_id'])
+    pd.testing.assert_series_equal(local, reference(df, source_timezone, default_timezone))
+
+def test_offsets_are_reused_across_chunks():
+    df = sessions(seed=1)
+    clock = LocalClock(USER_TIMEZONES, 'Europe/Berlin', 'Asia/Kolkata')
+    chunked = pd.concat([clock.localize(chunk['date'], chunk['user_id']) for chunk in np.array_split(df, 7)])
+    
+    # The second pass reads every offset from the cache
+    pd.testing.assert_series_equal(chunked, reference(df, 'Europe/Berlin', 'Asia/Kolkata'))
+    pd.testing.assert_series_equal(clock.localize(df['date'], df['user_id']), chunked)
+
+def test_timestamps_with_an_offset_are_read_as_instants():
+    df = sessions(seed=2)
+    aware = df['date'].dt.tz_localize('UTC').dt.tz_convert('America/New_York')
+    # The source timezone does not apply to timestamps that carry their own
+    clock = LocalClock(USER_TIMEZONES, 'Europe/Berlin', 'Asia/Kolkata')
+    
+    pd.testing.assert_series_equal(clock.localize(aware, df['user_id']), reference(df, 'UTC', 'Asia/Kolkata'))
+
+def test_export_date_and_hour_columns_are_localized():
+    df = sessions(seed=3)
+    df = df[df['date'].dt.minute == 0].reset_index(drop=True)
+    export = pd.DataFrame({
+        'user_id': df['user_id'],
+        'date': df['date'].dt.strftime('%Y-%m-%d'),
+        'hour': df['date'].dt.hour,
+    })
+    clock = LocalClock(USER_TIMEZONES, 'America/New_York')
+    parsed = parse_and_validate_timestamps(export, clock=clock)
+    
+    expected = reference(df, 'America/New_York')
+    assert parsed['hour'].tolist() == expected.dt.hour.tolist()
+    assert parsed['date_only'].tolist() == expected.dt.normalize().tolist()
+    assert parsed['weekday'].cat.codes.tolist() == expected.dt.dayofweek.tolist()
+
+def test_unknown_timezones_are_rejected():
+    with pytest.raises(ValueError, match='Mars/Olympus'):
+        LocalClock({1: 'Mars/Olympus'})
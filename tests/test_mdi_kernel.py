@@ -0,0 +1,32 @@
+import pandas as pd
+from sqlalchemy import text
+from etl.calculate_mdi import AGGREGATION_QUERY, add_mdi_score
+from etl.calculate_user_mdi import USER_AGGREGATION_QUERY
+from etl.load_to_db import load_frames
+from etl.mdi_kernel import daily_mdi, user_daily_mdi, INPUT_COLUMNS
+from etl.testing import count_mismatches
+
+def test_kernel_matches_sql(engine, sessions):
+    load_frames(sessions, engine=engine)
+    with engine.connect() as conn:
+        stored = pd.read_sql(text(
+            f"SELECT user_id, app_name, session_date, session_weekday, {', '.join(INPUT_COLUMNS)} FROM sessions"
+        ), conn)
+        daily_sql = add_mdi_score(pd.read_sql(text(AGGREGATION_QUERY.format(where="")), conn))
+        user_sql = add_mdi_score(pd.read_sql(text(USER_AGGREGATION_QUERY.format(where="")), conn))
+    stored['session_date'] = pd.to_datetime(stored['session_date'])
+    
+    daily = daily_mdi(stored)
+    user = user_daily_mdi(stored)
+    assert len(daily) == len(daily_sql) > 0
+    assert len(user) == len(user_sql)
+    assert count_mismatches(daily, daily_sql, ['date_recorded']) == 0
+    assert count_mismatches(user, user_sql, ['user_id', 'date_recorded']) == 0
+
+def test_kernel_on_transformed_sessions_matches_stored(engine, sessions):
+    # The kernel on the transform output (dry run) agrees with SQL over what was loaded
+    load_frames(sessions, engine=engine)
+    with engine.connect() as conn:
+        daily_sql = add_mdi_score(pd.read_sql(text(AGGREGATION_QUERY.format(where="")), conn))
+    
+    assert count_mismatches(daily_mdi(sessions), daily_sql, ['date_recorded']) == 0
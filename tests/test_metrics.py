@@ -0,0 +1,69 @@
+import json
+import os
+import pstats
+import subprocess
+import sys
+import pandas as pd
+import pytest
+from etl import metrics
+from etl.config import PROJECT_ROOT
+
+@pytest.fixture
+def metrics_file(tmp_path, monkeypatch):
+    """Records go to a JSONL under tmp_path; settings are restored afterwards."""
+    path = tmp_path / 'metrics.jsonl'
+    monkeypatch.setitem(metrics._settings, 'metrics_file', path)
+    monkeypatch.setitem(metrics._settings, 'run_id', metrics._settings['run_id'])
+    monkeypatch.setitem(os.environ, 'ETL_RUN_ID', os.environ['ETL_RUN_ID'])
+    monkeypatch.setattr(metrics, 'PROFILE_DIR', tmp_path / 'profiles')
+    return path
+
+def records(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def test_run_id_comes_from_the_environment(tmp_path):
+    path = tmp_path / 'metrics.jsonl'
+    code = "from etl.metrics import measure\nwith measure('load', kind='task', rows_in=3): pass\n"
+    env = {**os.environ, 'ETL_RUN_ID': 'run-from-parent', 'ETL_METRICS_FILE': str(path)}
+    subprocess.run([sys.executable, '-c', code], cwd=PROJECT_ROOT, env=env, check=True, capture_output=True)
+    
+    [record] = records(path)
+    assert record['run_id'] == 'run-from-parent'
+    assert record['name'] == 'load' and record['status'] == 'ok' and record['rows_in'] == 3
+
+def test_nested_timings_are_recorded(metrics_file):
+    @metrics.instrument(kind='step')
+    def keep_even(df):
+        return df[df['n'] % 2 == 0]
+    
+    run_id = metrics.start_run()
+    assert os.environ['ETL_RUN_ID'] == run_id
+    with metrics.measure('transform', kind='stage') as record:
+        keep_even(pd.DataFrame({'n': range(10)}))
+        record['rows_out'] = 5
+    with pytest.raises(ValueError):
+        with metrics.measure('load', kind='stage'):
+            raise ValueError("no database")
+    
+    inner, outer, failed = records(metrics_file)
+    assert {r['run_id'] for r in (inner, outer, failed)} == {run_id}
+    # Inner blocks finish, and are written, first
+    assert (inner['name'], inner['parent'], inner['kind']) == ('keep_even', 'transform', 'step')
+    assert (inner['rows_in'], inner['rows_out']) == (10, 5)
+    assert outer['parent'] is None and outer['wall_seconds'] >= inner['wall_seconds']
+    assert failed['status'] == 'error' and 'no database' in failed['error']
+    assert 'profile' not in outer
+
+def test_profiling_captures_the_outermost_stage(metrics_file, monkeypatch):
+    monkeypatch.setitem(metrics._settings, 'profile', True)
+    assert metrics.verbose()
+    with metrics.measure('mdi', kind='stage'):
+        with metrics.measure('compute_mdi', kind='task'):
+            sum(range(100_000))
+    
+    task, stage = records(metrics_file)
+    # One profiler at a time: the task runs inside the stage's
+    assert 'profile' not in task
+    stats = pstats.Stats(stage['profile'])
+    assert any('builtins.sum' in function for _, _, function in stats.stats)
@@ -0,0 +1,29 @@
+import pytest
+from sqlalchemy import text
+from etl import pipeline
+from etl.detect_anomalies import detect_anomalies
+from etl.testing import make_days, upsert_days
+
+def test_unknown_stage_is_rejected():
+    with pytest.raises(ValueError, match="mdi_dialy"):
+        pipeline.run_pipeline(stages=['mdi_dialy'])
+
+def test_failure_before_first_stage_is_reported(monkeypatch):
+    def fail():
+        raise RuntimeError("no run id")
+    monkeypatch.setattr(pipeline, 'start_run', fail)
+    
+    with pytest.raises(RuntimeError, match="no run id"):
+        pipeline.run_pipeline(stages=['mdi'])
+
+def test_full_rebuild_of_anomalies_alone_rescores_every_day(engine, monkeypatch):
+    monkeypatch.setattr(pipeline, 'DATABASE_URL', engine.url.render_as_string(hide_password=False))
+    upsert_days(engine, make_days(60, seed=5))
+    detect_anomalies(engine=engine)
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE mdi_daily SET z_score = NULL"))
+    
+    pipeline.run_pipeline(stages=['anomalies'], full_rebuild=True)
+    with engine.connect() as conn:
+        scored = conn.execute(text("SELECT COUNT(z_score) FROM mdi_daily")).scalar()
+    assert scored > 0
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+from etl.profiling import HLL_PRECISION, HyperLogLog, SessionProfile, TDigest, merge_profiles
+
+def rank_error(values, q, estimate):
+    """How far the estimate's rank in values is from q."""
+    return abs(np.searchsorted(np.sort(values), estimate, side='right') / len(values) - q)
+
+@pytest.mark.parametrize('distinct', [1_000, 40_000, 400_000])
+def test_hyperloglog_error_is_within_three_standard_errors(distinct):
+    sketch = HyperLogLog()
+    values = np.random.default_rng(distinct).permutation(distinct)
+    for chunk in np.array_split(np.concatenate([values, values[:distinct // 2]]), 7):
+        sketch.add(chunk)
+    
+    standard_error = 1.04 / np.sqrt(1 << HLL_PRECISION)
+    assert abs(sketch.count() - distinct) / distinct < 3 * standard_error
+
+def test_hyperloglog_counts_categoricals_like_their_values():
+    names = [f"app {i}" for i in range(5_000)]
+    plain, categorical = HyperLogLog(), HyperLogLog()
+    plain.add(names)
+    categorical.add(pd.Categorical(names[::-1]))
+    
+    assert np.array_equal(plain.registers, categorical.registers)
+
+@pytest.mark.parametrize('rounded', [False, True])
+def test_tdigest_quantiles_are_within_tolerance(rounded):
+    values = np.random.default_rng(3).lognormal(3.0, 1.0, 200_000)
+    if rounded:
+        # Durations are minutes at 0.1: the distinct-value path
+        values = values.round(1)
+    digest = TDigest()
+    for chunk in np.array_split(values, 9):
+        digest.add(chunk)
+    
+    p50, p99 = digest.quantile([0.5, 0.99])
+    assert rank_error(values, 0.5, p50) < 0.005
+    assert rank_error(values, 0.99, p99) < 0.001
+    assert (digest.min, digest.max) == (values.min(), values.max())
+
+def sketches(seed):
+    rng = np.random.default_rng(seed)
+    users, durations = rng.integers(0, 30_000, 50_000), rng.gamma(2.0, 12.0, 50_000)
+    hll, digest = HyperLogLog(), TDigest()
+    hll.add(users)
+    digest.add(durations)
+    return hll, digest, durations
+
+def test_merge_is_associative():
+    (hll_a, digest_a, a), (hll_b, digest_b, b), (hll_c, digest_c, c) = [sketches(seed) for seed in range(3)]
+    values = np.concatenate([a, b, c])
+    left_hll = HyperLogLog().merge(hll_a).merge(hll_b).merge(hll_c)
+    right_hll = HyperLogLog().merge(hll_a).merge(HyperLogLog().merge(hll_b).merge(hll_c))
+    left = TDigest().merge(digest_a).merge(digest_b).merge(digest_c)
+    right = TDigest().merge(digest_a).merge(TDigest().merge(digest_b).merge(digest_c))
+    
+    # Register-wise max is exactly associative; digests agree within their error
+    assert np.array_equal(left_hll.registers, right_hll.registers)
+    assert left.count == right.count == len(values)
+    for q in [0.5, 0.9, 0.99]:
+        assert rank_error(values, q, left.quantile(q)) < 0.005
+        assert rank_error(values, q, right.quantile(q)) < 0.005
+
+def test_profiles_of_chunks_merge_into_the_whole(sessions):
+    whole = SessionProfile()
+    whole.update(sessions)
+    parts = []
+    for chunk in np.array_split(sessions, 5):
+        part = SessionProfile()
+        part.update(chunk)
+        parts.append(SessionProfile.from_dict(part.to_dict()))
+    merged = merge_profiles(parts).summary()
+    expected = whole.summary()
+    p50 = merged['duration_minutes']['p50']
+    
+    # Counters and registers merge exactly; only the quantiles are approximate
+    del merged['duration_minutes'], expected['duration_minutes']
+    assert merged == expected
+    assert rank_error(sessions['duration_minutes'].to_numpy(), 0.5, p50) < 0.01
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+import pandas as pd
+from etl.detect_anomalies import flag_anomalies
+from etl.series_anomalies import MAD_SCALE, score_series, series_keys
+
+def daily_series(scores, user_id=1):
+    dates = pd.date_range('2024-01-01', periods=len(scores), freq='D')
+    return pd.DataFrame({
+        'user_id': user_id,
+        'date_recorded': dates.date,
+        'weekday': dates.dayofweek,
+        'mdi_score': np.asarray(scores, dtype=float),
+    })
+
+def test_zero_inflated_series_is_scored():
+    scores = np.zeros(30)
+    scores[[5, 17]] = 2.0
+    scores[25] = 40.0
+    df_scored = score_series(daily_series(scores), ['user_id'], seasonality='none', robust=True, min_days=7)
+    
+    # The MAD of a mostly-zero series is 0; the mean absolute deviation stands in
+    assert df_scored['z_score'].notna().all()
+    assert (df_scored['baseline_std'] > 0).all()
+    flagged = flag_anomalies(df_scored, series_keys(df_scored, ['user_id']))
+    assert 40.0 in flagged['mdi_score'].tolist()
+
+def test_scored_day_is_left_out_of_its_baseline():
+    scores = [1.0, 2.0, 3.0, 4.0, 100.0]
+    df_scored = score_series(daily_series(scores), ['user_id'], seasonality='none', robust=False, min_days=3)
+    
+    assert df_scored['baseline_days'].tolist() == [4] * 5
+    assert df_scored['baseline_mean'].tolist() == pytest.approx([
+        np.mean([s for j, s in enumerate(scores) if j != i]) for i in range(5)
+    ])
+    spike = df_scored.iloc[4]
+    assert spike['baseline_std'] == pytest.approx(np.std(scores[:4], ddof=1))
+    assert spike['z_score'] == pytest.approx((100.0 - 2.5) / np.std(scores[:4], ddof=1))
+
+def test_robust_baseline_leaves_out_the_scored_day():
+    scores = [1.0, 2.0, 3.0, 4.0, 100.0]
+    df_scored = score_series(daily_series(scores), ['user_id'], seasonality='none', robust=True, min_days=3)
+    
+    spike = df_scored.iloc[4]
+    assert spike['baseline_mean'] == 2.5
+    # Deviations from the series median (3): 2, 1, 0, 1 for the other days
+    assert spike['baseline_std'] == pytest.approx(MAD_SCALE * 1.0)
+
+def test_series_are_scored_separately():
+    df = pd.concat([daily_series(np.arange(10.0), user_id=1), daily_series(np.full(10, 5.0), user_id=2)])
+    df_scored = score_series(df, ['user_id'], seasonality='none', robust=False, min_days=3)
+    
+    alone = score_series(daily_series(np.arange(10.0)), ['user_id'], seasonality='none', robust=False, min_days=3)
+    assert np.allclose(df_scored['z_score'][:10], alone['z_score'])
+    # A flat series has no spread and is not scored
+    assert df_scored['z_score'][10:].isna().all()
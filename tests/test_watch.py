@@ -0,0 +1,87 @@
+import io
+import json
+import pandas as pd
+import pytest
+from etl import watch
+from etl.watch import StreamSource
+
+def session(user_id, app_name='TikTok'):
+    return json.dumps({'user_id': user_id, 'app_name': app_name, 'date': '2024-01-01', 'hour': 1,
+                       'screen_time_min': 5}) + '\n'
+
+def read_users(source):
+    frames = [df for df, _ in source.frames()]
+    return pd.concat(frames)['user_id'].tolist() if frames else []
+
+def test_stream_reads_lines_longer_than_a_block(tmp_path):
+    path = tmp_path / 'sessions.jsonl'
+    path.write_text(session(1) + session(2, 'x' * 300) + session(3))
+    source = StreamSource(path, {'offsets': {}}, block_bytes=64)
+    
+    assert read_users(source) == [1, 2, 3]
+    assert source.offset == path.stat().st_size
+
+def test_stream_skips_lines_over_the_limit(tmp_path):
+    path = tmp_path / 'sessions.jsonl'
+    path.write_text(session(1) + session(2, 'x' * 5000) + session(3))
+    source = StreamSource(path, {'offsets': {}}, block_bytes=64, max_line_bytes=1000)
+    
+    assert read_users(source) == [1, 3]
+    assert source.offset == path.stat().st_size
+
+def test_stream_waits_for_a_partial_line(tmp_path):
+    path = tmp_path / 'sessions.jsonl'
+    path.write_text(session(1) + session(2)[:20])
+    source = StreamSource(path, {'offsets': {}}, block_bytes=64)
+    
+    assert read_users(source) == [1]
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(session(2)[20:])
+    assert read_users(source) == [2]
+    assert source.offset == path.stat().st_size
+
+@pytest.fixture
+def bytes_read(monkeypatch):
+    """Total bytes the stream source reads from files."""
+    total = [0]
+    
+    class CountingFile(io.FileIO):
+        def read(self, size=-1):
+            data = super().read(size)
+            total[0] += len(data)
+            return data
+    
+    monkeypatch.setattr(watch, 'open', lambda path, mode: CountingFile(path, 'r'), raising=False)
+    return total
+
+def append(path, text):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(text)
+
+def test_stream_keeps_a_partial_line_across_polls(tmp_path, bytes_read):
+    path = tmp_path / 'sessions.jsonl'
+    long_line = session(1, 'x' * 2000)
+    source = StreamSource(path, {'offsets': {}}, block_bytes=64)
+    for start in range(0, len(long_line) - 1, 100):
+        append(path, long_line[start:min(start + 100, len(long_line) - 1)])
+        assert read_users(source) == []
+    append(path, '\n' + session(2))
+    
+    assert read_users(source) == [1, 2]
+    assert source.offset == path.stat().st_size
+    # Each byte is read once, not again on every poll
+    assert bytes_read[0] == path.stat().st_size
+
+def test_stream_keeps_skipping_an_unfinished_long_line_across_polls(tmp_path, bytes_read):
+    path = tmp_path / 'sessions.jsonl'
+    source = StreamSource(path, {'offsets': {}}, block_bytes=64, max_line_bytes=1000)
+    append(path, session(1))
+    assert read_users(source) == [1]
+    for _ in range(10):
+        append(path, 'x' * 500)
+        assert read_users(source) == []
+    append(path, '\n' + session(2))
+    
+    assert read_users(source) == [2]
+    assert source.offset == path.stat().st_size
+    assert bytes_read[0] == path.stat().st_size